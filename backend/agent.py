@@ -0,0 +1,241 @@
+"""
+Scanner agent for NeonDeck
+
+Scans networks the API can't reach, from a host that can, and pushes the
+results to the API. Register the agent with its networks first
+(POST /api/agents, the response holds its token), then start it there:
+
+    AGENT_API_URL=http://neondeck:8000 AGENT_TOKEN=... python agent.py
+
+The agent claims units of the running agent scan that lie in its
+networks, scans each like a scan worker would (nmap, then the HTTP and
+banner probes and reverse DNS) and pushes the services in gzip-compressed
+batches. It needs the scanner package but no database.
+"""
+import os
+import gzip
+import asyncio
+import logging
+from typing import List, Tuple
+
+import httpx
+import orjson
+
+from scanner import NetworkScanner, HTTPProbe, ReverseResolver
+
+# Configure logging
+logging.basicConfig(
+    level=getattr(logging, os.getenv("LOG_LEVEL", "INFO")),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Services per pushed batch
+AGENT_BATCH_SIZE = int(os.getenv("AGENT_BATCH_SIZE", "500"))
+
+# Attempts of a push before the unit is given up
+PUSH_ATTEMPTS = 3
+
+
+class LeaseLost(Exception):
+    """The API gave the unit to another agent"""
+
+
+class ScanAgent:
+    """Claims units from the API, scans them and pushes their results"""
+
+    def __init__(
+        self,
+        api_url: str = None,
+        token: str = None,
+        poll_interval: float = None,
+        batch_size: int = None,
+        port_scanner=None,
+        lookup=None,
+        transport: httpx.AsyncBaseTransport = None
+    ):
+        """
+        Initialize a scanner agent
+
+        Args:
+            api_url: Base URL of the NeonDeck API (default: AGENT_API_URL or http://localhost:8000)
+            token: Bearer token of the agent (default: AGENT_TOKEN)
+            poll_interval: Seconds between claims when there is no work (default: AGENT_POLL or 30)
+            batch_size: Services per pushed batch (default: AGENT_BATCH_SIZE)
+            port_scanner: nmap.PortScanner compatible object (default: nmap)
+            lookup: Async ip -> hostname function (default: system resolver)
+            transport: httpx transport to the API (default: network)
+        """
+        self.api_url = (api_url or os.getenv("AGENT_API_URL", "http://localhost:8000")).rstrip("/")
+        self.token = token or os.getenv("AGENT_TOKEN")
+        if not self.token:
+            raise ValueError("An agent token is required (AGENT_TOKEN)")
+        self.poll_interval = poll_interval or float(os.getenv("AGENT_POLL", "30"))
+        self.batch_size = batch_size or AGENT_BATCH_SIZE
+        self.port_scanner = port_scanner
+        self.transport = transport
+        self.http_probe = HTTPProbe()
+        # Own cache, the agent outlives scans like the API process does
+        self.resolver = ReverseResolver(lookup=lookup)
+        self.stats = {"units": 0, "failed": 0, "services": 0, "batches": 0, "bytes": 0, "compressed_bytes": 0}
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=f"{self.api_url}/api",
+            headers={"Authorization": f"Bearer {self.token}"},
+            transport=self.transport,
+            timeout=60
+        )
+
+    async def run_once(self, client: httpx.AsyncClient) -> bool:
+        """
+        Claim and scan one unit
+
+        Returns:
+            True if a unit was claimed
+        """
+        response = await client.post("/agents/claim")
+        if response.status_code == 204:
+            return False
+        response.raise_for_status()
+        await self.scan_unit(client, response.json())
+        return True
+
+    async def run_forever(self):
+        """Claim units until cancelled"""
+        logger.info(f"Scanner agent started, reporting to {self.api_url}")
+        async with self.client() as client:
+            while True:
+                claimed = False
+                try:
+                    claimed = await self.run_once(client)
+                except httpx.HTTPStatusError as e:
+                    logger.error(f"API refused the agent: {e.response.status_code} {e.response.text}")
+                except httpx.HTTPError as e:
+                    logger.error(f"API unreachable: {e}")
+                if not claimed:
+                    await asyncio.sleep(self.poll_interval)
+
+    async def scan_unit(self, client: httpx.AsyncClient, work: dict):
+        """Scan a claimed unit and push its results, renewing the lease meanwhile"""
+        network = work["network"]
+        logger.info(f"Scanning unit {network} of scan {work['scan_id']} (attempt {work['attempt']})")
+        scan = asyncio.create_task(self.scan(network, work["ports"]))
+        heartbeat = asyncio.create_task(self._heartbeat(client, work))
+        await asyncio.wait({scan, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+        heartbeat.cancel()
+        if not scan.done():
+            scan.cancel()
+            logger.warning(f"Lost the lease of unit {network}, abandoning it")
+            return
+
+        try:
+            try:
+                hosts, services = scan.result()
+            except Exception as e:
+                logger.warning(f"Scan of unit {network} failed: {e}")
+                self.stats["failed"] += 1
+                await self._push(client, {**self._batch(work, 0), "error": str(e) or type(e).__name__})
+                return
+            await self.push_results(client, work, hosts, services)
+        except LeaseLost:
+            logger.warning(f"Lost the lease of unit {network}, its results were dropped")
+            return
+        except (httpx.HTTPError, RuntimeError) as e:
+            # The lease expires and the unit goes to another attempt
+            logger.error(f"Failed to push the results of unit {network}: {e}")
+            self.stats["failed"] += 1
+            return
+        self.stats["units"] += 1
+        self.stats["services"] += len(services)
+        logger.info(f"Unit {network} done, {len(hosts)} hosts and {len(services)} services pushed")
+
+    async def scan(self, network: str, ports: List[int]) -> Tuple[list, list]:
+        """
+        Scan a network for services, like a scan worker's unit
+
+        Returns:
+            (hosts, services with their hostname)
+        """
+        network_scanner = NetworkScanner([network], ports, port_scanner=self.port_scanner, full_sweep=True)
+        hosts = await network_scanner.scan_network(network)
+        services, hostnames = await asyncio.gather(
+            self.http_probe.probe_multiple(hosts),
+            self._resolve(hosts)
+        )
+        for service in services:
+            service['hostname'] = hostnames.get(service['ip'])
+        return hosts, services
+
+    async def push_results(self, client: httpx.AsyncClient, work: dict, hosts: list, services: list):
+        """Push the services of a unit, AGENT_BATCH_SIZE at a time, the last batch flagged final"""
+        chunks = [services[i:i + self.batch_size] for i in range(0, len(services), self.batch_size)] or [[]]
+        for index, chunk in enumerate(chunks):
+            batch = {**self._batch(work, index), "services": chunk}
+            if index == len(chunks) - 1:
+                batch.update(final=True, batches=len(chunks), hosts=len(hosts))
+            await self._push(client, batch)
+
+    def _batch(self, work: dict, index: int) -> dict:
+        return {"unit_id": work["unit_id"], "attempt": work["attempt"], "batch": index}
+
+    async def _push(self, client: httpx.AsyncClient, batch: dict):
+        """POST one batch, retried on network errors and server errors"""
+        raw = orjson.dumps(batch)
+        body = gzip.compress(raw, compresslevel=6)
+        self.stats["batches"] += 1
+        self.stats["bytes"] += len(raw)
+        self.stats["compressed_bytes"] += len(body)
+
+        for attempt in range(1, PUSH_ATTEMPTS + 1):
+            try:
+                response = await client.post(
+                    "/agents/results",
+                    content=body,
+                    headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+                )
+                if response.status_code == 409:
+                    raise LeaseLost(response.json().get("detail"))
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    return
+                error = f"{response.status_code} {response.text}"
+            except httpx.TransportError as e:
+                error = str(e) or type(e).__name__
+            logger.warning(f"Push of batch {batch['batch']} failed (attempt {attempt}): {error}")
+            if attempt < PUSH_ATTEMPTS:
+                await asyncio.sleep(2 ** attempt)
+        raise RuntimeError(f"Gave up pushing batch {batch['batch']} of unit {batch['unit_id']}")
+
+    async def _heartbeat(self, client: httpx.AsyncClient, work: dict):
+        """Renew the lease until cancelled, returns when the lease is lost"""
+        while True:
+            await asyncio.sleep(work["lease_seconds"] / 3)
+            try:
+                response = await client.post(
+                    f"/agents/units/{work['unit_id']}/renew", params={"attempt": work["attempt"]}
+                )
+                if response.status_code == 409:
+                    return
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.warning(f"Failed to renew the lease of unit {work['network']}: {e}")
+
+    async def _resolve(self, hosts: list) -> dict:
+        hostnames = {host['ip']: host.get('hostname') for host in hosts}
+        unresolved = [ip for ip, hostname in hostnames.items() if not hostname]
+        if unresolved:
+            hostnames.update(await self.resolver.resolve_many(unresolved))
+        return hostnames
+
+
+async def main():
+    agent = ScanAgent()
+    await agent.run_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Scanner agent stopped")
@@ -0,0 +1,335 @@
+"""
+Remote scanner agents
+
+An agent (agent.py) scans networks the API can't reach, from a host that
+can. Each agent is assigned networks. Every AGENT_SCAN_INTERVAL minutes
+the scan leader starts an agent scan of the networks of all enabled
+agents, split into units of at most a /AGENT_UNIT_PREFIX. Agents claim
+units under a lease: any agent assigned a network takes its units, so
+agents sharing networks share the work. Results come back in batches
+through the ingest endpoint, which reconciles a unit once its last batch
+is in. A unit whose agent stops renewing the lease goes back to the
+others, up to AGENT_UNIT_ATTEMPTS times.
+"""
+import os
+import hashlib
+import logging
+import secrets
+import ipaddress
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import select, update, delete, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import Agent, AgentBatch, ScanHistory, ScanUnit
+
+logger = logging.getLogger(__name__)
+
+# Minutes between two agent scans
+AGENT_SCAN_INTERVAL = int(os.getenv("AGENT_SCAN_INTERVAL", "60"))
+
+# Largest unit of an agent scan, smaller units spread better over agents
+AGENT_UNIT_PREFIX = int(os.getenv("AGENT_UNIT_PREFIX", "24"))
+
+# Seconds an agent holds a unit without renewing it
+AGENT_LEASE = int(os.getenv("AGENT_LEASE", "120"))
+
+# Claims of a unit before it fails
+AGENT_UNIT_ATTEMPTS = int(os.getenv("AGENT_UNIT_ATTEMPTS", "3"))
+
+
+def new_token() -> str:
+    """Bearer token of a new agent, only its hash is stored"""
+    return secrets.token_urlsafe(32)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def is_agent_scan(scan: ScanHistory) -> bool:
+    return bool((scan.scan_config or {}).get("agents"))
+
+
+def covers(agent: Agent, network: str) -> bool:
+    """True when the unit network lies inside one of the agent's networks"""
+    try:
+        unit = ipaddress.ip_network(network, strict=False)
+    except ValueError:
+        return network in (agent.networks or [])
+    for assigned in agent.networks or []:
+        assigned = ipaddress.ip_network(assigned, strict=False)
+        if assigned.version == unit.version and unit.subnet_of(assigned):
+            return True
+    return False
+
+
+def plan_agent_units(networks: List[str]) -> List[str]:
+    """
+    Units of an agent scan
+
+    Each agent network is split like a scan's (see api.scanner.plan_units),
+    then units inside another unit are dropped, so networks shared by
+    several agents are scanned once and every unit still lies in the
+    network of an agent.
+    """
+    from api.scanner import plan_units
+
+    units = []
+    for unit in plan_units(networks, AGENT_UNIT_PREFIX):
+        if unit not in units:
+            units.append(unit)
+    parsed = {}
+    for unit in units:
+        try:
+            parsed[unit] = ipaddress.ip_network(unit, strict=False)
+        except ValueError:
+            pass
+    return [
+        unit for unit in units
+        if unit not in parsed or not any(
+            other != unit and net.version == parsed[unit].version and parsed[unit].subnet_of(net)
+            for other, net in parsed.items()
+        )
+    ]
+
+
+async def agent_networks(db: AsyncSession) -> List[str]:
+    """Networks of the enabled agents, each once"""
+    result = await db.execute(select(Agent.networks).where(Agent.enabled == True).order_by(Agent.id))
+    networks = []
+    for assigned in result.scalars():
+        networks.extend(network for network in assigned or [] if network not in networks)
+    return networks
+
+
+async def running_agent_scans(db: AsyncSession) -> List[ScanHistory]:
+    result = await db.execute(select(ScanHistory).where(ScanHistory.status == "running").order_by(ScanHistory.id))
+    return [scan for scan in result.scalars() if is_agent_scan(scan)]
+
+
+async def start_agent_scan(db: AsyncSession, force: bool = False) -> Optional[ScanHistory]:
+    """
+    Start an agent scan when one is due
+
+    Args:
+        db: Database session (committed by this function)
+        force: Start now, even if the last one started less than AGENT_SCAN_INTERVAL ago
+
+    Returns:
+        The running agent scan (a new one or the one already running),
+        None when none is due or no agent has networks
+    """
+    running = await running_agent_scans(db)
+    if running:
+        return running[0]
+
+    now = datetime.utcnow()
+    if not force:
+        result = await db.execute(
+            select(ScanHistory)
+            .where(ScanHistory.started_at > now - timedelta(minutes=AGENT_SCAN_INTERVAL))
+        )
+        if any(is_agent_scan(scan) for scan in result.scalars()):
+            return None
+
+    networks = await agent_networks(db)
+    if not networks:
+        return None
+
+    scan = ScanHistory(
+        started_at=now,
+        status="running",
+        scan_config={"networks": networks, "scoped": True, "agents": True}
+    )
+    db.add(scan)
+    await db.flush()
+    units = plan_agent_units(networks)
+    db.add_all(ScanUnit(scan_id=scan.id, network=network, status="pending") for network in units)
+    await db.commit()
+    logger.info(f"Started agent scan {scan.id} of {', '.join(networks)} in {len(units)} units")
+    return scan
+
+
+def _claimable(now: datetime):
+    """Pending units, and running ones whose agent stopped renewing the lease"""
+    return or_(
+        ScanUnit.status == "pending",
+        and_(ScanUnit.status == "running", ScanUnit.lease_expires_at < now),
+    )
+
+
+async def claim_unit(db: AsyncSession, agent: Agent) -> Optional[ScanUnit]:
+    """
+    Lease the next unit of the running agent scan that lies in the agent's networks
+
+    The claiming UPDATE repeats the claimable condition, so of two agents
+    racing for a unit only one gets it. Units out of attempts fail instead.
+
+    Returns:
+        The claimed unit, None when there's no work for this agent
+    """
+    now = datetime.utcnow()
+    scan_ids = [scan.id for scan in await running_agent_scans(db)]
+    if not scan_ids:
+        return None
+
+    result = await db.execute(
+        select(ScanUnit).where(ScanUnit.scan_id.in_(scan_ids), _claimable(now)).order_by(ScanUnit.id)
+    )
+    for unit in result.scalars().all():
+        if not covers(agent, unit.network):
+            continue
+        if (unit.attempts or 0) >= AGENT_UNIT_ATTEMPTS:
+            unit.status = "failed"
+            unit.error_message = unit.error_message or f"Gave up after {unit.attempts} attempts"
+            unit.completed_at = now
+            continue
+
+        claimed = await db.execute(
+            update(ScanUnit)
+            .where(ScanUnit.id == unit.id, _claimable(now))
+            .values(
+                status="running",
+                agent_id=agent.id,
+                lease_expires_at=now + timedelta(seconds=AGENT_LEASE),
+                attempts=ScanUnit.attempts + 1,
+                started_at=now,
+                error_message=None,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount != 1:
+            continue
+        # Batches of an earlier attempt will never be completed
+        await db.execute(delete(AgentBatch).where(AgentBatch.unit_id == unit.id))
+        await db.commit()
+        await db.refresh(unit)
+        logger.info(f"Agent {agent.name} claimed unit {unit.network} of scan {unit.scan_id} (attempt {unit.attempts})")
+        return unit
+
+    # Units given up on above
+    await db.commit()
+    for scan_id in scan_ids:
+        await finish_agent_scan(db, scan_id)
+    return None
+
+
+async def leased_unit(db: AsyncSession, agent: Agent, unit_id: int, attempt: int) -> Optional[ScanUnit]:
+    """The unit when this attempt of the agent still holds it, None when the lease was lost"""
+    unit = await db.get(ScanUnit, unit_id)
+    if unit is None or unit.status != "running" or unit.agent_id != agent.id or unit.attempts != attempt:
+        return None
+    return unit
+
+
+def renew_lease(unit: ScanUnit):
+    unit.lease_expires_at = datetime.utcnow() + timedelta(seconds=AGENT_LEASE)
+
+
+async def release_unit(db: AsyncSession, unit: ScanUnit, error: str):
+    """
+    Give back a unit the agent failed to scan, for another attempt by any agent
+
+    The caller is responsible for committing.
+    """
+    await db.execute(delete(AgentBatch).where(AgentBatch.unit_id == unit.id))
+    unit.error_message = error
+    unit.lease_expires_at = None
+    if (unit.attempts or 0) >= AGENT_UNIT_ATTEMPTS:
+        unit.status = "failed"
+        unit.completed_at = datetime.utcnow()
+    else:
+        unit.status = "pending"
+
+
+async def requeue_units(db: AsyncSession, scan: ScanHistory, unit_id: Optional[int] = None) -> int:
+    """
+    Give the incomplete units of an agent scan new attempts
+
+    Returns:
+        Units queued again
+    """
+    query = (
+        update(ScanUnit)
+        .where(ScanUnit.scan_id == scan.id, ScanUnit.status.in_(["failed", "pending"]))
+        .values(status="pending", attempts=0, agent_id=None, lease_expires_at=None, completed_at=None)
+    )
+    if unit_id is not None:
+        query = query.where(ScanUnit.id == unit_id)
+    result = await db.execute(query)
+    if result.rowcount:
+        scan.status = "running"
+        scan.completed_at = None
+        scan.error_message = None
+    await db.commit()
+    return result.rowcount
+
+
+async def finish_agent_scan(db: AsyncSession, scan_id: int) -> bool:
+    """
+    Complete an agent scan once none of its units is pending or running
+
+    Returns:
+        True when the scan is finished
+    """
+    scan = await db.get(ScanHistory, scan_id)
+    if scan is None or scan.status != "running":
+        return scan is not None
+    result = await db.execute(select(ScanUnit).where(ScanUnit.scan_id == scan_id).order_by(ScanUnit.id))
+    units = result.scalars().all()
+    if any(unit.status in ("pending", "running") for unit in units):
+        return False
+
+    incomplete = [unit for unit in units if unit.status != "completed"]
+    scan.completed_at = datetime.utcnow()
+    scan.services_found = sum(unit.services_found or 0 for unit in units)
+    scan.new_services = sum(unit.new_services or 0 for unit in units)
+    scan.removed_services = sum(unit.removed_services or 0 for unit in units)
+    if incomplete:
+        scan.status = "failed"
+        scan.error_message = f"{len(incomplete)} of {len(units)} units failed: " + ", ".join(
+            f"{unit.network} ({unit.error_message or unit.status})" for unit in incomplete[:10]
+        )
+    else:
+        scan.status = "completed"
+    await db.commit()
+    logger.info(
+        f"Agent scan {scan_id} {scan.status}. Found {scan.services_found} services, "
+        f"{scan.new_services} new, {scan.removed_services} removed"
+    )
+    return True
+
+
+async def dispatch_agent_scans() -> Optional[ScanHistory]:
+    """
+    Leader tick: fail the units out of attempts or left without an agent,
+    finish the running agent scan or start a due one
+    """
+    async with AsyncSessionLocal() as db:
+        now = datetime.utcnow()
+        result = await db.execute(select(Agent).where(Agent.enabled == True))
+        agents = result.scalars().all()
+        for scan in await running_agent_scans(db):
+            result = await db.execute(select(ScanUnit).where(ScanUnit.scan_id == scan.id, ScanUnit.status == "pending"))
+            for unit in result.scalars():
+                # Its agents were disabled, deleted or reassigned since the scan started
+                if not any(covers(agent, unit.network) for agent in agents):
+                    unit.status = "failed"
+                    unit.error_message = "No enabled agent is assigned this network"
+                    unit.completed_at = now
+            await db.execute(
+                update(ScanUnit)
+                .where(
+                    ScanUnit.scan_id == scan.id,
+                    ScanUnit.status == "running",
+                    ScanUnit.lease_expires_at < now,
+                    ScanUnit.attempts >= AGENT_UNIT_ATTEMPTS,
+                )
+                .values(status="failed", error_message="Lease expired on the last attempt", completed_at=now)
+            )
+            await db.commit()
+            await finish_agent_scan(db, scan.id)
+        return await start_agent_scan(db)
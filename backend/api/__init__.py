@@ -3,5 +3,10 @@ API package initialization
 """
 from .services import router as services_router
 from .scanner import router as scanner_router
+from .inventory import router as inventory_router
+from .certificates import router as certificates_router
+from .dashboard import router as dashboard_router
+from .schedules import router as schedules_router
+from .agents import router as agents_router
 
-__all__ = ["services_router", "scanner_router"]
+__all__ = ["services_router", "scanner_router", "inventory_router", "certificates_router", "dashboard_router", "schedules_router", "agents_router"]
@@ -0,0 +1,385 @@
+"""
+Scanner agent endpoints
+
+Registration and network assignment of agents, and the endpoints agents
+call with their bearer token: claim a unit, renew its lease, push its
+results (gzip-compressed JSON batches, reconciled like a local scan's).
+"""
+import os
+import zlib
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from agents import (
+    AGENT_LEASE, claim_unit, finish_agent_scan, hash_token, leased_unit, new_token, release_unit,
+    renew_lease, start_agent_scan,
+)
+from database import get_db
+from models import Agent, AgentBatch, ScanUnit
+from readmodel import read_model
+from .schedules import ScanTargetFields
+from .scanner import ScanStatus, default_ports, in_networks, reconcile_services, target_networks
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Largest decompressed results request, in bytes
+AGENT_MAX_BODY = int(os.getenv("AGENT_MAX_BODY", str(32 * 1024 * 1024)))
+
+
+class AgentCreate(ScanTargetFields):
+    name: str = Field(min_length=1, max_length=100)
+    networks: List[str]
+    ports: Optional[List[int]] = None
+    enabled: bool = True
+
+
+class AgentUpdate(ScanTargetFields):
+    name: Optional[str] = Field(None, min_length=1, max_length=100)
+    networks: Optional[List[str]] = None
+    ports: Optional[List[int]] = None
+    enabled: Optional[bool] = None
+
+
+class AgentResponse(BaseModel):
+    id: int
+    name: str
+    networks: List[str]
+    ports: Optional[List[int]]
+    enabled: bool
+    last_seen_at: Optional[str]
+    last_address: Optional[str]
+    units_running: int = 0
+
+
+class AgentCreated(AgentResponse):
+    # Only shown here, the database keeps its hash
+    token: str
+
+
+class AgentWork(BaseModel):
+    unit_id: int
+    attempt: int
+    scan_id: int
+    network: str
+    ports: List[int]
+    lease_seconds: int
+
+
+class AgentService(BaseModel):
+    """One HTTPProbe result"""
+    url: str = Field(max_length=512)
+    protocol: str = Field(max_length=10)
+    ip: str = Field(max_length=45)
+    port: int = Field(ge=1, le=65535)
+    endpoint: Optional[str] = None
+    hostname: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    favicon: Optional[str] = None
+    version: Optional[str] = None
+    status_code: Optional[int] = None
+    response_time: Optional[int] = None
+    certificate: Optional[dict] = None
+    fingerprint: Optional[dict] = None
+    reused: bool = False
+
+
+class AgentResultBatch(BaseModel):
+    unit_id: int
+    attempt: int
+    batch: int = Field(ge=0)
+    # Set on the last batch, with the number of batches sent
+    final: bool = False
+    batches: Optional[int] = None
+    hosts: int = 0
+    services: List[AgentService] = []
+    # The agent couldn't scan the unit, it goes back to the others
+    error: Optional[str] = None
+
+
+class AgentResultResponse(BaseModel):
+    status: str
+    new: Optional[int] = None
+    removed: Optional[int] = None
+    changed: Optional[int] = None
+
+
+def format_agent(agent: Agent, units_running: int = 0) -> dict:
+    return {
+        "id": agent.id,
+        "name": agent.name,
+        "networks": agent.networks,
+        "ports": agent.ports,
+        "enabled": agent.enabled,
+        "last_seen_at": agent.last_seen_at.isoformat() if agent.last_seen_at else None,
+        "last_address": agent.last_address,
+        "units_running": units_running,
+    }
+
+
+async def current_agent(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+) -> Agent:
+    """The agent whose bearer token the request carries"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Agent token required", headers={"WWW-Authenticate": "Bearer"})
+    result = await db.execute(select(Agent).where(Agent.token_hash == hash_token(token.strip())))
+    agent = result.scalar_one_or_none()
+    if agent is None:
+        raise HTTPException(status_code=401, detail="Invalid agent token", headers={"WWW-Authenticate": "Bearer"})
+    if not agent.enabled:
+        raise HTTPException(status_code=403, detail="Agent is disabled")
+    agent.last_seen_at = datetime.utcnow()
+    agent.last_address = request.client.host if request.client else None
+    return agent
+
+
+async def read_body(request: Request) -> bytes:
+    """Request body, gunzipped when sent with Content-Encoding: gzip"""
+    body = await request.body()
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, AGENT_MAX_BODY)
+        except zlib.error:
+            raise HTTPException(status_code=400, detail="Invalid gzip body")
+        if decompressor.unconsumed_tail:
+            raise HTTPException(status_code=413, detail="Results batch too large")
+    elif encoding != "identity":
+        raise HTTPException(status_code=415, detail=f"Unsupported content encoding: {encoding}")
+    if len(body) > AGENT_MAX_BODY:
+        raise HTTPException(status_code=413, detail="Results batch too large")
+    return body
+
+
+async def _get_agent(db: AsyncSession, agent_id: int) -> Agent:
+    agent = await db.get(Agent, agent_id)
+    if agent is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return agent
+
+
+async def _name_taken(db: AsyncSession, name: str, agent_id: Optional[int] = None) -> bool:
+    result = await db.execute(select(Agent.id).where(Agent.name == name))
+    found = result.scalar_one_or_none()
+    return found is not None and found != agent_id
+
+
+async def _release_units_of(db: AsyncSession, agent_id: int):
+    """Put the units an agent holds back in the pool"""
+    await db.execute(
+        update(ScanUnit)
+        .where(ScanUnit.agent_id == agent_id, ScanUnit.status == "running")
+        .values(status="pending", lease_expires_at=None)
+    )
+
+
+@router.get("/agents", response_model=List[AgentResponse])
+async def get_agents(db: AsyncSession = Depends(get_db)):
+    """List scanner agents with the number of units each is scanning"""
+    result = await db.execute(select(Agent).order_by(Agent.name))
+    agents = result.scalars().all()
+    result = await db.execute(
+        select(ScanUnit.agent_id, func.count())
+        .where(ScanUnit.status == "running", ScanUnit.agent_id.isnot(None))
+        .group_by(ScanUnit.agent_id)
+    )
+    running = dict(result.all())
+    return [format_agent(agent, running.get(agent.id, 0)) for agent in agents]
+
+
+@router.post("/agents", response_model=AgentCreated)
+async def create_agent(agent: AgentCreate, db: AsyncSession = Depends(get_db)):
+    """Register an agent; the response holds its token, which can't be read again"""
+    if await _name_taken(db, agent.name):
+        raise HTTPException(status_code=400, detail="Agent already exists")
+
+    token = new_token()
+    new_agent = Agent(**agent.dict(), token_hash=hash_token(token))
+    db.add(new_agent)
+    await db.commit()
+    await db.refresh(new_agent)
+    return {**format_agent(new_agent), "token": token}
+
+
+@router.patch("/agents/{agent_id}", response_model=AgentResponse)
+async def update_agent(agent_id: int, agent_update: AgentUpdate, db: AsyncSession = Depends(get_db)):
+    """Update an agent; new networks apply from the next agent scan"""
+    agent = await _get_agent(db, agent_id)
+    update_data = agent_update.dict(exclude_unset=True)
+    if "name" in update_data and await _name_taken(db, update_data["name"], agent_id):
+        raise HTTPException(status_code=400, detail="Agent already exists")
+
+    for field, value in update_data.items():
+        setattr(agent, field, value)
+    if update_data.get("enabled") is False:
+        await _release_units_of(db, agent_id)
+
+    await db.commit()
+    await db.refresh(agent)
+    return format_agent(agent)
+
+
+@router.delete("/agents/{agent_id}")
+async def delete_agent(agent_id: int, db: AsyncSession = Depends(get_db)):
+    """Delete an agent, the units it was scanning go to the others"""
+    agent = await _get_agent(db, agent_id)
+    await _release_units_of(db, agent_id)
+    await db.delete(agent)
+    await db.commit()
+    return {"status": "deleted", "id": agent_id}
+
+
+@router.post("/agents/{agent_id}/token", response_model=AgentCreated)
+async def rotate_agent_token(agent_id: int, db: AsyncSession = Depends(get_db)):
+    """Replace an agent's token, the old one stops working at once"""
+    agent = await _get_agent(db, agent_id)
+    token = new_token()
+    agent.token_hash = hash_token(token)
+    await db.commit()
+    await db.refresh(agent)
+    return {**format_agent(agent), "token": token}
+
+
+@router.post("/agents/scan", response_model=ScanStatus)
+async def trigger_agent_scan(db: AsyncSession = Depends(get_db)):
+    """Start an agent scan now, or return the one running"""
+    scan = await start_agent_scan(db, force=True)
+    if scan is None:
+        raise HTTPException(status_code=400, detail="No enabled agent has networks")
+    return ScanStatus(status="running", message="Agent scan in progress", scan_id=scan.id)
+
+
+@router.post("/agents/claim", response_model=AgentWork, responses={204: {"description": "No work for this agent"}})
+async def claim_work(agent: Agent = Depends(current_agent), db: AsyncSession = Depends(get_db)):
+    """Lease the next unit in the agent's networks"""
+    unit = await claim_unit(db, agent)
+    if unit is None:
+        await db.commit()
+        return Response(status_code=204)
+    return AgentWork(
+        unit_id=unit.id,
+        attempt=unit.attempts,
+        scan_id=unit.scan_id,
+        network=unit.network,
+        ports=agent.ports or default_ports(),
+        lease_seconds=AGENT_LEASE,
+    )
+
+
+@router.post("/agents/units/{unit_id}/renew")
+async def renew_unit(unit_id: int, attempt: int, agent: Agent = Depends(current_agent), db: AsyncSession = Depends(get_db)):
+    """Extend the lease of a unit the agent is still scanning"""
+    unit = await leased_unit(db, agent, unit_id, attempt)
+    if unit is None:
+        await db.commit()
+        raise HTTPException(status_code=409, detail="Unit is no longer leased to this agent")
+    renew_lease(unit)
+    await db.commit()
+    return {"status": "renewed", "lease_seconds": AGENT_LEASE}
+
+
+@router.post("/agents/results", response_model=AgentResultResponse)
+async def push_results(request: Request, agent: Agent = Depends(current_agent), db: AsyncSession = Depends(get_db)):
+    """
+    Receive one batch of a unit's results
+
+    Batches are kept until the final one arrives, then the unit's services
+    are reconciled (scoped to the unit's network) and the unit completed in
+    one transaction, like a local scan's checkpoint. A batch sent twice is
+    stored once, so agents can retry a push. Services outside the unit's
+    network are dropped.
+    """
+    from scanner import ServiceCategorizer, category_classifier
+
+    try:
+        results = AgentResultBatch.model_validate_json(await read_body(request))
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+    unit = await leased_unit(db, agent, results.unit_id, results.attempt)
+    if unit is None:
+        await db.commit()
+        raise HTTPException(status_code=409, detail="Unit is no longer leased to this agent")
+
+    if results.error:
+        await release_unit(db, unit, f"{agent.name}: {results.error}"[:1000])
+        await db.commit()
+        await finish_agent_scan(db, unit.scan_id)
+        return {"status": "released"}
+
+    existing = await db.execute(
+        select(AgentBatch.id).where(
+            AgentBatch.unit_id == unit.id, AgentBatch.attempt == results.attempt, AgentBatch.batch == results.batch
+        )
+    )
+    if existing.first() is None:
+        services = [service.model_dump(exclude_none=True) for service in results.services]
+        # Host name units can't be matched against addresses
+        networks = target_networks(unit.network)
+        if networks is not None:
+            in_scope = [service for service in services if in_networks(service["ip"], networks)]
+            if len(in_scope) < len(services):
+                logger.warning(
+                    f"Agent {agent.name} pushed {len(services) - len(in_scope)} services "
+                    f"outside unit {unit.network}, dropped"
+                )
+            services = in_scope
+        db.add(AgentBatch(
+            unit_id=unit.id,
+            attempt=results.attempt,
+            batch=results.batch,
+            hosts=results.hosts,
+            services=services,
+        ))
+        await db.flush()
+    renew_lease(unit)
+    if not results.final:
+        await db.commit()
+        return {"status": "accepted"}
+
+    result = await db.execute(
+        select(AgentBatch)
+        .where(AgentBatch.unit_id == unit.id, AgentBatch.attempt == results.attempt)
+        .order_by(AgentBatch.batch)
+    )
+    batches = result.scalars().all()
+    if results.batches is None or len(batches) != results.batches:
+        await db.commit()
+        raise HTTPException(
+            status_code=409, detail=f"Missing batches: received {len(batches)} of {results.batches}"
+        )
+
+    web_services = [service for batch in batches for service in batch.services]
+    categorizer = ServiceCategorizer(category_classifier if category_classifier.enabled else None)
+    counts = await reconcile_services(db, web_services, categorizer, unit.scan_id, scope=[unit.network])
+    unit.status = "completed"
+    unit.hosts = sum(batch.hosts or 0 for batch in batches)
+    unit.services_found = len(web_services)
+    unit.new_services = counts["new"]
+    unit.removed_services = counts["removed"]
+    unit.changed_services = counts["changed"]
+    # Agents scan every port of their units
+    unit.full_sweep = True
+    unit.lease_expires_at = None
+    unit.completed_at = datetime.utcnow()
+    await db.execute(delete(AgentBatch).where(AgentBatch.unit_id == unit.id))
+    # The checkpoint: the unit's services and its completion in one transaction
+    await db.commit()
+
+    await read_model.notify(since=unit.started_at)
+    await finish_agent_scan(db, unit.scan_id)
+    return {"status": "completed", **counts}
@@ -0,0 +1,72 @@
+"""
+TLS certificate endpoints
+
+Certificates are captured by the scanner's HTTPS probes, so listing the
+expiring ones is an indexed range query on services.cert_expires_at and
+costs no connection.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+from models import Service
+
+router = APIRouter()
+
+
+class ExpiringCertificate(BaseModel):
+    service_id: int
+    name: str
+    url: str
+    status: str
+    subject: Optional[str] = None
+    issuer: Optional[str] = None
+    sans: List[str] = []
+    sha256: Optional[str] = None
+    not_after: str
+    days_left: int
+
+
+@router.get("/certificates/expiring", response_model=List[ExpiringCertificate])
+async def get_expiring_certificates(
+    days: int = Query(30, ge=0, le=3650, description="Expiring within this many days, expired ones included"),
+    include_inactive: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """List services whose certificate expires within `days`, soonest first"""
+    now = datetime.utcnow()
+    query = (
+        select(Service.id, Service.name, Service.url, Service.status, Service.certificate, Service.cert_expires_at)
+        .where(
+            Service.cert_expires_at.isnot(None),
+            Service.cert_expires_at <= now + timedelta(days=days),
+            Service.is_hidden == False
+        )
+        .order_by(Service.cert_expires_at, Service.id)
+    )
+    if not include_inactive:
+        query = query.where(Service.status == "active")
+
+    result = await db.execute(query)
+    expiring = []
+    for service_id, name, url, status, certificate, expires_at in result:
+        certificate = certificate or {}
+        expiring.append({
+            "service_id": service_id,
+            "name": name,
+            "url": url,
+            "status": status,
+            "subject": certificate.get("subject"),
+            "issuer": certificate.get("issuer"),
+            "sans": certificate.get("sans") or [],
+            "sha256": certificate.get("sha256"),
+            "not_after": expires_at.isoformat(),
+            # Floor, so a certificate expiring later today is at 0 and an expired one below
+            "days_left": (expires_at - now).days,
+        })
+    return expiring
@@ -0,0 +1,142 @@
+"""
+Dashboard bootstrap endpoint
+
+Everything the dashboard renders on load, in one response: categories
+with their services and counts, uncategorized services, the scan status
+and the next scheduled scan. The inventory comes from the read model
+when it is loaded, else from one snapshot of the database, with the
+change feed token to follow it from (GET /api/services/changes).
+"""
+import hashlib
+from typing import Dict, List, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, Request, Response
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db, begin_snapshot
+from models import Service, Category
+from readmodel import read_model
+from .scanner import ScanStatus, scan_status
+from .services import CategoryResponse, ServiceResponse, current_changes_token, service_fragments_for
+
+router = APIRouter()
+
+
+class DashboardCategory(CategoryResponse):
+    services: List[ServiceResponse]
+
+
+class DashboardSchedule(BaseModel):
+    enabled: bool
+    next_run: Optional[str] = None
+    schedule: Optional[str] = None
+
+
+class DashboardResponse(BaseModel):
+    categories: List[DashboardCategory]
+    uncategorized: List[ServiceResponse]
+    scan: ScanStatus
+    scheduler: DashboardSchedule
+    changes_token: str
+
+
+async def inventory_from_db(db: AsyncSession) -> tuple:
+    """
+    Categories and services from one snapshot
+
+    Returns:
+        (categories in display order, encoded services by category id, None for uncategorized,
+        change feed token of the snapshot)
+    """
+    await begin_snapshot(db)
+    result = await db.execute(select(Category).order_by(Category.order_index, Category.name))
+    categories = [
+        {
+            "id": category.id,
+            "name": category.name,
+            "icon": category.icon,
+            "color": category.color,
+            "order_index": category.order_index,
+        }
+        for category in result.scalars()
+    ]
+
+    result = await db.execute(
+        select(Service.id, Service.updated_at, Category.name, Service.category_id)
+        .outerjoin(Category, Service.category_id == Category.id)
+        .where(Service.is_hidden == False)
+        .order_by(Service.name)
+    )
+    rows = result.all()
+    fragments = await service_fragments_for(db, [row[:3] for row in rows])
+
+    groups: Dict[Optional[int], List[bytes]] = {}
+    for service_id, _, _, category_id in rows:
+        if service_id in fragments:
+            groups.setdefault(category_id, []).append(fragments[service_id])
+    return categories, groups, await current_changes_token(db)
+
+
+async def inventory_from_read_model(db: AsyncSession) -> tuple:
+    """The same from the read model, which no request can change midway"""
+    groups: Dict[Optional[int], List[bytes]] = {}
+    synced_at = read_model.last_sync
+    for record in read_model.ordered():
+        groups.setdefault(record.category_id, []).append(record.fragment)
+    categories = read_model.category_list()
+    return categories, groups, await current_changes_token(db, synced_at)
+
+
+def dashboard_body(
+    categories: List[dict],
+    groups: Dict[Optional[int], List[bytes]],
+    scan: dict,
+    schedule: dict,
+    token: str
+) -> bytes:
+    """DashboardResponse JSON, joined from the already encoded services"""
+    parts = [b'{"categories":[']
+    for index, category in enumerate(categories):
+        services = groups.get(category["id"], [])
+        head = orjson.dumps(dict(category, service_count=len(services)))
+        parts += [b"," if index else b"", head[:-1], b',"services":[', b",".join(services), b"]}"]
+    parts += [
+        b'],"uncategorized":[', b",".join(groups.get(None, [])),
+        b'],"scan":', orjson.dumps(scan),
+        b',"scheduler":', orjson.dumps(schedule),
+        b',"changes_token":', orjson.dumps(token),
+        b"}",
+    ]
+    # One copy of the services, however many categories there are
+    return b"".join(parts)
+
+
+@router.get("/dashboard", response_model=DashboardResponse)
+async def get_dashboard(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Everything the dashboard shows on load
+
+    Answers 304 Not Modified when If-None-Match holds the ETag of the
+    current response, so a polling client only downloads changes.
+    """
+    if read_model.ready:
+        categories, groups, token = await inventory_from_read_model(db)
+    else:
+        categories, groups, token = await inventory_from_db(db)
+    scan = (await scan_status(db)).model_dump()
+
+    # Set by main.py; only the fields every worker agrees on, so they share ETags
+    scheduler_info = getattr(request.app.state, "scheduler_info", None)
+    info = scheduler_info() if scheduler_info else {"enabled": False}
+    schedule = {key: info.get(key) for key in ("enabled", "next_run", "schedule")}
+
+    body = dashboard_body(categories, groups, scan, schedule, token)
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
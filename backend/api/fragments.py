@@ -0,0 +1,66 @@
+"""
+Cached JSON fragments of service rows
+
+Listing endpoints send the same rows over and over, and rows only change
+when a scan or an edit touches them. Each row's JSON encoding is kept
+with the version it was encoded from, list responses are joined from the
+fragments, and only missing or stale rows are loaded and encoded again.
+"""
+import os
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional
+
+import orjson
+
+
+class FragmentCache:
+    """
+    Encoded rows by id, with the version they were encoded from
+
+    A version is anything that changes with the row's output, e.g.
+    (updated_at, category name). Least recently used rows are dropped
+    first once max_entries is reached.
+    """
+
+    def __init__(self, max_entries: int = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Rows kept (default: SERVICE_FRAGMENT_CACHE or 100000)
+        """
+        self.max_entries = max_entries or int(os.getenv("SERVICE_FRAGMENT_CACHE", "100000"))
+        self._cache: "OrderedDict[int, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, row_id: int, version: Hashable) -> Optional[bytes]:
+        """Fragment of a row, None when missing or encoded from another version"""
+        entry = self._cache.get(row_id)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self._cache.move_to_end(row_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, row_id: int, version: Hashable, row: Dict) -> bytes:
+        """Encode a row and keep its fragment"""
+        fragment = orjson.dumps(row)
+        self._cache[row_id] = (version, fragment)
+        self._cache.move_to_end(row_id)
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        self._cache.clear()
+
+
+def json_array(fragments: Iterable[bytes]) -> bytes:
+    """JSON array of already encoded elements"""
+    return b"[" + b",".join(fragments) + b"]"
+
+
+# Shared cache of the service listings
+service_fragments = FragmentCache()
@@ -0,0 +1,472 @@
+"""
+Inventory export and import endpoints
+
+The export streams categories and services from a server-side cursor, the
+import reads the request body incrementally and writes services with one
+upsert statement per batch, so neither holds the inventory in memory.
+"""
+import os
+import csv
+import json
+import codecs
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError, field_validator
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal, engine
+from models import Service, Category
+from readmodel import read_model
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Rows fetched per cursor round trip by the export
+EXPORT_BATCH_SIZE = int(os.getenv("INVENTORY_EXPORT_BATCH", "1000"))
+# Services written per upsert statement by the import
+IMPORT_BATCH_SIZE = int(os.getenv("INVENTORY_IMPORT_BATCH", "1000"))
+# Row errors listed in the import response, the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+# Exported service fields, also the CSV column order; categories are referenced by name
+SERVICE_FIELDS = [
+    "name", "url", "description", "favicon_url", "category", "ip_address", "hostname",
+    "port", "protocol", "version", "status", "response_time", "last_seen", "first_discovered",
+    "is_manual", "is_category_manual", "is_hidden", "extra_data", "aliases",
+]
+CATEGORY_FIELDS = ["name", "icon", "color", "order_index"]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+class ImportedCategory(BaseModel):
+    name: str
+    icon: Optional[str] = None
+    color: Optional[str] = None
+    order_index: Optional[int] = None
+
+
+class ImportedService(BaseModel):
+    name: str
+    url: str
+    description: Optional[str] = None
+    favicon_url: Optional[str] = None
+    category: Optional[str] = None
+    ip_address: Optional[str] = None
+    hostname: Optional[str] = None
+    port: Optional[int] = None
+    protocol: Optional[str] = None
+    version: Optional[str] = None
+    status: Optional[str] = None
+    response_time: Optional[int] = None
+    last_seen: Optional[datetime] = None
+    first_discovered: Optional[datetime] = None
+    is_manual: Optional[bool] = None
+    is_category_manual: Optional[bool] = None
+    is_hidden: Optional[bool] = None
+    extra_data: Optional[dict] = None
+    aliases: Optional[List[str]] = None
+
+    @field_validator("name", "url")
+    @classmethod
+    def not_blank(cls, value: str) -> str:
+        if not value.strip():
+            raise ValueError("must not be empty")
+        return value.strip()
+
+    @field_validator("extra_data", "aliases", mode="before")
+    @classmethod
+    def parse_json(cls, value):
+        # CSV cells hold extra_data and aliases as JSON documents
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportResponse(BaseModel):
+    rows: int
+    imported: int
+    categories: int
+    failed: int
+    errors: List[ImportRowError]
+
+
+def _upsert_insert(table):
+    """INSERT supporting ON CONFLICT for the configured database"""
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def _cell(value):
+    """JSON-compatible form of a column value"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _services_query(include_hidden: bool):
+    columns = [getattr(Service, field) for field in SERVICE_FIELDS if field != "category"]
+    query = (
+        select(*columns, Category.name.label("category"))
+        .outerjoin(Category, Service.category_id == Category.id)
+        .order_by(Service.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    if not include_hidden:
+        query = query.where(Service.is_hidden == False)
+    return query
+
+
+async def _export_ndjson(include_hidden: bool) -> AsyncIterator[str]:
+    # The request's session is closed before the body is sent, so the
+    # stream opens its own
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(*(getattr(Category, field) for field in CATEGORY_FIELDS)).order_by(Category.order_index, Category.name)
+        )
+        yield "".join(json.dumps({"type": "category", **row._asdict()}) + "\n" for row in result)
+
+        result = await db.stream(_services_query(include_hidden))
+        async for rows in result.partitions():
+            yield "".join(
+                json.dumps({"type": "service", **{key: _cell(value) for key, value in row._mapping.items()}}) + "\n"
+                for row in rows
+            )
+
+
+class _Buffer:
+    """File-like sink for csv.writer, drained after every partition"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text: str):
+        self.parts.append(text)
+
+    def drain(self) -> str:
+        text = "".join(self.parts)
+        self.parts.clear()
+        return text
+
+
+async def _export_csv(include_hidden: bool) -> AsyncIterator[str]:
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    writer.writerow(SERVICE_FIELDS)
+    yield buffer.drain()
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(_services_query(include_hidden))
+        async for rows in result.partitions():
+            for row in rows:
+                values = row._mapping
+                writer.writerow([_csv_cell(field, values[field]) for field in SERVICE_FIELDS])
+            yield buffer.drain()
+
+
+def _csv_cell(field: str, value):
+    if value is None:
+        return ""
+    if field in ("extra_data", "aliases"):
+        return json.dumps(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return _cell(value)
+
+
+@router.get("/inventory/export")
+async def export_inventory(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_hidden: bool = Query(True)
+):
+    """
+    Stream the inventory as NDJSON (categories, then services) or CSV (services only)
+
+    Rows are read from a server-side cursor in batches of
+    INVENTORY_EXPORT_BATCH, so memory does not grow with the inventory.
+    """
+    stream = _export_ndjson(include_hidden) if format == "ndjson" else _export_csv(include_hidden)
+    filename = f"neondeck-inventory-{datetime.utcnow():%Y%m%d%H%M%S}.{format}"
+    return StreamingResponse(
+        stream,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+async def _lines(request: Request) -> AsyncIterator[Tuple[int, str]]:
+    """Numbered text lines of the request body, decoded as the chunks arrive"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    number = 0
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            number += 1
+            yield number, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield number + 1, pending.rstrip("\r")
+
+
+async def _ndjson_records(request: Request) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    async for number, line in _lines(request):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Expected a JSON object"
+            continue
+        yield number, record, None
+
+
+async def _csv_records(request: Request) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    header = None
+    record, start, quotes = [], 0, 0
+    async for number, line in _lines(request):
+        if not record:
+            start = number
+        record.append(line)
+        # An odd number of quotes means a quoted field continues on the next line
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        text = "\n".join(record)
+        record, quotes = [], 0
+        if not text.strip():
+            continue
+
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [column.strip() for column in values]
+            continue
+        if len(values) != len(header):
+            yield start, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Empty cells are "not given", not empty strings
+        yield start, {column: value for column, value in zip(header, values) if value != ""}, None
+
+    if record:
+        yield start, None, "Unterminated quoted field"
+
+
+class InventoryImporter:
+    """
+    Writes imported rows in batches
+
+    Services are upserted by URL: existing services get the fields present
+    in the row, new ones the model defaults for missing fields (imported
+    services count as manual unless the row says otherwise). Categories
+    are upserted by name, and created on first reference by a service.
+    """
+
+    def __init__(self, db: AsyncSession, batch_size: int = None):
+        self.db = db
+        self.batch_size = batch_size or IMPORT_BATCH_SIZE
+        self.category_ids: Dict[str, int] = {}
+        self._batch: Dict[str, Tuple[int, dict]] = {}
+        self.rows = 0
+        self.imported = 0
+        self.categories = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    async def load_categories(self):
+        result = await self.db.execute(select(Category.name, Category.id))
+        self.category_ids = {name: category_id for name, category_id in result}
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    @staticmethod
+    def db_error(e: Exception) -> str:
+        """First line of the database's message"""
+        return str(getattr(e, "orig", e)).splitlines()[0]
+
+    async def add(self, line: int, record: dict):
+        """Validate one record and queue it for the next batch"""
+        self.rows += 1
+        kind = record.pop("type", "service")
+        try:
+            if kind == "category":
+                await self._upsert_category(line, ImportedCategory(**record))
+            elif kind == "service":
+                service = ImportedService(**record)
+                # A URL repeated within a batch: the last row wins
+                self._batch[service.url] = (line, service.model_dump(exclude_unset=True))
+                if len(self._batch) >= self.batch_size:
+                    await self.flush()
+            else:
+                self.error(line, f"Unknown record type: {kind!r}")
+        except ValidationError as e:
+            self.error(line, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+
+    async def _upsert_category(self, line: int, category: ImportedCategory):
+        values = category.model_dump(exclude_unset=True)
+        table = Category.__table__
+        stmt = _upsert_insert(table).values(**values)
+        updates = {key: stmt.excluded[key] for key in values if key != "name"}
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.name], set_=updates) if updates else stmt.on_conflict_do_nothing(index_elements=[table.c.name])
+        try:
+            async with self.db.begin_nested():
+                await self.db.execute(stmt)
+        except SQLAlchemyError as e:
+            self.error(line, self.db_error(e))
+            return
+        self.categories += 1
+        if category.name not in self.category_ids:
+            await self.load_categories()
+
+    async def _create_categories(self, names: set) -> Dict[str, str]:
+        """
+        Create the categories services refer to
+        
+        Returns:
+            name -> error of the names the database refused
+        """
+        table = Category.__table__
+        stmt = _upsert_insert(table).on_conflict_do_nothing(index_elements=[table.c.name])
+        failed = {}
+        try:
+            async with self.db.begin_nested():
+                await self.db.execute(stmt, [{"name": name} for name in names])
+        except SQLAlchemyError:
+            # Find the offending names one by one
+            for name in names:
+                try:
+                    async with self.db.begin_nested():
+                        await self.db.execute(stmt, [{"name": name}])
+                except SQLAlchemyError as e:
+                    failed[name] = self.db_error(e)
+        await self.load_categories()
+        return failed
+
+    def _statement(self, given: Tuple[str, ...]):
+        """Upsert of rows with the `given` fields: existing services only take those"""
+        table = Service.__table__
+        stmt = _upsert_insert(table)
+        updates = {key: stmt.excluded[key] for key in given if key not in ("url", "category")}
+        if "category" in given:
+            updates["category_id"] = stmt.excluded.category_id
+            if "is_category_manual" not in given:
+                updates["is_category_manual"] = stmt.excluded.is_category_manual
+        updates["updated_at"] = stmt.excluded.updated_at
+        return stmt.on_conflict_do_update(index_elements=[table.c.url], set_=updates)
+
+    def _values(self, given: dict, now: datetime) -> dict:
+        """Column values of a new row"""
+        values = dict(given)
+        if "category" in values:
+            category = values.pop("category")
+            values["category_id"] = self.category_ids.get(category) if category else None
+            values.setdefault("is_category_manual", True)
+        values.setdefault("is_manual", True)
+        values["updated_at"] = now
+        return values
+
+    async def flush(self):
+        """Upsert the queued services, one statement per set of given fields"""
+        if not self._batch:
+            return
+        batch, self._batch = list(self._batch.values()), {}
+
+        names = {given["category"] for _, given in batch if given.get("category")}
+        if names - self.category_ids.keys():
+            failed = await self._create_categories(names - self.category_ids.keys())
+            for line, given in batch:
+                if given.get("category") in failed:
+                    self.error(line, f"Category {given['category']!r}: {failed[given['category']]}")
+            batch = [(line, given) for line, given in batch if given.get("category") not in failed]
+
+        now = datetime.utcnow()
+        groups: Dict[Tuple[str, ...], List[Tuple[int, dict]]] = {}
+        for line, given in batch:
+            groups.setdefault(tuple(given), []).append((line, self._values(given, now)))
+
+        for given, rows in groups.items():
+            stmt = self._statement(given)
+            try:
+                async with self.db.begin_nested():
+                    await self.db.execute(stmt, [values for _, values in rows])
+                self.imported += len(rows)
+            except Exception:
+                # Find the offending rows one by one
+                for line, values in rows:
+                    try:
+                        async with self.db.begin_nested():
+                            await self.db.execute(stmt, [values])
+                        self.imported += 1
+                    except Exception as e:
+                        self.error(line, self.db_error(e))
+        await self.db.commit()
+
+
+@router.post("/inventory/import", response_model=ImportResponse)
+async def import_inventory(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$")
+):
+    """
+    Import an inventory from the raw request body
+
+    Accepts the export's NDJSON (records with "type": "category" or
+    "service") or CSV (one service per row, header required). The format
+    comes from the query string, else from the Content-Type. Each batch of
+    INVENTORY_IMPORT_BATCH services is committed as it is written; rows
+    that fail validation or the database are reported by line number.
+    """
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    records = _csv_records(request) if format == "csv" else _ndjson_records(request)
+
+    started = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        importer = InventoryImporter(db)
+        await importer.load_categories()
+        try:
+            async for line, record, error in records:
+                if error:
+                    importer.rows += 1
+                    importer.error(line, error)
+                else:
+                    await importer.add(line, record)
+            await importer.flush()
+            await db.commit()
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="Body is not valid UTF-8")
+        finally:
+            # Batches were committed as they were written, even when the import stopped early
+            await read_model.notify(since=started)
+
+    logger.info(
+        f"Imported {importer.imported} services and {importer.categories} categories "
+        f"({importer.failed} of {importer.rows} rows failed)"
+    )
+    return {
+        "rows": importer.rows,
+        "imported": importer.imported,
+        "categories": importer.categories,
+        "failed": importer.failed,
+        "errors": importer.errors,
+    }
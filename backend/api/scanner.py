@@ -2,17 +2,25 @@
 Scanner API endpoints for NeonDeck
 """
 import os
+import asyncio
+import ipaddress
 import logging
-from typing import List, Optional
-from datetime import datetime
-from fastapi import APIRouter, Depends, BackgroundTasks
-from sqlalchemy import select, delete, func
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, delete, func, insert, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 
 from database import get_db, AsyncSessionLocal
-from models import Service, Category, ScanHistory
-from scanner import NetworkScanner, HTTPProbe, ServiceCategorizer
+from jobs import enqueue_scan, enqueue_resume, get_active_job
+from models import Service, Category, ScanHistory, ScanChange, ScanUnit
+from readmodel import read_model
+
+# The scanning stack (nmap, httpx, bs4...) is imported when a scan runs, not
+# when the API starts: most workers only serve reads
+if TYPE_CHECKING:
+    from scanner import CategoryClassifier, ServiceCategorizer
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -20,11 +28,66 @@ logger = logging.getLogger(__name__)
 # Keep only the last N scan history entries
 MAX_SCAN_HISTORY = 30
 
+# The change log is compact, keep it much longer than the history
+SCAN_CHANGE_RETENTION_DAYS = int(os.getenv("SCAN_CHANGE_RETENTION_DAYS", "365"))
+
+# Changes younger than this many seconds are left for the next /scan/changes call,
+# for earlier ones whose transaction commits late
+SCAN_CHANGES_SKEW = int(os.getenv("SCAN_CHANGES_SKEW", "30"))
+
+# Manual scans are claimed before scheduled ones
+MANUAL_SCAN_PRIORITY = 10
+
+# Every port of every subnet is scanned at least this often, other scans trim ports by history
+FULL_SWEEP_HOURS = int(os.getenv("SCAN_FULL_SWEEP_HOURS", "24"))
+
+# A full sweep is due this fraction of FULL_SWEEP_HOURS early, so scans running once per
+# FULL_SWEEP_HOURS (the daily scan, schedules despite their jitter) sweep every time
+# instead of every other time. Networks scanned more often are swept about every 18h by default.
+FULL_SWEEP_SLACK = float(os.getenv("SCAN_FULL_SWEEP_SLACK", "0.25"))
+
+# Services updated this long before the classifier's last sync are read again,
+# in case their transaction committed after it
+CLASSIFIER_SYNC_OVERLAP = 60
+
+# Scans are checkpointed per unit: a network, or a /SCAN_UNIT_PREFIX shard of a larger one
+SCAN_UNIT_PREFIX = int(os.getenv("SCAN_UNIT_PREFIX", "20"))
+
+# A unit taking longer than this (seconds, 0: no limit) fails and is retried after the others
+SCAN_UNIT_TIMEOUT = float(os.getenv("SCAN_UNIT_TIMEOUT", "3600"))
+SCAN_UNIT_RETRIES = int(os.getenv("SCAN_UNIT_RETRIES", "1"))
+
 
 class ScanStatus(BaseModel):
     status: str
     message: str
     scan_id: Optional[int] = None
+    job_id: Optional[int] = None
+    progress: Optional[dict] = None
+
+
+class ServiceChange(BaseModel):
+    service_id: int
+    name: Optional[str]
+    url: Optional[str]
+    kind: str
+    fields: Optional[Dict[str, list]] = None
+
+
+class ScanDiffResponse(BaseModel):
+    scan_id: int
+    added: List[ServiceChange]
+    removed: List[ServiceChange]
+    changed: List[ServiceChange]
+
+
+class ScanChangesResponse(BaseModel):
+    since: int
+    cursor: int
+    has_more: bool
+    added: List[ServiceChange]
+    removed: List[ServiceChange]
+    changed: List[ServiceChange]
 
 
 class ScanHistoryResponse(BaseModel):
@@ -36,137 +99,658 @@ class ScanHistoryResponse(BaseModel):
     removed_services: int
     status: str
     error_message: Optional[str]
+    rate_limit: Optional[dict] = None
 
     class Config:
         from_attributes = True
 
 
-async def perform_scan():
-    """Background task to perform network scan"""
-    logger.info("Starting network scan")
+class ScanUnitResponse(BaseModel):
+    id: int
+    network: str
+    status: str
+    attempts: int
+    hosts: int
+    services_found: int
+    new_services: int
+    removed_services: int
+    changed_services: int
+    error_message: Optional[str]
+    started_at: Optional[str]
+    completed_at: Optional[str]
+    agent_id: Optional[int] = None
+
+
+def certificate_columns(certificate: Optional[dict]) -> dict:
+    """Service columns holding the certificate a probe saw"""
+    return {
+        "certificate": certificate,
+        "cert_expires_at": datetime.fromisoformat(certificate['not_after']) if certificate else None,
+    }
+
+
+def default_ports() -> List[int]:
+    """SCAN_PORTS, scanned when a scan or an agent has no ports of its own"""
+    ports_str = os.getenv("SCAN_PORTS", "80,443,8080,8443,3000,5000,5001,8000,8081,9000,9090")
+    return [int(p.strip()) for p in ports_str.split(",")]
+
+
+# Octet combinations expanded for one nmap range target, larger ones can't be matched
+MAX_TARGET_PREFIXES = 4096
+
+
+def _octet_values(spec: str) -> Optional[List[int]]:
+    """Values of one octet of an nmap IPv4 range ("10", "1-50", "*", "1,5-7")"""
+    values = []
+    for item in spec.split(","):
+        low, _, high = ("0-255" if item == "*" else item).partition("-")
+        if not low.isdigit() or (high and not high.isdigit()):
+            return None
+        low, high = int(low), int(high or low)
+        if not 0 <= low <= high <= 255:
+            return None
+        values.extend(range(low, high + 1))
+    return sorted(set(values))
+
+
+def target_networks(target: str) -> Optional[list]:
+    """
+    ip_network objects covering an nmap target
+    
+    Handles CIDR networks, single addresses and IPv4 octet ranges such as
+    192.168.1.1-50 or 10.0.1-3.*.
+    
+    Returns:
+        The networks, None for targets that can't be matched by address (host names,
+        ranges of more than MAX_TARGET_PREFIXES /24s)
+    """
+    target = target.strip()
+    try:
+        return [ipaddress.ip_network(target, strict=False)]
+    except ValueError:
+        pass
+    octets = target.split(".")
+    if len(octets) != 4:
+        return None
+    values = [_octet_values(octet) for octet in octets]
+    if None in values:
+        return None
+    prefixes = len(values[0]) * len(values[1]) * len(values[2])
+    if prefixes > MAX_TARGET_PREFIXES:
+        return None
+    
+    # Runs of consecutive last octets, each summarized into networks
+    runs = []
+    for value in values[3]:
+        if runs and value == runs[-1][1] + 1:
+            runs[-1][1] = value
+        else:
+            runs.append([value, value])
+    networks = []
+    for a in values[0]:
+        for b in values[1]:
+            for c in values[2]:
+                for low, high in runs:
+                    networks.extend(ipaddress.summarize_address_range(
+                        ipaddress.IPv4Address(f"{a}.{b}.{c}.{low}"), ipaddress.IPv4Address(f"{a}.{b}.{c}.{high}")
+                    ))
+    return networks
+
+
+def parse_networks(networks: List[str]) -> list:
+    """ip_network objects covering nmap targets, skipping host names"""
+    parsed = []
+    for network in networks:
+        parsed.extend(target_networks(network) or [])
+    return parsed
+
+
+def plan_units(networks: List[str], prefix: int = None) -> List[str]:
+    """
+    Split the networks of a scan into units
+    
+    IPv4 networks larger than a /prefix are split into /prefix shards, so
+    an interrupted scan of a large range resumes close to where it stopped.
+    Smaller networks, IPv6 ones and other nmap targets stay whole.
+    
+    Args:
+        networks: CIDR networks (or nmap targets)
+        prefix: Largest unit (default: SCAN_UNIT_PREFIX)
+    """
+    prefix = prefix or SCAN_UNIT_PREFIX
+    units = []
+    for network in networks:
+        network = network.strip()
+        try:
+            parsed = ipaddress.ip_network(network, strict=False)
+        except ValueError:
+            units.append(network)
+            continue
+        if parsed.version == 4 and parsed.prefixlen < prefix:
+            units.extend(str(subnet) for subnet in parsed.subnets(new_prefix=prefix))
+        else:
+            units.append(str(parsed))
+    return units
+
+
+def in_networks(ip: Optional[str], networks: list) -> bool:
+    """True when an address belongs to one of the networks"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except (TypeError, ValueError):
+        return False
+    return any(address in network for network in networks)
+
+
+async def reconcile_services(
+    db: AsyncSession,
+    web_services: List[dict],
+    categorizer: "ServiceCategorizer",
+    scan_id: Optional[int] = None,
+    scope: Optional[List[str]] = None,
+    outside: bool = False
+) -> Dict[str, int]:
+    """
+    Merge probe results into the services table
+    
+    Creates new services, refreshes the ones seen again and marks the
+    missing ones as inactive. Added, removed and changed sets come from
+    set operations between the probed URLs and the known ones, and each
+    change is recorded as a ScanChange row when scan_id is given. Results
+    of one application reached through several endpoints collapse into
+    one service listing the others as aliases; a known service that turns
+    out to be an alias of another goes inactive. The caller is
+    responsible for committing.
+    
+    Args:
+        db: Database session
+        web_services: Results from HTTPProbe.probe_multiple
+        categorizer: Categorizer used for newly discovered services, its
+            classifier (if any) is synced with the manual categorizations first
+        scan_id: ScanHistory entry the changes belong to (default: don't record them)
+        scope: Networks the scan covered; only their services can go inactive
+            (none for host name targets, see target_networks)
+            (default: every service)
+        outside: Only the services outside the scope can go inactive instead
+        
+    Returns:
+        Number of new, removed and changed services
+    """
+    from scanner import collapse_aliases
+    
+    existing_services = {}
+    hidden_urls = set()  # URLs that user has hidden - don't recreate them
+    
+    # Get existing services (including hidden ones to avoid re-creating them)
+    result = await db.execute(select(Service))
+    for service in result.scalars():
+        if service.is_hidden:
+            hidden_urls.add(service.url)
+        else:
+            existing_services[service.url] = service
+    
+    # Get categories
+    cat_result = await db.execute(select(Category))
+    categories = {cat.name: cat for cat in cat_result.scalars()}
+    
+    # One result per application, known URLs stay canonical
+    probed = collapse_aliases(
+        web_services,
+        known={url: service.fingerprint for url, service in existing_services.items()}
+    )
+    
+    known_urls = set(existing_services)
+    probed_urls = set(probed)
+    added_urls = probed_urls - known_urls - hidden_urls
+    seen_urls = probed_urls & known_urls
+    missing_urls = known_urls - probed_urls
+    if scope is not None:
+        scanned = parse_networks(scope)
+        missing_urls = {
+            url for url in missing_urls
+            if in_networks(existing_services[url].ip_address, scanned) != outside
+        }
+    
+    now = datetime.utcnow()
+    changes = []  # (service, kind, fields)
+    
+    for url in seen_urls:
+        # Update existing service
+        service = existing_services[url]
+        web_service = probed[url]
+        hostname = (web_service.get('hostname') or '')[:255] or None
+        
+        fields = {}
+        if service.status != 'active':
+            fields['status'] = [service.status, 'active']
+        # Keep the known name when this scan's lookup failed
+        if hostname and hostname != service.hostname:
+            fields['hostname'] = [service.hostname, hostname]
+            service.hostname = hostname
+        version = (web_service.get('version') or '')[:100] or None
+        if version != service.version:
+            fields['version'] = [service.version, version]
+            service.version = version
+        
+        service.last_seen = now
+        service.response_time = web_service.get('response_time')
+        service.status = 'active'
+        service.fingerprint = (web_service.get('fingerprint') or {}).get('key') or service.fingerprint
+        if web_service['aliases'] != (service.aliases or []):
+            service.aliases = web_service['aliases']
+        certificate = web_service.get('certificate')
+        if (service.certificate or {}).get('sha256') != (certificate or {}).get('sha256'):
+            for column, value in certificate_columns(certificate).items():
+                setattr(service, column, value)
+        if fields:
+            changes.append((service, 'changed', fields))
+    
+    # Iterate in probe order so ids follow discovery order
+    added = [(url, web_service) for url, web_service in probed.items() if url in added_urls]
+    if added and categorizer.classifier is not None:
+        await train_classifier(db, categorizer.classifier)
+    # One batch for the classifier, the rules take what it isn't sure about
+    category_names = categorizer.categorize_batch(
+        [(web_service.get('title', ''), url, web_service.get('description')) for url, web_service in added],
+        categories
+    )
+    
+    for (url, web_service), category_name in zip(added, category_names):
+        # Create new service
+        category = categories.get(category_name)
+        
+        # Truncate favicon_url to fit DB column (512 chars max)
+        favicon_url = web_service.get('favicon')
+        if favicon_url and len(favicon_url) > 500:
+            favicon_url = None  # Skip SVG data URIs that are too long
+        
+        service = Service(
+            name=web_service.get('title', f"{web_service['ip']}:{web_service['port']}")[:255],
+            url=url[:500],
+            description=web_service.get('description'),
+            favicon_url=favicon_url,
+            category_id=category.id if category else None,
+            ip_address=web_service['ip'],
+            hostname=(web_service.get('hostname') or '')[:255] or None,
+            port=web_service['port'],
+            protocol=web_service['protocol'],
+            version=(web_service.get('version') or '')[:100] or None,
+            response_time=web_service.get('response_time'),
+            status='active',
+            fingerprint=(web_service.get('fingerprint') or {}).get('key'),
+            aliases=web_service['aliases'],
+            is_manual=False,
+            is_category_manual=False,
+            # Always given, rows with the same columns are inserted in one statement
+            **certificate_columns(web_service.get('certificate'))
+        )
+        db.add(service)
+        changes.append((service, 'added', None))
+    
+    # Mark services not seen as inactive
+    for url in missing_urls:
+        service = existing_services[url]
+        if service.is_manual or service.status == 'inactive':
+            continue
+        changes.append((service, 'removed', {'status': [service.status, 'inactive']}))
+        service.status = 'inactive'
+    
+    if scan_id is not None and changes:
+        await db.flush()  # Assign ids to the new services
+        # Stamped at insert, the transaction commits right after (see get_changes_since)
+        recorded = datetime.utcnow()
+        await db.execute(insert(ScanChange), [
+            {"scan_id": scan_id, "service_id": service.id, "kind": kind, "fields": fields, "created_at": recorded}
+            for service, kind, fields in changes
+        ])
+    
+    counts = {"new": 0, "removed": 0, "changed": 0}
+    for _, kind, _ in changes:
+        counts["new" if kind == "added" else kind] += 1
+    return counts
+
+
+async def train_classifier(db: AsyncSession, classifier: "CategoryClassifier"):
+    """
+    Bring the classifier up to date with the manually categorized services
+    
+    The first call learns every manual categorization. Later ones only
+    read the services updated since the previous sync: manual ones are
+    learned again (relearning replaces), the ones no longer manually
+    categorized are forgotten.
+    """
+    synced_at = datetime.utcnow()
+    query = (
+        select(
+            Service.id, Service.name, Service.url, Service.description,
+            Category.name, Service.is_category_manual
+        )
+        .outerjoin(Category, Service.category_id == Category.id)
+    )
+    if classifier.synced_at is None:
+        query = query.where(Service.is_category_manual == True)
+    else:
+        query = query.where(
+            Service.updated_at > classifier.synced_at - timedelta(seconds=CLASSIFIER_SYNC_OVERLAP),
+            or_(Service.is_category_manual == True, Service.id.in_(classifier.sample_ids()))
+        )
+    
+    result = await db.execute(query)
+    for service_id, name, url, description, category, is_category_manual in result:
+        if is_category_manual and category:
+            classifier.learn(service_id, category, name, url, description)
+        else:
+            classifier.forget(service_id)
+    classifier.synced_at = synced_at
+    logger.debug(f"Category classifier: {len(classifier)} manually categorized services")
+
+
+async def known_response_times(db: AsyncSession) -> Dict[tuple, int]:
+    """
+    Response times recorded by previous scans, to size probe timeouts
+    
+    Returns:
+        (ip, port) -> slowest response time in ms among the services on that endpoint
+    """
+    result = await db.execute(
+        select(Service.ip_address, Service.port, Service.response_time)
+        .where(Service.status == 'active', Service.response_time.isnot(None))
+    )
+    response_times = {}
+    for ip, port, response_time in result:
+        key = (str(ip), port)
+        response_times[key] = max(response_time, response_times.get(key, 0))
+    return response_times
+
+
+async def port_history(db: AsyncSession, prefix: int = 24) -> Dict[str, Dict[int, int]]:
+    """
+    How often each port was found open, per subnet
+    
+    Counts every known service, inactive and hidden ones included, so a
+    port that ever served something in a subnet keeps being scanned there.
+    
+    Returns:
+        subnet CIDR -> {port: number of services}
+    """
+    result = await db.execute(
+        select(Service.ip_address, Service.port, func.count())
+        .where(Service.ip_address.isnot(None), Service.port.isnot(None))
+        .group_by(Service.ip_address, Service.port)
+    )
+    history = {}
+    for ip, port, count in result:
+        try:
+            subnet = str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+        except ValueError:
+            continue
+        ports = history.setdefault(subnet, {})
+        ports[port] = ports.get(port, 0) + count
+    return history
+
+
+async def full_sweep_due(db: AsyncSession, network: str) -> bool:
+    """
+    True when no full sweep of a unit's network completed within
+    FULL_SWEEP_HOURS, less FULL_SWEEP_SLACK
+    
+    Compared with the start of the last sweep, which is a scan interval
+    (plus the scheduler's jitter) before this one when scans run once per
+    FULL_SWEEP_HOURS.
+    """
+    since = datetime.utcnow() - timedelta(hours=FULL_SWEEP_HOURS * (1 - FULL_SWEEP_SLACK))
+    result = await db.execute(
+        select(ScanUnit.id)
+        .where(
+            ScanUnit.network == network,
+            ScanUnit.status == "completed",
+            ScanUnit.full_sweep.is_(True),
+            ScanUnit.started_at >= since
+        )
+        .limit(1)
+    )
+    return result.first() is None
+
+
+async def resolve_hostnames(hosts: List[dict]) -> dict:
+    """
+    Hostnames of discovered hosts
+    
+    Uses the name nmap found when it resolved hosts itself, the shared
+    reverse DNS cache otherwise.
+    
+    Returns:
+        ip -> hostname (None when unknown)
+    """
+    from scanner import resolver
+    
+    hostnames = {host['ip']: host.get('hostname') for host in hosts}
+    unresolved = [ip for ip, hostname in hostnames.items() if not hostname]
+    if unresolved:
+        hostnames.update(await resolver.resolve_many(unresolved))
+    return hostnames
+
+
+async def perform_scan(
+    scan_id: Optional[int] = None,
+    networks: Optional[List[str]] = None,
+    ports: Optional[List[int]] = None,
+    progress: Optional[Callable[[dict], Awaitable[None]]] = None,
+    on_start: Optional[Callable[[int], Awaitable[None]]] = None,
+    full_sweep: Optional[bool] = None,
+    units: Optional[List[int]] = None
+) -> ScanHistory:
+    """
+    Perform a network scan
+    
+    The networks are split into units (see plan_units), scanned one after
+    the other. Each unit's services are committed together with the unit's
+    completion, so a scan interrupted midway (the worker's lease expired
+    and the job was claimed again) resumes after the last completed unit
+    instead of starting over. A unit that fails or exceeds SCAN_UNIT_TIMEOUT
+    is retried up to SCAN_UNIT_RETRIES times once the others are done, and
+    can be retried later on its own (POST /api/scan/{id}/retry).
+    
+    Args:
+        scan_id: ScanHistory entry of a previous attempt to resume (default: create a new one)
+        networks: Networks to scan (default: SCAN_NETWORKS and the enabled schedules' networks)
+        ports: Ports to scan (default: SCAN_PORTS)
+        progress: Async callback receiving a progress dict at each stage
+        on_start: Async callback receiving the ScanHistory id once it exists
+        full_sweep: Scan every port instead of the ports seen in each subnet (default: decided
+            per unit, when no full sweep of its network completed in the last SCAN_FULL_SWEEP_HOURS)
+        units: ScanUnit ids to run (default: every unit not completed yet)
+        
+    Returns:
+        The ScanHistory entry, completed, or failed when a unit still failed
+    """
+    from scanner import NetworkScanner, HTTPProbe, ServiceCategorizer, ScanRateLimiter, category_classifier
+    
+    started = datetime.utcnow()
+    
+    async def report(stage: str, **counts):
+        if progress:
+            await progress({"stage": stage, **counts})
     
     # Create own DB session for background task
     async with AsyncSessionLocal() as db:
         # Créer un enregistrement de scan
-        scan = ScanHistory(
-            started_at=datetime.utcnow(),
-            status="running",
-            scan_config={
-                "networks": os.getenv("SCAN_NETWORKS", "192.168.1.0/24").split(","),
-                "ports": os.getenv("SCAN_PORTS", "80,443,8080,8443,3000,5000,5001,8000,9000").split(",")
-            }
-        )
-        db.add(scan)
+        scan = await db.get(ScanHistory, scan_id) if scan_id else None
+        if scan is None:
+            scan = ScanHistory(started_at=started)
+            db.add(scan)
+        config = scan.scan_config or {}
+        if config.get("networks"):
+            # A resumed scan keeps the parameters of its first attempt
+            networks, ports = config["networks"], config.get("ports")
+            scope = networks if config.get("scoped") else None
+            full_sweep = config.get("full_sweep", full_sweep)
+        else:
+            # A scan of given networks (a schedule) leaves the services of the others alone
+            scope = networks or None
+            if not networks:
+                # A scan of every network also covers the ones only schedules scan
+                from schedules import schedule_networks
+                networks = os.getenv("SCAN_NETWORKS", "192.168.1.0/24").split(",")
+                networks += [network for network in await schedule_networks(db) if network not in networks]
+        if not ports:
+            ports = default_ports()
+        
+        scan.status = "running"
+        scan.error_message = None
+        scan.completed_at = None
+        scan.scan_config = {**config, "networks": networks, "ports": ports, "scoped": scope is not None, "full_sweep": full_sweep}
+        await db.flush()
+        scan_id = scan.id
+        
+        result = await db.execute(select(ScanUnit).where(ScanUnit.scan_id == scan_id).order_by(ScanUnit.id))
+        planned = result.scalars().all()
+        if not planned:
+            planned = [ScanUnit(scan_id=scan_id, network=network, status="pending") for network in plan_units(networks)]
+            db.add_all(planned)
         await db.commit()
-        await db.refresh(scan)
+        if on_start:
+            await on_start(scan_id)
+        
+        todo = [unit.id for unit in planned if unit.status != "completed" and (units is None or unit.id in units)]
+        total = len(planned)
+        done = total - len(todo)
+        if done:
+            logger.info(f"Resuming scan {scan_id}: {done} of {total} units already done, {len(todo)} to go")
+        else:
+            logger.info(f"Starting network scan {scan_id} of {networks} in {total} units")
         
         try:
-            # Configuration du scan
-            networks = os.getenv("SCAN_NETWORKS", "192.168.1.0/24").split(",")
-            ports_str = os.getenv("SCAN_PORTS", "80,443,8080,8443,3000,5000,5001,8000,8081,9000,9090")
-            ports = [int(p.strip()) for p in ports_str.split(",")]
-            
             # Initialize scanners
-            network_scanner = NetworkScanner(networks, ports)
-            http_probe = HTTPProbe()
-            categorizer = ServiceCategorizer()
-            
-            # Scan network for hosts
-            logger.info(f"Scanning networks: {networks}")
-            hosts = await network_scanner.scan_all_networks()
-            
-            # Probe HTTP services
-            logger.info(f"Probing {len(hosts)} hosts for web services")
-            web_services = await http_probe.probe_multiple(hosts)
-            
-            logger.info(f"Found {len(web_services)} web services")
-            
-            # Process discovered services
-            new_services_count = 0
-            existing_services = {}
-            hidden_urls = set()  # URLs that user has hidden - don't recreate them
-            
-            # Get existing services (including hidden ones to avoid re-creating them)
-            result = await db.execute(select(Service))
-            for service in result.scalars():
-                if service.is_hidden:
-                    hidden_urls.add(service.url)
-                else:
-                    existing_services[service.url] = service
-            
-            # Get categories
-            cat_result = await db.execute(select(Category))
-            categories = {cat.name: cat for cat in cat_result.scalars()}
-            
-            # Track URLs we've already processed in this batch
-            seen_urls = set()
+            # One limiter for both stages, so probes don't burst into a subnet nmap just swept
+            rate_limiter = ScanRateLimiter()
+            network_scanner = NetworkScanner(
+                networks,
+                ports,
+                rate_limiter=rate_limiter,
+                port_history=await port_history(db)
+            )
+            http_probe = HTTPProbe(rate_limiter=rate_limiter)
+            categorizer = ServiceCategorizer(category_classifier if category_classifier.enabled else None)
+            response_times = await known_response_times(db)
             
-            for web_service in web_services:
-                url = web_service['url']
+            async def probe_unit(network: str, sweep: bool) -> tuple:
+                # Scan the unit for hosts
+                await report("discovery", network=network, units=total, units_done=done)
+                hosts = await network_scanner.scan_network(network, full_sweep=sweep)
                 
-                # Skip if we've already processed this URL in this batch
-                if url in seen_urls:
-                    continue
-                seen_urls.add(url)
+                # Probe HTTP services, resolving hostnames in the meantime
+                await report("probing", network=network, units=total, units_done=done, hosts=len(hosts))
+                web_services, hostnames = await asyncio.gather(
+                    http_probe.probe_multiple(hosts, response_times),
+                    resolve_hostnames(hosts)
+                )
+                for web_service in web_services:
+                    web_service['hostname'] = hostnames.get(web_service['ip'])
+                return hosts, web_services
+            
+            async def run_unit(unit_id: int) -> bool:
+                nonlocal done
+                unit = await db.get(ScanUnit, unit_id)
+                network = unit.network
+                # Each network is swept on its own cadence, whichever schedules scan it
+                sweep = full_sweep if full_sweep is not None else await full_sweep_due(db, network)
+                unit.status = "running"
+                unit.attempts = (unit.attempts or 0) + 1
+                unit.started_at = datetime.utcnow()
+                unit.error_message = None
+                # Single discovery scans every port anyway
+                unit.full_sweep = sweep or network_scanner.discovery == "single"
+                await db.commit()
                 
-                # Skip hidden services (user deleted them)
-                if url in hidden_urls:
-                    continue
+                try:
+                    hosts, web_services = await asyncio.wait_for(probe_unit(network, sweep), SCAN_UNIT_TIMEOUT or None)
+                    await report("reconciling", network=network, units=total, units_done=done, services=len(web_services))
+                    counts = await reconcile_services(db, web_services, categorizer, scan_id, scope=[network])
+                    unit.status = "completed"
+                    unit.hosts = len(hosts)
+                    unit.services_found = len(web_services)
+                    unit.new_services = counts["new"]
+                    unit.removed_services = counts["removed"]
+                    unit.changed_services = counts["changed"]
+                    unit.completed_at = datetime.utcnow()
+                    # The checkpoint: the unit's services and its completion in one transaction
+                    await db.commit()
+                except Exception as e:
+                    error = f"Timed out after {SCAN_UNIT_TIMEOUT}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+                    logger.warning(f"Scan {scan_id}: unit {network} failed (attempt {unit.attempts}): {error}")
+                    await db.rollback()
+                    unit = await db.get(ScanUnit, unit_id)
+                    unit.status = "failed"
+                    unit.error_message = error
+                    unit.completed_at = datetime.utcnow()
+                    await db.commit()
+                    return False
                 
-                if url in existing_services:
-                    # Update existing service
-                    service = existing_services[url]
-                    service.last_seen = datetime.utcnow()
-                    service.response_time = web_service.get('response_time')
-                    service.status = 'active'
-                else:
-                    # Create new service
-                    category_name = categorizer.categorize(
-                        web_service.get('title', ''),
-                        url,
-                        web_service.get('description')
-                    )
-                    
-                    category = categories.get(category_name)
-                    
-                    # Truncate favicon_url to fit DB column (512 chars max)
-                    favicon_url = web_service.get('favicon')
-                    if favicon_url and len(favicon_url) > 500:
-                        favicon_url = None  # Skip SVG data URIs that are too long
-                    
-                    service = Service(
-                        name=web_service.get('title', f"{web_service['ip']}:{web_service['port']}")[:255],
-                        url=url[:500],
-                        description=web_service.get('description'),
-                        favicon_url=favicon_url,
-                        category_id=category.id if category else None,
-                        ip_address=web_service['ip'],
-                        port=web_service['port'],
-                        protocol=web_service['protocol'],
-                        response_time=web_service.get('response_time'),
-                        status='active',
-                        is_manual=False,
-                        is_category_manual=False
-                    )
-                    db.add(service)
-                    existing_services[url] = service  # Track to prevent duplicates
-                    new_services_count += 1
+                done += 1
+                logger.info(f"Scan {scan_id}: unit {network} done ({done}/{total}), {len(web_services)} services")
+                await read_model.notify(since=started)
+                return True
             
-            # Mark services not seen as inactive
-            scanned_urls = {ws['url'] for ws in web_services}
-            for url, service in existing_services.items():
-                if url not in scanned_urls and not service.is_manual:
-                    service.status = 'inactive'
+            failed = [unit_id for unit_id in todo if not await run_unit(unit_id)]
+            for _ in range(SCAN_UNIT_RETRIES):
+                if not failed:
+                    break
+                logger.info(f"Scan {scan_id}: retrying {len(failed)} failed units")
+                failed = [unit_id for unit_id in failed if not await run_unit(unit_id)]
             
-            # Commit changes
-            await db.commit()
+            result = await db.execute(select(ScanUnit).where(ScanUnit.scan_id == scan_id).order_by(ScanUnit.id))
+            planned = result.scalars().all()
+            incomplete = [unit for unit in planned if unit.status != "completed"]
+            removed_elsewhere = 0
+            if scope is None and not incomplete:
+                # A scan of every network also retires the services outside them (SCAN_NETWORKS changed),
+                # except those of the agents' networks and of the schedules' current networks
+                # (added since a resumed scan was planned)
+                from agents import agent_networks
+                from schedules import schedule_networks
+                kept = list(networks)
+                for network in await agent_networks(db) + await schedule_networks(db):
+                    if network not in kept:
+                        kept.append(network)
+                # Addresses of host name targets are unknown, so nothing is outside them for sure
+                if all(target_networks(network) is not None for network in kept):
+                    counts = await reconcile_services(db, [], categorizer, scan_id, scope=kept, outside=True)
+                    removed_elsewhere = counts["removed"]
             
             # Update scan history
+            scan = await db.get(ScanHistory, scan_id)
             scan.completed_at = datetime.utcnow()
-            scan.status = "completed"
-            scan.services_found = len(web_services)
-            scan.new_services = new_services_count
+            scan.services_found = sum(unit.services_found or 0 for unit in planned)
+            scan.new_services = sum(unit.new_services or 0 for unit in planned)
+            scan.removed_services = sum(unit.removed_services or 0 for unit in planned) + removed_elsewhere
+            if incomplete:
+                scan.status = "failed"
+                scan.error_message = f"{len(incomplete)} of {total} units failed: " + ", ".join(
+                    f"{unit.network} ({unit.error_message or unit.status})" for unit in incomplete[:10]
+                )
+            else:
+                scan.status = "completed"
+            scan.scan_config = {
+                **scan.scan_config,
+                # Of the last attempt
+                "discovery": network_scanner.stats,
+                "rate_limit": rate_limiter.metrics(),
+                "fingerprints": http_probe.fingerprints.stats
+            }
             await db.commit()
+            await read_model.notify(since=started)
+            await report(
+                scan.status,
+                units=total,
+                units_done=total - len(incomplete),
+                hosts=sum(unit.hosts or 0 for unit in planned),
+                services=scan.services_found,
+                throttled_seconds=rate_limiter.metrics()["throttled_seconds"],
+                new=scan.new_services,
+                removed=scan.removed_services,
+                changed=sum(unit.changed_services or 0 for unit in planned)
+            )
             
             # Cleanup old scan history entries (keep only last MAX_SCAN_HISTORY)
             old_scans_query = (
@@ -178,46 +762,58 @@ async def perform_scan():
             old_scan_ids = [row[0] for row in old_scans.fetchall()]
             if old_scan_ids:
                 await db.execute(delete(ScanHistory).where(ScanHistory.id.in_(old_scan_ids)))
+                await db.execute(delete(ScanUnit).where(ScanUnit.scan_id.in_(old_scan_ids)))
                 await db.commit()
                 logger.info(f"Cleaned up {len(old_scan_ids)} old scan history entries")
             
-            logger.info(f"Scan completed. Found {len(web_services)} services, {new_services_count} new")
+            cutoff = datetime.utcnow() - timedelta(days=SCAN_CHANGE_RETENTION_DAYS)
+            await db.execute(delete(ScanChange).where(ScanChange.created_at < cutoff))
+            await db.commit()
+            
+            logger.info(
+                f"Scan {scan.status}. Found {scan.services_found} services, {scan.new_services} new, "
+                f"{scan.removed_services} removed, {len(incomplete)} of {total} units incomplete"
+            )
             
         except Exception as e:
             logger.error(f"Scan failed: {e}", exc_info=True)
+            await db.rollback()
+            scan = await db.get(ScanHistory, scan_id)
             scan.status = "failed"
             scan.error_message = str(e)
             scan.completed_at = datetime.utcnow()
             await db.commit()
+            await db.refresh(scan)
+    
+    return scan
 
 
 @router.post("/scan/trigger", response_model=ScanStatus)
 async def trigger_scan(
-    background_tasks: BackgroundTasks,
+    full: bool = Query(False, description="Scan every port, not only the ones seen in each subnet"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Trigger a network scan"""
-    # Check if scan is already running
-    result = await db.execute(
-        select(ScanHistory)
-        .where(ScanHistory.status == "running")
-        .order_by(ScanHistory.started_at.desc())
-    )
-    running_scan = result.scalar_one_or_none()
+    """
+    Queue a scan of every network for the scan workers, ahead of any scheduled scan
     
-    if running_scan:
+    Covers SCAN_NETWORKS and the networks of the enabled schedules (with
+    the default ports), so it retires no service they found.
+    """
+    # A scan of every network already running or queued is returned, not repeated
+    job = await enqueue_scan(db, priority=MANUAL_SCAN_PRIORITY, payload={"full_sweep": True} if full else None)
+    
+    if job.status == "running":
         return ScanStatus(
             status="running",
             message="A scan is already in progress",
-            scan_id=running_scan.id
+            scan_id=job.scan_id,
+            job_id=job.id
         )
     
-    # Start scan in background
-    background_tasks.add_task(perform_scan)
-    
     return ScanStatus(
-        status="started",
-        message="Network scan started"
+        status="queued",
+        message="Network scan queued",
+        job_id=job.id
     )
 
 
@@ -243,7 +839,8 @@ async def get_scan_history(
             "new_services": scan.new_services,
             "removed_services": scan.removed_services,
             "status": scan.status,
-            "error_message": scan.error_message
+            "error_message": scan.error_message,
+            "rate_limit": (scan.scan_config or {}).get("rate_limit")
         }
         for scan in scans
     ]
@@ -252,21 +849,225 @@ async def get_scan_history(
 @router.get("/scan/status", response_model=ScanStatus)
 async def get_scan_status(db: AsyncSession = Depends(get_db)):
     """Get current scan status"""
-    result = await db.execute(
-        select(ScanHistory)
-        .where(ScanHistory.status == "running")
-        .order_by(ScanHistory.started_at.desc())
-    )
-    running_scan = result.scalar_one_or_none()
+    return await scan_status(db)
+
+
+async def scan_status(db: AsyncSession) -> ScanStatus:
+    """Status of the queued or running scan, idle when there is none"""
+    job = await get_active_job(db)
     
-    if running_scan:
+    if job and job.status == "queued":
+        return ScanStatus(
+            status="queued",
+            message="Scan queued",
+            job_id=job.id
+        )
+    
+    if job:
         return ScanStatus(
             status="running",
             message="Scan in progress",
-            scan_id=running_scan.id
+            scan_id=job.scan_id,
+            job_id=job.id,
+            progress=job.progress
         )
     
     return ScanStatus(
         status="idle",
         message="No scan running"
     )
+
+
+async def _load_changes(db: AsyncSession, *conditions, limit: Optional[int] = None) -> list:
+    """
+    ScanChange rows matching conditions, with the service name and URL
+    
+    Oldest first by id, the order they were recorded in: units of
+    concurrent scans, and retries of finished ones, interleave.
+    """
+    result = await db.execute(
+        select(ScanChange, Service.name, Service.url)
+        .outerjoin(Service, Service.id == ScanChange.service_id)
+        .where(*conditions)
+        .order_by(ScanChange.id)
+        .limit(limit)
+    )
+    return result.all()
+
+
+def _change_dict(change: ScanChange, name: Optional[str], url: Optional[str], fields) -> dict:
+    return {
+        "service_id": change.service_id,
+        "name": name,
+        "url": url,
+        "kind": change.kind,
+        "fields": fields,
+    }
+
+
+def _split_by_kind(changes: List[dict], **header) -> dict:
+    diff = {**header, "added": [], "removed": [], "changed": []}
+    for change in changes:
+        diff[change["kind"]].append(change)
+    return diff
+
+
+def merge_changes(rows: list) -> List[dict]:
+    """
+    Collapse successive changes into the net change per service
+    
+    A service added then removed in the range disappears, field changes
+    keep the first old and the last new value, and fields back to their
+    original value are dropped. The kind follows the final status.
+    
+    Args:
+        rows: (ScanChange, name, url) rows, oldest first
+        
+    Returns:
+        One change dict per service that differs between both ends
+    """
+    net = {}
+    for change, name, url in rows:
+        entry = net.get(change.service_id)
+        if entry is None:
+            fields = {field: list(values) for field, values in (change.fields or {}).items()}
+            net[change.service_id] = _change_dict(change, name, url, fields)
+            continue
+        for field, (old, new) in (change.fields or {}).items():
+            if field in entry["fields"]:
+                entry["fields"][field][1] = new
+            else:
+                entry["fields"][field] = [old, new]
+    
+    merged = []
+    for entry in net.values():
+        status = entry["fields"].get("status")
+        if entry["kind"] == "added":
+            if status and status[1] == "inactive":
+                continue
+            entry["fields"] = None
+        else:
+            entry["fields"] = {field: values for field, values in entry["fields"].items() if values[0] != values[1]}
+            if not entry["fields"]:
+                continue
+            entry["kind"] = "removed" if status and status[1] == "inactive" else "changed"
+        merged.append(entry)
+    return merged
+
+
+@router.get("/scan/changes", response_model=ScanChangesResponse)
+async def get_changes_since(
+    since: int = Query(0, description="Cursor of the previous response (default: from the start)"),
+    limit: int = Query(1000, ge=1, le=10000, description="Change log entries merged per call"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Net service changes recorded after a cursor
+    
+    The cursor is a change log id rather than a scan id: units commit
+    their changes while their scan runs, scans overlap and retries add
+    changes to finished scans, so scan ids don't follow commit order.
+    Changes of the last SCAN_CHANGES_SKEW seconds are left for the next
+    call, in case an earlier change commits after them. At most `limit`
+    entries are merged, call again with the returned cursor right away
+    while `has_more` is true.
+    """
+    rows = await _load_changes(db, ScanChange.id > since, limit=limit + 1)
+    has_more = len(rows) > limit
+    horizon = datetime.utcnow() - timedelta(seconds=SCAN_CHANGES_SKEW)
+    settled = []
+    for row in rows[:limit]:
+        if row[0].created_at and row[0].created_at > horizon:
+            # The rest waits for the next poll
+            has_more = False
+            break
+        settled.append(row)
+    cursor = settled[-1][0].id if settled else since
+    return _split_by_kind(merge_changes(settled), since=since, cursor=cursor, has_more=has_more)
+
+
+@router.get("/scan/{scan_id}/diff", response_model=ScanDiffResponse)
+async def get_scan_diff(scan_id: int, db: AsyncSession = Depends(get_db)):
+    """Services added, removed and changed by one scan"""
+    rows = await _load_changes(db, ScanChange.scan_id == scan_id)
+    if not rows and await db.get(ScanHistory, scan_id) is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    changes = [_change_dict(change, name, url, change.fields) for change, name, url in rows]
+    return _split_by_kind(changes, scan_id=scan_id)
+
+
+@router.get("/scan/{scan_id}/units", response_model=List[ScanUnitResponse])
+async def get_scan_units(scan_id: int, db: AsyncSession = Depends(get_db)):
+    """Networks and shards of a scan, with their progress"""
+    result = await db.execute(select(ScanUnit).where(ScanUnit.scan_id == scan_id).order_by(ScanUnit.id))
+    units = result.scalars().all()
+    if not units and await db.get(ScanHistory, scan_id) is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    return [
+        {
+            "id": unit.id,
+            "network": unit.network,
+            "status": unit.status,
+            "attempts": unit.attempts or 0,
+            "hosts": unit.hosts or 0,
+            "services_found": unit.services_found or 0,
+            "new_services": unit.new_services or 0,
+            "removed_services": unit.removed_services or 0,
+            "changed_services": unit.changed_services or 0,
+            "error_message": unit.error_message,
+            "started_at": unit.started_at.isoformat() if unit.started_at else None,
+            "completed_at": unit.completed_at.isoformat() if unit.completed_at else None,
+            "agent_id": unit.agent_id,
+        }
+        for unit in units
+    ]
+
+
+@router.post("/scan/{scan_id}/retry", response_model=ScanStatus)
+async def retry_scan(
+    scan_id: int,
+    unit_id: Optional[int] = Query(None, description="Retry only this unit"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue the incomplete units of a scan again, with manual priority; completed ones are kept"""
+    from agents import is_agent_scan, requeue_units
+    
+    scan = await db.get(ScanHistory, scan_id)
+    if scan is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    query = select(ScanUnit.id).where(ScanUnit.scan_id == scan_id, ScanUnit.status != "completed")
+    if unit_id is not None:
+        unit = await db.get(ScanUnit, unit_id)
+        if unit is None or unit.scan_id != scan_id:
+            raise HTTPException(status_code=404, detail="Unit not found")
+        query = query.where(ScanUnit.id == unit_id)
+    result = await db.execute(query)
+    unit_ids = result.scalars().all()
+    if not unit_ids:
+        raise HTTPException(status_code=400, detail="Nothing to retry, the units are completed")
+    
+    if is_agent_scan(scan):
+        # Agents claim the units again, the running ones keep their lease
+        requeued = await requeue_units(db, scan, unit_id)
+        if not requeued:
+            return ScanStatus(status="running", message="These units are being scanned by agents", scan_id=scan_id)
+        return ScanStatus(status="running", message=f"{requeued} scan units handed back to the agents", scan_id=scan_id)
+    
+    job = await enqueue_resume(db, scan_id, priority=MANUAL_SCAN_PRIORITY, units=[unit_id] if unit_id else None)
+    if job.status == "running":
+        return ScanStatus(
+            status="running",
+            message="This scan is already running",
+            scan_id=scan_id,
+            job_id=job.id
+        )
+    
+    return ScanStatus(
+        status="queued",
+        message=f"Retry of {len(unit_ids)} scan units queued",
+        scan_id=scan_id,
+        job_id=job.id
+    )
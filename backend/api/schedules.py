@@ -0,0 +1,174 @@
+"""
+Scan schedule endpoints
+"""
+import ipaddress
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+from jobs import enqueue_scan
+from models import ScanJob, ScanSchedule
+from schedules import first_run
+from .scanner import MANUAL_SCAN_PRIORITY, ScanStatus
+
+router = APIRouter()
+
+
+class ScanTargetFields(BaseModel):
+    """Validation of networks and ports, shared by schedules and agents"""
+
+    @field_validator("networks", check_fields=False)
+    @classmethod
+    def valid_networks(cls, networks: Optional[List[str]]) -> Optional[List[str]]:
+        # Normalized: 192.168.1.7/24 becomes 192.168.1.0/24
+        if networks is None:
+            return None
+        if not networks:
+            raise ValueError("at least one network is required")
+        return [str(ipaddress.ip_network(network.strip(), strict=False)) for network in networks]
+
+    @field_validator("ports", check_fields=False)
+    @classmethod
+    def valid_ports(cls, ports: Optional[List[int]]) -> Optional[List[int]]:
+        if ports is not None and not all(1 <= port <= 65535 for port in ports):
+            raise ValueError("ports must be between 1 and 65535")
+        return ports
+
+
+class ScheduleCreate(ScanTargetFields):
+    name: str = Field(min_length=1, max_length=100)
+    networks: List[str]
+    ports: Optional[List[int]] = None
+    interval_minutes: int = Field(ge=5)
+    # Manual scans always come first
+    priority: int = Field(0, ge=0, lt=MANUAL_SCAN_PRIORITY)
+    enabled: bool = True
+
+
+class ScheduleUpdate(ScanTargetFields):
+    name: Optional[str] = Field(None, min_length=1, max_length=100)
+    networks: Optional[List[str]] = None
+    ports: Optional[List[int]] = None
+    interval_minutes: Optional[int] = Field(None, ge=5)
+    priority: Optional[int] = Field(None, ge=0, lt=MANUAL_SCAN_PRIORITY)
+    enabled: Optional[bool] = None
+
+
+class ScheduleResponse(BaseModel):
+    id: int
+    name: str
+    networks: List[str]
+    ports: Optional[List[int]]
+    interval_minutes: int
+    priority: int
+    enabled: bool
+    next_run_at: Optional[str]
+    last_run_at: Optional[str]
+    last_job_id: Optional[int]
+    last_job_status: Optional[str] = None
+
+
+def format_schedule(schedule: ScanSchedule, job: Optional[ScanJob] = None) -> dict:
+    return {
+        "id": schedule.id,
+        "name": schedule.name,
+        "networks": schedule.networks,
+        "ports": schedule.ports,
+        "interval_minutes": schedule.interval_minutes,
+        "priority": schedule.priority or 0,
+        "enabled": schedule.enabled,
+        "next_run_at": schedule.next_run_at.isoformat() if schedule.next_run_at else None,
+        "last_run_at": schedule.last_run_at.isoformat() if schedule.last_run_at else None,
+        "last_job_id": schedule.last_job_id,
+        "last_job_status": job.status if job else None,
+    }
+
+
+async def _get_schedule(db: AsyncSession, schedule_id: int) -> ScanSchedule:
+    schedule = await db.get(ScanSchedule, schedule_id)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return schedule
+
+
+async def _name_taken(db: AsyncSession, name: str, schedule_id: Optional[int] = None) -> bool:
+    result = await db.execute(select(ScanSchedule.id).where(ScanSchedule.name == name))
+    found = result.scalar_one_or_none()
+    return found is not None and found != schedule_id
+
+
+@router.get("/schedules", response_model=List[ScheduleResponse])
+async def get_schedules(db: AsyncSession = Depends(get_db)):
+    """List scan schedules, next due first"""
+    result = await db.execute(select(ScanSchedule).order_by(ScanSchedule.next_run_at, ScanSchedule.id))
+    schedules = result.scalars().all()
+    job_ids = [schedule.last_job_id for schedule in schedules if schedule.last_job_id]
+    jobs = {}
+    if job_ids:
+        result = await db.execute(select(ScanJob).where(ScanJob.id.in_(job_ids)))
+        jobs = {job.id: job for job in result.scalars()}
+    return [format_schedule(schedule, jobs.get(schedule.last_job_id)) for schedule in schedules]
+
+
+@router.post("/schedules", response_model=ScheduleResponse)
+async def create_schedule(schedule: ScheduleCreate, db: AsyncSession = Depends(get_db)):
+    """Create a scan schedule, first run within the jitter window"""
+    if await _name_taken(db, schedule.name):
+        raise HTTPException(status_code=400, detail="Schedule already exists")
+
+    new_schedule = ScanSchedule(**schedule.dict(), next_run_at=first_run(schedule.interval_minutes))
+    db.add(new_schedule)
+    await db.commit()
+    await db.refresh(new_schedule)
+    return format_schedule(new_schedule)
+
+
+@router.patch("/schedules/{schedule_id}", response_model=ScheduleResponse)
+async def update_schedule(schedule_id: int, schedule_update: ScheduleUpdate, db: AsyncSession = Depends(get_db)):
+    """Update a scan schedule; a new interval applies from now"""
+    schedule = await _get_schedule(db, schedule_id)
+    update_data = schedule_update.dict(exclude_unset=True)
+    if "name" in update_data and await _name_taken(db, update_data["name"], schedule_id):
+        raise HTTPException(status_code=400, detail="Schedule already exists")
+
+    for field, value in update_data.items():
+        setattr(schedule, field, value)
+    if "interval_minutes" in update_data or (update_data.get("enabled") and schedule.next_run_at is None):
+        schedule.next_run_at = first_run(schedule.interval_minutes)
+
+    await db.commit()
+    await db.refresh(schedule)
+    return format_schedule(schedule)
+
+
+@router.delete("/schedules/{schedule_id}")
+async def delete_schedule(schedule_id: int, db: AsyncSession = Depends(get_db)):
+    """Delete a scan schedule, its queued or running scan is left to finish"""
+    schedule = await _get_schedule(db, schedule_id)
+    await db.delete(schedule)
+    await db.commit()
+    return {"status": "deleted", "id": schedule_id}
+
+
+@router.post("/schedules/{schedule_id}/run", response_model=ScanStatus)
+async def run_schedule(schedule_id: int, db: AsyncSession = Depends(get_db)):
+    """Queue a scan of the schedule's networks now, with manual priority"""
+    schedule = await _get_schedule(db, schedule_id)
+    job = await enqueue_scan(
+        db,
+        priority=MANUAL_SCAN_PRIORITY,
+        payload={"networks": schedule.networks, "ports": schedule.ports},
+        schedule_id=schedule.id
+    )
+    schedule.last_run_at = datetime.utcnow()
+    schedule.last_job_id = job.id
+    await db.commit()
+
+    if job.status == "running":
+        return ScanStatus(status="running", message="A scan of this schedule is already in progress", scan_id=job.scan_id, job_id=job.id)
+    return ScanStatus(status="queued", message=f"Scan of {schedule.name} queued", job_id=job.id)
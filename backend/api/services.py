@@ -1,18 +1,31 @@
 """
 Services API endpoints
 """
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select, update, delete
+import os
+import base64
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select, update, delete, insert, and_, tuple_
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 
 from database import get_db
 from models import Service, Category
+from readmodel import read_model
+from .fragments import json_array, service_fragments
 
 router = APIRouter()
 
+# Rows loaded per query when a listing has rows missing from the fragment cache
+FRAGMENT_LOAD_BATCH = 500
+
+# Change tokens stay this many seconds behind the clock, for rows committed late
+SERVICE_CHANGES_SKEW = int(os.getenv("SERVICE_CHANGES_SKEW", "30"))
+
 
 # Pydantic schemas
 class ServiceBase(BaseModel):
@@ -32,6 +45,39 @@ class ServiceUpdate(BaseModel):
     category_id: Optional[int] = None
 
 
+class ServiceFilter(BaseModel):
+    category_id: Optional[int] = None
+    uncategorized: bool = False
+    status: Optional[str] = None
+    search: Optional[str] = None
+    ip: Optional[str] = None
+
+
+class BulkSelection(BaseModel):
+    ids: Optional[List[int]] = None
+    filter: Optional[ServiceFilter] = None
+
+
+class BulkUpdate(BulkSelection):
+    changes: ServiceUpdate
+
+
+class BulkCreate(BaseModel):
+    services: List[ServiceCreate]
+
+
+class BulkItemResult(BaseModel):
+    id: Optional[int] = None
+    url: Optional[str] = None
+    status: str
+    detail: Optional[str] = None
+
+
+class BulkResponse(BaseModel):
+    matched: int
+    results: List[BulkItemResult]
+
+
 class ServiceResponse(BaseModel):
     id: int
     name: str
@@ -41,18 +87,29 @@ class ServiceResponse(BaseModel):
     category_id: Optional[int]
     category_name: Optional[str]
     ip_address: Optional[str]
+    hostname: Optional[str] = None
     port: Optional[int]
     protocol: str
+    version: Optional[str] = None
     status: str
     response_time: Optional[int]
     last_seen: str
     is_manual: bool
     is_category_manual: bool
+    aliases: List[str] = []
+    cert_expires_at: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class ServiceChangesResponse(BaseModel):
+    services: List[ServiceResponse]
+    deleted: List[int]
+    token: str
+    has_more: bool
+
+
 class CategoryCreate(BaseModel):
     name: str
     icon: Optional[str] = "folder"
@@ -90,42 +147,348 @@ def format_service(service: Service) -> dict:
         "category_id": service.category_id,
         "category_name": service.category.name if service.category else None,
         "ip_address": str(service.ip_address) if service.ip_address else None,
+        "hostname": service.hostname,
         "port": service.port,
         "protocol": service.protocol,
+        "version": service.version,
         "status": service.status,
         "response_time": service.response_time,
         "last_seen": service.last_seen.isoformat() if service.last_seen else None,
         "is_manual": service.is_manual,
-        "is_category_manual": service.is_category_manual
+        "is_category_manual": service.is_category_manual,
+        "aliases": service.aliases or [],
+        "cert_expires_at": service.cert_expires_at.isoformat() if service.cert_expires_at else None
     }
 
 
+def service_filters(
+    category_id: Optional[int] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    uncategorized: bool = False,
+    ip: Optional[str] = None
+) -> list:
+    """WHERE clauses of the service filters, shared by listing and bulk endpoints"""
+    clauses = []
+    if category_id:
+        clauses.append(Service.category_id == category_id)
+    if uncategorized:
+        clauses.append(Service.category_id.is_(None))
+    if status:
+        clauses.append(Service.status == status)
+    if ip:
+        clauses.append(Service.ip_address == ip)
+    if search:
+        clauses.append(
+            Service.name.ilike(f"%{search}%") |
+            Service.url.ilike(f"%{search}%") |
+            Service.description.ilike(f"%{search}%") |
+            Service.hostname.ilike(f"%{search}%")
+        )
+    return clauses
+
+
+def bulk_selection(selection: BulkSelection):
+    """
+    WHERE clause of a bulk operation
+    
+    Explicit ids and filter expressions combine with AND; an empty selection
+    is refused rather than treated as "every service".
+    """
+    clauses = []
+    if selection.ids is not None:
+        clauses.append(Service.id.in_(selection.ids))
+    if selection.filter is not None:
+        criteria = selection.filter.dict(exclude_defaults=True)
+        if criteria:
+            clauses.extend(service_filters(**criteria))
+    if not clauses:
+        raise HTTPException(status_code=400, detail="Select services by ids or by a non-empty filter")
+    return and_(Service.is_hidden == False, *clauses)
+
+
+def bulk_results(selection: BulkSelection, matched_ids: List[int], status: str) -> dict:
+    """Per-item result: matched ids get `status`, requested ids that matched nothing are not_found"""
+    matched = set(matched_ids)
+    results = [{"id": service_id, "status": status} for service_id in sorted(matched)]
+    if selection.ids is not None:
+        results.extend(
+            {"id": service_id, "status": "not_found"}
+            for service_id in dict.fromkeys(selection.ids)
+            if service_id not in matched
+        )
+    return {"matched": len(matched), "results": results}
+
+
 @router.get("/services", response_model=List[ServiceResponse])
 async def get_services(
     category_id: Optional[int] = Query(None),
     status: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
+    ip: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db)
 ):
     """Get all services with optional filtering"""
-    query = select(Service).options(selectinload(Service.category)).where(Service.is_hidden == False)
+    # The read model matches search terms literally, LIKE wildcards in them need the database
+    if read_model.ready and not (search and ("%" in search or "_" in search)):
+        records = read_model.services(category_id, status, search, ip=ip)
+        return Response(json_array(record.fragment for record in records), media_type="application/json")
     
-    if category_id:
-        query = query.where(Service.category_id == category_id)
-    if status:
-        query = query.where(Service.status == status)
-    if search:
-        query = query.where(
-            Service.name.ilike(f"%{search}%") | 
-            Service.url.ilike(f"%{search}%") |
-            Service.description.ilike(f"%{search}%")
-        )
+    # Only ids and versions, rows are loaded when their cached fragment is stale
+    query = (
+        select(Service.id, Service.updated_at, Category.name)
+        .outerjoin(Category, Service.category_id == Category.id)
+        .where(Service.is_hidden == False, *service_filters(category_id, status, search, ip=ip))
+        .order_by(Service.name)
+    )
+    result = await db.execute(query)
+    rows = result.all()
+    fragments = await service_fragments_for(db, rows)
     
-    query = query.order_by(Service.name)
+    # Fragments are format_service output, already valid ServiceResponse items.
+    # A row deleted between the two queries is left out
+    body = json_array(fragments[row[0]] for row in rows if row[0] in fragments)
+    return Response(body, media_type="application/json")
+
+
+def changes_token(updated_at: datetime, service_id: int) -> str:
+    """Opaque position in the change feed: (updated_at, id) of the last row sent"""
+    raw = orjson.dumps([updated_at.isoformat(), service_id])
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def parse_changes_token(token: str) -> tuple:
+    """(updated_at, id) of a token, 400 when it isn't one"""
+    try:
+        updated_at, service_id = orjson.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return datetime.fromisoformat(updated_at), int(service_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid changes token")
+
+
+def settled(position: tuple, now: Optional[datetime] = None) -> tuple:
+    """
+    A feed position no later than SERVICE_CHANGES_SKEW seconds ago
+    
+    updated_at is set when a row is flushed, not when it commits, so a
+    slow transaction can commit rows older than ones already sent.
+    Positions stay behind by the skew and the next poll sends such rows;
+    recent changes can come more than once.
+    """
+    horizon = (now or datetime.utcnow()) - timedelta(seconds=SERVICE_CHANGES_SKEW)
+    if SERVICE_CHANGES_SKEW:
+        # Rounded down, so the token of a quiet inventory (and the dashboard's ETag) changes once per period
+        horizon -= timedelta(seconds=horizon.timestamp() % SERVICE_CHANGES_SKEW)
+    return min(position, (horizon, 0))
+
+
+async def current_changes_token(db: AsyncSession, synced_at: Optional[datetime] = None) -> str:
+    """
+    Token of the latest change, for clients that just loaded the whole inventory
+    
+    Args:
+        db: Database session
+        synced_at: When the inventory they loaded was read (default: now)
+    """
+    result = await db.execute(
+        select(Service.updated_at, Service.id)
+        .where(Service.updated_at.isnot(None))
+        .order_by(Service.updated_at.desc(), Service.id.desc())
+        .limit(1)
+    )
+    row = result.first()
+    return changes_token(*settled(tuple(row) if row else (datetime.min, 0), synced_at))
+
+
+@router.get("/services/changes", response_model=ServiceChangesResponse)
+async def get_service_changes(
+    since: Optional[str] = Query(None, description="Token of the previous response (default: from the start)"),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Services created, updated or hidden since a token
+    
+    Rows are read in (updated_at, id) order from the updated_at index.
+    Hidden services come as tombstones (their ids in `deleted`). Poll
+    again with the returned token, right away while `has_more` is true.
+    A change may be sent more than once, clients apply them by id.
+    """
+    position = parse_changes_token(since) if since else (datetime.min, 0)
+    query = (
+        select(Service.id, Service.updated_at, Category.name, Service.is_hidden)
+        .outerjoin(Category, Service.category_id == Category.id)
+        .where(tuple_(Service.updated_at, Service.id) > position)
+        .order_by(Service.updated_at, Service.id)
+        .limit(limit + 1)
+    )
+    if since is None:
+        # Nothing to delete on a first sync
+        query = query.where(Service.is_hidden == False)
     result = await db.execute(query)
-    services = result.scalars().all()
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    if rows:
+        position = (rows[-1][1], rows[-1][0])
+    if not has_more:
+        position = settled(position)
     
-    return [format_service(s) for s in services]
+    fragments = await service_fragments_for(db, [row[:3] for row in rows if not row[3]])
+    body = b"".join([
+        b'{"services":', json_array(fragments[row[0]] for row in rows if row[0] in fragments),
+        b',"deleted":', orjson.dumps([row[0] for row in rows if row[3]]),
+        b',"token":', orjson.dumps(changes_token(*position)),
+        b',"has_more":', orjson.dumps(has_more),
+        b"}",
+    ])
+    return Response(body, media_type="application/json")
+
+
+async def service_fragments_for(db: AsyncSession, rows: list) -> Dict[int, bytes]:
+    """
+    JSON fragments of services
+    
+    Args:
+        db: Database session
+        rows: (id, updated_at, category name) of the services
+        
+    Returns:
+        Encoded format_service() dict by service id
+    """
+    fragments = {}
+    missing = []
+    for service_id, updated_at, category_name in rows:
+        fragment = service_fragments.get(service_id, (updated_at, category_name))
+        if fragment is None:
+            missing.append(service_id)
+        else:
+            fragments[service_id] = fragment
+    
+    for start in range(0, len(missing), FRAGMENT_LOAD_BATCH):
+        result = await db.execute(
+            select(Service)
+            .options(selectinload(Service.category))
+            .where(Service.id.in_(missing[start:start + FRAGMENT_LOAD_BATCH]))
+        )
+        for service in result.scalars():
+            version = (service.updated_at, service.category.name if service.category else None)
+            fragments[service.id] = service_fragments.put(service.id, version, format_service(service))
+    
+    return fragments
+
+
+@router.post("/services/bulk", response_model=BulkResponse, response_model_exclude_none=True)
+async def bulk_create_services(payload: BulkCreate, db: AsyncSession = Depends(get_db)):
+    """
+    Create many manual services in one transaction
+    
+    Follows create_service per item: hidden services with the same URL are
+    restored, active ones are reported as conflicts, and items with an
+    unknown category as invalid, instead of failing the whole batch.
+    """
+    urls = [item.url for item in payload.services]
+    result = await db.execute(
+        select(Service.id, Service.url, Service.name, Service.is_hidden).where(Service.url.in_(urls))
+    )
+    existing = {row.url: row for row in result}
+    category_ids = {item.category_id for item in payload.services if item.category_id is not None}
+    if category_ids:
+        result = await db.execute(select(Category.id).where(Category.id.in_(category_ids)))
+        category_ids = set(result.scalars())
+    
+    results = []
+    inserts, restores, seen = [], [], set()
+    for item in payload.services:
+        if item.url in seen:
+            results.append({"url": item.url, "status": "duplicate", "detail": "URL repeated in this request"})
+            continue
+        seen.add(item.url)
+        if item.category_id is not None and item.category_id not in category_ids:
+            results.append({"url": item.url, "status": "invalid", "detail": "Category not found"})
+            continue
+        
+        row = existing.get(item.url)
+        if row is None:
+            inserts.append({
+                **item.dict(),
+                "is_manual": True,
+                "is_category_manual": bool(item.category_id),
+                "status": "active",
+            })
+            results.append({"url": item.url, "status": "created"})
+        elif row.is_hidden:
+            restore = {**item.dict(exclude={"url"}), "id": row.id, "is_manual": True, "is_hidden": False}
+            if item.category_id:
+                restore["is_category_manual"] = True
+            restores.append(restore)
+            results.append({"id": row.id, "url": item.url, "status": "restored"})
+        else:
+            results.append({
+                "id": row.id,
+                "url": item.url,
+                "status": "conflict",
+                "detail": f"This URL is already in use by service: '{row.name}'",
+            })
+    
+    if inserts:
+        created = await db.execute(insert(Service).returning(Service.id, Service.url), inserts)
+        ids = {row.url: row.id for row in created}
+        for item in results:
+            if item["status"] == "created":
+                item["id"] = ids[item["url"]]
+    if restores:
+        # ORM bulk UPDATE by primary key: one executemany statement
+        await db.execute(update(Service), restores)
+    await db.commit()
+    await read_model.notify()
+    
+    return {"matched": len(inserts) + len(restores), "results": results}
+
+
+@router.patch("/services/bulk", response_model=BulkResponse, response_model_exclude_none=True)
+async def bulk_update_services(payload: BulkUpdate, db: AsyncSession = Depends(get_db)):
+    """Set name, description and/or category of every selected service with one UPDATE"""
+    values = payload.changes.dict(exclude_unset=True)
+    if not values:
+        raise HTTPException(status_code=400, detail="No changes given")
+    if "category_id" in values:
+        values["is_category_manual"] = True
+        if values["category_id"] is not None:
+            category = await db.get(Category, values["category_id"])
+            if category is None:
+                raise HTTPException(status_code=404, detail="Category not found")
+    
+    result = await db.execute(
+        update(Service)
+        .where(bulk_selection(payload))
+        .values(**values)
+        .returning(Service.id)
+        .execution_options(synchronize_session=False)
+    )
+    matched = result.scalars().all()
+    await db.commit()
+    await read_model.notify()
+    
+    return bulk_results(payload, matched, "updated")
+
+
+@router.post("/services/bulk/hide", response_model=BulkResponse, response_model_exclude_none=True)
+async def bulk_hide_services(payload: BulkSelection, db: AsyncSession = Depends(get_db)):
+    """Soft delete every selected service with one UPDATE"""
+    result = await db.execute(
+        update(Service)
+        .where(bulk_selection(payload))
+        .values(is_hidden=True)
+        .returning(Service.id)
+        .execution_options(synchronize_session=False)
+    )
+    matched = result.scalars().all()
+    await db.commit()
+    await read_model.notify()
+    
+    return bulk_results(payload, matched, "hidden")
 
 
 @router.get("/services/{service_id}", response_model=ServiceResponse)
@@ -163,6 +526,7 @@ async def create_service(service: ServiceCreate, db: AsyncSession = Depends(get_
                 existing_service.is_category_manual = True
             
             await db.commit()
+            await read_model.notify()
             await db.refresh(existing_service)
             # Need to reload category after refresh to ensure it's available for format_service
             await db.execute(select(Service).options(selectinload(Service.category)).where(Service.id == existing_service.id))
@@ -184,6 +548,7 @@ async def create_service(service: ServiceCreate, db: AsyncSession = Depends(get_
     
     db.add(new_service)
     await db.commit()
+    await read_model.notify()
     await db.refresh(new_service)
     # Reload with category
     result = await db.execute(
@@ -218,6 +583,7 @@ async def update_service(
         setattr(service, field, value)
     
     await db.commit()
+    await read_model.notify()
     await db.refresh(service)
     
     # Reload with category after refresh
@@ -241,6 +607,7 @@ async def delete_service(service_id: int, db: AsyncSession = Depends(get_db)):
     # Soft delete - mark as hidden instead of actually deleting
     service.is_hidden = True
     await db.commit()
+    await read_model.notify()
     
     return {"status": "hidden", "id": service_id}
 
@@ -248,6 +615,9 @@ async def delete_service(service_id: int, db: AsyncSession = Depends(get_db)):
 @router.get("/categories", response_model=List[CategoryResponse])
 async def get_categories(db: AsyncSession = Depends(get_db)):
     """Get all categories with service counts"""
+    if read_model.ready:
+        return read_model.category_list()
+    
     result = await db.execute(
         select(Category).order_by(Category.order_index, Category.name)
     )
@@ -283,6 +653,7 @@ async def create_category(category: CategoryCreate, db: AsyncSession = Depends(g
     new_category = Category(**category.dict())
     db.add(new_category)
     await db.commit()
+    await read_model.notify()
     await db.refresh(new_category)
     
     # Return with 0 service count
@@ -310,10 +681,18 @@ async def update_category(
         raise HTTPException(status_code=404, detail="Category not found")
     
     update_data = category_update.dict(exclude_unset=True)
+    if update_data.get("name", category.name) != category.name:
+        # Their category_name changed: the change feed sends them again
+        await db.execute(
+            update(Service)
+            .where(Service.category_id == category_id, Service.is_hidden == False)
+            .values(updated_at=datetime.utcnow())
+        )
     for field, value in update_data.items():
         setattr(category, field, value)
     
     await db.commit()
+    await read_model.notify()
     await db.refresh(category)
     
     # Get service count
@@ -344,5 +723,6 @@ async def delete_category(category_id: int, db: AsyncSession = Depends(get_db)):
     # SQLAlchemy will handle the SET NULL on services due to foreign key constraint
     await db.delete(category)
     await db.commit()
+    await read_model.notify()
     
     return {"status": "deleted", "id": category_id}
@@ -0,0 +1,7 @@
+"""
+Benchmark suite for NeonDeck
+
+Each module is a standalone script, run from the backend directory:
+
+    python -m benchmarks.scan_throughput
+"""
@@ -0,0 +1,176 @@
+"""
+Scanner agents benchmark
+
+Runs several ScanAgents against the API in-process (httpx ASGI
+transport, no lifespan) and a farm of local fake services, the way
+remote agents scan networks the API can't reach:
+
+    - agents are registered through the API with overlapping networks
+      (agent-1 the farm's /24, the others a share of it each), so units
+      of a shared network go to whichever agent claims them first
+    - with --abandon, one more agent claims units and crashes without
+      pushing anything; the others take them over once the lease expires
+    - every agent pushes its results in gzip-compressed batches
+
+Reports units and services per agent, seconds to a completed scan, and
+raw vs compressed bytes pushed. Exits with status 1 when a unit isn't
+completed, an agent got a unit outside its networks, or the services
+stored differ from those the agents pushed.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.agents --agents 3 --hosts 200 --abandon 2
+"""
+import argparse
+import asyncio
+import ipaddress
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import use_scratch_database
+
+
+def assignments(network: str, agents: int) -> list:
+    """(name, networks) of each agent: the first gets the whole network, the others a share of it"""
+    parsed = ipaddress.ip_network(network)
+    shares = list(parsed.subnets(prefixlen_diff=max(1, (agents - 2).bit_length()))) if agents > 1 else []
+    result = [("agent-1", [network])]
+    for index in range(1, agents):
+        result.append((f"agent-{index + 1}", [str(shares[(index - 1) % len(shares)])]))
+    return result
+
+
+async def scan_done(admin, scan_id: int) -> bool:
+    response = await admin.get(f"/api/scan/{scan_id}/units")
+    response.raise_for_status()
+    return all(unit["status"] in ("completed", "failed") for unit in response.json())
+
+
+async def run(args) -> dict:
+    import httpx
+    from database import init_db
+    from main import app
+    from agent import ScanAgent
+    from benchmarks.fake_services import FakeServiceFarm, CannedPortScanner
+
+    await init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with FakeServiceFarm(hosts=args.hosts, dns_delay=args.dns_delay, slow_delay=args.slow_delay) as farm, \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as admin:
+        agents, networks = [], {}
+        plan = assignments(farm.network, args.agents)
+        if args.abandon:
+            plan.append(("crashing", [farm.network]))
+        for name, assigned in plan:
+            response = await admin.post("/api/agents", json={"name": name, "networks": assigned, "ports": farm.ports})
+            response.raise_for_status()
+            created = response.json()
+            networks[created["id"]] = (name, [ipaddress.ip_network(n) for n in assigned])
+            agents.append((name, ScanAgent(
+                api_url="http://bench",
+                token=created["token"],
+                poll_interval=0.1,
+                batch_size=args.batch_size,
+                port_scanner=CannedPortScanner(farm),
+                lookup=farm.reverse_lookup,
+                transport=transport,
+            )))
+
+        response = await admin.post("/api/agents/scan")
+        response.raise_for_status()
+        scan_id = response.json()["scan_id"]
+        start = time.perf_counter()
+
+        abandoned = 0
+        if args.abandon:
+            _, crashing = agents.pop()
+            async with crashing.client() as client:
+                for _ in range(args.abandon):
+                    response = await client.post("/agents/claim")
+                    abandoned += response.status_code == 200
+
+        async def drive(agent):
+            async with agent.client() as client:
+                while not await scan_done(admin, scan_id):
+                    if not await agent.run_once(client):
+                        await asyncio.sleep(agent.poll_interval)
+
+        await asyncio.wait_for(asyncio.gather(*(drive(agent) for _, agent in agents)), args.timeout)
+        seconds = time.perf_counter() - start
+
+        units = (await admin.get(f"/api/scan/{scan_id}/units")).json()
+        history = (await admin.get("/api/scan/history")).json()
+        scan = next(entry for entry in history if entry["id"] == scan_id)
+        stored = len((await admin.get("/api/services")).json())
+
+    misplaced = [
+        unit for unit in units
+        if unit["agent_id"] is not None and not any(
+            ipaddress.ip_network(unit["network"]).subnet_of(assigned) for assigned in networks[unit["agent_id"]][1]
+        )
+    ]
+    return {
+        "seconds": seconds,
+        "scan": scan,
+        "units": units,
+        "misplaced": misplaced,
+        "abandoned": abandoned,
+        "stored": stored,
+        "agents": [(name, agent.stats) for name, agent in agents],
+        "names": {agent_id: name for agent_id, (name, _) in networks.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=3, help="agents scanning (default: 3)")
+    parser.add_argument("--hosts", type=int, default=200, help="loopback hosts to start (4 ports each)")
+    parser.add_argument("--unit-prefix", type=int, default=27, help="AGENT_UNIT_PREFIX of the scan")
+    parser.add_argument("--batch-size", type=int, default=50, help="services per pushed batch")
+    parser.add_argument("--abandon", type=int, default=0, help="units claimed by an agent that crashes")
+    parser.add_argument("--lease", type=int, default=3, help="AGENT_LEASE in seconds")
+    parser.add_argument("--slow-delay", type=float, default=1.0, help="response delay of slow services")
+    parser.add_argument("--dns-delay", type=float, default=0.05, help="stub reverse lookup latency")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds before the run is given up")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Read by agents at import
+    os.environ["AGENT_UNIT_PREFIX"] = str(args.unit_prefix)
+    os.environ["AGENT_LEASE"] = str(args.lease)
+    with tempfile.TemporaryDirectory() as tmp:
+        use_scratch_database(tmp)
+        report = asyncio.run(run(args))
+
+    units, scan = report["units"], report["scan"]
+    print(f"\nAgent scan {scan['id']} {scan['status']} in {report['seconds']:.2f} s: "
+          f"{len(units)} units, {scan['services_found']} services, {report['stored']} stored")
+    if report["abandoned"]:
+        retried = sum(unit["attempts"] > 1 for unit in units)
+        print(f"{report['abandoned']} units abandoned by a crashing agent, {retried} taken over after their lease")
+
+    print(f"\n{'agent':<10} {'units':>6} {'failed':>7} {'services':>9} {'batches':>8} {'raw KiB':>9} {'gzip KiB':>9} {'ratio':>6}")
+    for name, stats in report["agents"]:
+        ratio = stats["bytes"] / stats["compressed_bytes"] if stats["compressed_bytes"] else 0
+        print(f"{name:<10} {stats['units']:>6} {stats['failed']:>7} {stats['services']:>9} {stats['batches']:>8} "
+              f"{stats['bytes'] / 1024:>9.1f} {stats['compressed_bytes'] / 1024:>9.1f} {ratio:>6.1f}")
+
+    errors = []
+    incomplete = [unit["network"] for unit in units if unit["status"] != "completed"]
+    if incomplete:
+        errors.append(f"units not completed: {', '.join(incomplete)}")
+    for unit in report["misplaced"]:
+        errors.append(f"{unit['network']} went to {report['names'][unit['agent_id']]}, outside its networks")
+    pushed = sum(stats["services"] for _, stats in report["agents"])
+    if report["stored"] != pushed:
+        errors.append(f"{pushed} services pushed, {report['stored']} stored")
+    for error in errors:
+        print(f"FAIL: {error}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Banner stage check
+
+Starts the non-web stub servers of FakeBannerServices (SSH and SMTP
+greeting on connect; Redis, PostgreSQL and MQTT answering their hello;
+one port that never answers) and runs HTTPProbe.probe_multiple over
+them, the way a scan probes the ports nmap found open. The stubs reach
+the banner stage in each way a scan does: through nmap's service name,
+the well-known port, or the fallback after HTTP failed.
+
+Reports the protocol, version and response time found on each port and
+exits with status 1 when one differs from what the stub announces.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.banners
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+
+async def run(args) -> dict:
+    from scanner import HTTPProbe
+    from benchmarks.fake_services import FakeBannerServices
+
+    async with FakeBannerServices(args.ip) as stubs:
+        probe = HTTPProbe(timeout=args.probe_timeout, banners=True)
+        start = time.perf_counter()
+        services = await probe.probe_multiple(stubs.hosts())
+        seconds = time.perf_counter() - start
+    found = {service["port"]: service for service in services}
+    return {"stubs": stubs.stubs, "found": found, "seconds": seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ip", default="127.0.2.1", help="loopback address the stubs listen on")
+    parser.add_argument("--probe-timeout", type=float, default=5.0, help="HTTPProbe (maximum) timeout in seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+
+    print(f"\nBanner stage over {len(report['stubs'])} stub ports in {report['seconds']:.2f} s")
+    print(f"{'port':>6} {'nmap name':<11} {'expected':<26} {'found':<26} {'ms':>6}")
+    errors = []
+    for stub in report["stubs"]:
+        service = report["found"].get(stub["port"])
+        expected = (stub["protocol"], stub["version"]) if stub["protocol"] else None
+        found = (service["protocol"], service.get("version")) if service else None
+        response_time = service["response_time"] if service else ""
+        print(f"{stub['port']:>6} {stub['service']:<11} {str(expected):<26} {str(found):<26} {response_time:>6}")
+        if found != expected:
+            errors.append(f"port {stub['port']}: expected {expected}, found {found}")
+    for error in errors:
+        print(f"FAIL: {error}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Category classifier benchmark
+
+Generates labelled services from a catalogue of self-hosted apps, each
+with the category a user would give it: some the rules already get
+right, some they misfile, some they don't know. A fraction of the
+services (--train) plays the manual categorizations the classifier
+learns from; the others are categorized three ways:
+
+    rules           ServiceCategorizer.categorize, one service at a time
+    classifier      CategoryClassifier.classify_batch alone (unsure items count as misses)
+    combined        ServiceCategorizer.categorize_batch: classifier, rules when unsure
+
+Reports accuracy and services/s of each, the classifier scoring one
+service per call, and the cost of one incremental relearn. Exits with
+status 1 when combined is less accurate than the rules.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.classifier --services 10000 --train 0.2
+"""
+import argparse
+import logging
+import random
+import statistics
+import time
+
+# (title, category a user gives it, usual port)
+APPS = [
+    ("Grafana", "Monitoring", 3000), ("Prometheus Time Series Collection", "Monitoring", 9090),
+    ("Uptime Kuma", "Monitoring", 3001), ("Netdata", "Monitoring", 19999),
+    ("Plex", "Media", 32400), ("Jellyfin", "Media", 8096), ("Sonarr", "Media", 8989), ("Radarr", "Media", 7878),
+    ("Proxmox Virtual Environment", "Infrastructure", 8006), ("Portainer", "Infrastructure", 9443),
+    ("Home Assistant", "Automation", 8123), ("Node-RED", "Automation", 1880), ("n8n.io - Workflow Automation", "Automation", 5678),
+    ("MinIO Console", "Storage", 9001), ("Nextcloud", "Storage", 443), ("Synology DiskStation", "Storage", 5001),
+    ("Gitea: Git with a cup of tea", "Development", 3000), ("JupyterLab", "Development", 8888),
+    ("Vaultwarden Web", "Security", 80), ("Authentik", "Security", 9000),
+    ("Pi-hole Admin Console", "Networking", 80), ("UniFi Network", "Networking", 8443), ("AdGuard Home", "Networking", 3000),
+    # Misfiled by the rules
+    ("Traefik", "Networking", 8080), ("InfluxDB", "Storage", 8086), ("Docker Registry UI", "Development", 5000),
+    ("Kibana", "Development", 5601), ("Nginx Proxy Manager", "Networking", 81),
+    # Unknown to the rules
+    ("Immich", "Media", 2283), ("Audiobookshelf", "Media", 13378), ("Kavita", "Media", 5000),
+    ("Paperless-ngx", "Storage", 8000), ("Syncthing", "Storage", 8384), ("Stirling PDF", "Storage", 8080),
+    ("Frigate", "Security", 5000), ("Scrypted", "Security", 10443), ("CrowdSec", "Security", 8080),
+    ("Zigbee2MQTT", "Automation", 8080), ("ESPHome", "Automation", 6052),
+    ("NetBox", "Networking", 8000), ("Speedtest Tracker", "Networking", 8765),
+    ("Wiki.js", "Development", 3000), ("Forgejo", "Development", 3000),
+    ("Mealie", "Home", 9000), ("Grocy", "Home", 80), ("OctoPrint", "Home", 5000), ("CUPS", "Home", 631),
+    ("Firefly III", "Home", 8080), ("Actual Budget", "Home", 5006), ("Tandoor Recipes", "Home", 8080),
+]
+TITLE_FORMATS = ["{}", "{}", "{} - Login", "Login | {}", "{} Dashboard", "Welcome to {}"]
+DESCRIPTIONS = [None, None, None, "Web interface", "Self-hosted", "Admin console", "Sign in to continue"]
+COMMON_PORTS = [80, 443, 8080, 8443]
+
+
+def generate(count: int, seed: int) -> list:
+    """(title, url, description, category) of `count` services"""
+    rng = random.Random(seed)
+    services = []
+    for i in range(count):
+        app, category, port = rng.choice(APPS)
+        if rng.random() < 0.3:
+            port = rng.choice(COMMON_PORTS)
+        protocol = "https" if port in (443, 8443) or rng.random() < 0.3 else "http"
+        if rng.random() < 0.5:
+            slug = app.split()[0].split(":")[0].lower()
+            host = f"{slug}{rng.choice(['', '-1', '-2'])}.{rng.choice(['home.lan', 'lab.local', 'example.net'])}"
+        else:
+            host = f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        title = rng.choice(TITLE_FORMATS).format(app)
+        services.append((title, f"{protocol}://{host}:{port}/", rng.choice(DESCRIPTIONS), category))
+    return services
+
+
+def accuracy(predicted: list, expected: list) -> float:
+    return sum(p == e for p, e in zip(predicted, expected)) / len(expected)
+
+
+def timed(function, repeat: int):
+    """(median seconds, last result) of `repeat` calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def run(args) -> dict:
+    from scanner.classifier import CategoryClassifier, np
+    from scanner.categorizer import ServiceCategorizer
+
+    if np is None:
+        raise SystemExit("NumPy is not installed, the classifier is disabled")
+
+    services = generate(args.services, args.seed)
+    split = int(len(services) * args.train)
+    train, test = services[:split], services[split:]
+    items = [(title, url, description) for title, url, description, _ in test]
+    expected = [category for *_, category in test]
+
+    classifier = CategoryClassifier(min_confidence=args.min_confidence)
+    start = time.perf_counter()
+    for sample_id, (title, url, description, category) in enumerate(train):
+        classifier.learn(sample_id, category, title, url, description)
+    classifier.classify_batch(items[:1])  # First fit
+    learn_seconds = time.perf_counter() - start
+
+    rules = ServiceCategorizer()
+    combined = ServiceCategorizer(classifier)
+    results = {}
+
+    seconds, predicted = timed(lambda: [rules.categorize(*item) for item in items], args.repeat)
+    results["rules"] = (seconds, accuracy(predicted, expected))
+
+    seconds, predictions = timed(lambda: classifier.classify_batch(items), args.repeat)
+    results["classifier"] = (seconds, accuracy([name for name, _ in predictions], expected))
+    coverage = sum(name is not None for name, _ in predictions) / len(items)
+
+    seconds, predicted = timed(lambda: combined.categorize_batch(items), args.repeat)
+    results["combined"] = (seconds, accuracy(predicted, expected))
+
+    sample = items[:min(len(items), 1000)]
+    seconds, _ = timed(lambda: [classifier.classify_batch([item]) for item in sample], args.repeat)
+    per_item = len(sample) / seconds
+
+    # A user recategorizes one more service, the next scan refits
+    title, url, description, category = test[0]
+    relearn, _ = timed(
+        lambda: (classifier.learn(len(train), category, title, url, description), classifier.classify_batch(items[:1])),
+        args.repeat
+    )
+
+    print(f"Learned {len(train)} manual categorizations in {learn_seconds * 1000:.1f} ms "
+          f"({len(classifier._vocabulary)} tokens, {len(classifier._documents)} categories)")
+    print(f"Classifier confident on {coverage:.1%} of new services (min confidence {classifier.min_confidence})")
+    print(f"One-at-a-time classifier: {per_item:.0f} services/s; relearn one service and refit: {relearn * 1000:.2f} ms")
+    return {"items": len(items), "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=10000)
+    parser.add_argument("--train", type=float, default=0.2, help="fraction of services categorized by hand")
+    parser.add_argument("--min-confidence", type=float, default=None)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per method, the median is reported")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run(args)
+    results = report["results"]
+
+    print(f"\nCategorization of {report['items']} new services (median of {args.repeat} runs)")
+    print(f"{'method':<14} {'accuracy':>10} {'seconds':>10} {'services/s':>14}")
+    for name, (seconds, score) in results.items():
+        print(f"{name:<14} {score:>10.1%} {seconds:>10.4f} {report['items'] / seconds:>14.0f}")
+
+    if results["combined"][1] < results["rules"][1]:
+        raise SystemExit("combined categorization is less accurate than the rules alone")
+
+
+if __name__ == "__main__":
+    main()
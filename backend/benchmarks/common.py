@@ -0,0 +1,152 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+import os
+import json
+import time
+import tracemalloc
+from typing import Dict, Optional
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# Differences below these floors are timer/GC noise, never regressions
+NOISE_FLOOR_SECONDS = 0.05
+NOISE_FLOOR_KIB = 1024
+
+
+def use_scratch_database(directory: str, url: Optional[str] = None) -> str:
+    """
+    Point the application at a scratch database
+
+    Must be called before `database` is imported, since the engine is
+    created from DATABASE_URL at import time.
+
+    Args:
+        directory: Directory holding the SQLite file
+        url: Explicit database URL (e.g. a local PostgreSQL), overrides SQLite
+
+    Returns:
+        The database URL in use
+    """
+    url = url or f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}"
+    os.environ["DATABASE_URL"] = url
+    return url
+
+
+class Stage:
+    """
+    Measure wall time and peak Python memory of one benchmark stage
+
+    Memory is traced with tracemalloc, which slows allocation-heavy code;
+    numbers are comparable between runs, not with untraced production runs.
+    peak_kib is the high-water mark above what was allocated when the
+    stage started.
+    """
+
+    def __init__(self, name: str, items: int):
+        self.name = name
+        self.items = items
+        self.seconds = 0.0
+        self.peak_kib = 0.0
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._base = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        self.peak_kib = (tracemalloc.get_traced_memory()[1] - self._base) / 1024
+        return False
+
+    def as_dict(self) -> Dict:
+        return {
+            "items": self.items,
+            "seconds": round(self.seconds, 4),
+            "items_per_sec": round(self.items / self.seconds, 2) if self.seconds else 0.0,
+            "peak_kib": round(self.peak_kib, 1),
+        }
+
+
+def print_report(title: str, results: Dict[str, Dict], unit: str = "items"):
+    """Print stage results as a table"""
+    print(f"\n{title}")
+    print(f"{'stage':<20} {unit:>10} {'seconds':>10} {unit + '/s':>14} {'peak KiB':>12}")
+    for name, r in results.items():
+        print(
+            f"{name:<20} {r['items']:>10} {r['seconds']:>10.3f} "
+            f"{r['items_per_sec']:>14.1f} {r['peak_kib']:>12.1f}"
+        )
+
+
+def load_baseline(name: str) -> Optional[Dict]:
+    """Load a stored baseline, None if it has never been recorded"""
+    path = os.path.join(BASELINE_DIR, f"{name}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(name: str, results: Dict[str, Dict]):
+    """Store results as the new baseline"""
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = os.path.join(BASELINE_DIR, f"{name}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Baseline written to {path}")
+
+
+def find_regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> list:
+    """
+    Compare results against a baseline
+
+    A stage regresses when its throughput drops, or its peak memory grows,
+    by more than `tolerance` (a fraction, 0.25 = 25%) and by more than the
+    noise floors.
+
+    Returns:
+        Human readable regression messages, empty when within tolerance
+    """
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        slower = current["seconds"] - base["seconds"] > NOISE_FLOOR_SECONDS
+        if slower and current["items_per_sec"] < base["items_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {current['items_per_sec']:.1f}/s vs baseline {base['items_per_sec']:.1f}/s"
+            )
+        bigger = current["peak_kib"] - base["peak_kib"] > NOISE_FLOOR_KIB
+        if bigger and current["peak_kib"] > base["peak_kib"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: peak {current['peak_kib']:.0f} KiB vs baseline {base['peak_kib']:.0f} KiB"
+            )
+    return regressions
+
+
+def check_baseline(name: str, results: Dict[str, Dict], tolerance: float, update: bool) -> int:
+    """
+    Store or enforce the baseline for a benchmark
+
+    Returns:
+        Process exit status, 1 when a regression was found
+    """
+    baseline = load_baseline(name)
+    if update or baseline is None:
+        save_baseline(name, results)
+        return 0
+
+    regressions = find_regressions(results, baseline, tolerance)
+    if regressions:
+        print(f"\nRegressions beyond {tolerance:.0%} of baseline:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print(f"\nWithin {tolerance:.0%} of baseline")
+    return 0
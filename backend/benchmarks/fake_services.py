@@ -0,0 +1,468 @@
+"""
+Local fake web services for benchmarks
+
+Starts HTTP/HTTPS listeners on loopback addresses (127.0.1.x, every
+127.0.0.0/8 address is routed to lo on Linux) with a mix of behaviours
+seen on real networks: titled apps, bare pages, redirects to a login
+page, huge inline SVG favicons, slow and hanging responses and 5xx errors.
+Optionally some apps are also reachable through other endpoints that
+redirect to them or serve the same page (reverse proxies, multi-homed
+hosts).
+
+FakeBannerServices starts non-web servers for the banner stage: some
+greet on connect, others only answer a protocol hello.
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import random
+import shutil
+import ssl
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import nmap
+
+logger = logging.getLogger(__name__)
+
+# Titles of common self-hosted apps, so the categorizer gets realistic input
+APP_TITLES = [
+    "Grafana", "Prometheus Time Series Collection", "Plex", "Jellyfin", "Proxmox Virtual Environment",
+    "Portainer", "Traefik", "Home Assistant", "Node-RED", "n8n.io - Workflow Automation",
+    "MinIO Console", "Nextcloud", "Synology DiskStation", "Gitea: Git with a cup of tea",
+    "Harbor", "JupyterLab", "Vaultwarden Web", "Authentik", "Pi-hole Admin Console",
+    "UniFi Network", "AdGuard Home", "Uptime Kuma", "Sonarr", "Radarr", "Printer Status",
+]
+
+# Weighted behaviour mix: (behaviour, weight)
+BEHAVIOURS = [
+    ("app", 50),
+    ("bare", 10),
+    ("redirect", 15),
+    ("svg_favicon", 5),
+    ("slow", 10),
+    ("hanging", 5),
+    ("error", 5),
+]
+
+DEFAULT_PORTS = [8080, 8443, 3000, 9000]
+
+# Non-web stub servers. "greeting" is sent on connect, "reply" answers a
+# client whose first bytes start with "hello". "service" is the name nmap
+# reports ("unknown" leaves it to the port number or the HTTP fallback);
+# "protocol" and "version" are what the banner stage should identify.
+BANNER_STUBS = [
+    {
+        "port": 2222, "service": "unknown",
+        "greeting": b"SSH-2.0-OpenSSH_9.6p1 Ubuntu-3ubuntu13\r\n",
+        "protocol": "ssh", "version": "OpenSSH_9.6p1",
+    },
+    {
+        "port": 2525, "service": "smtp",
+        "greeting": b"220 mail.bench ESMTP Postfix 3.8.4\r\n",
+        "protocol": "smtp", "version": "Postfix 3.8.4",
+    },
+    {
+        "port": 6379, "service": "unknown",
+        "hello": b"INFO server\r\n",
+        "reply": b"$64\r\n# Server\r\nredis_version:7.2.4\r\nredis_mode:standalone\r\nos:Linux\r\n\r\n",
+        "protocol": "redis", "version": "7.2.4",
+    },
+    {
+        "port": 15432, "service": "postgresql",
+        "hello": b"\x00\x00\x00\x08\x04\xd2\x16\x2f",
+        "reply": b"N",
+        "protocol": "postgresql", "version": None,
+    },
+    {
+        "port": 11883, "service": "mqtt",
+        "hello": b"\x10\x14\x00\x04MQTT",
+        "reply": b"\x20\x02\x00\x00",
+        "protocol": "mqtt", "version": None,
+    },
+    # Accepts and never answers: must stay unidentified
+    {"port": 16379, "service": "redis", "protocol": None, "version": None},
+]
+
+
+class FakeEndpoint:
+    """One fake listener"""
+
+    def __init__(self, ip: str, port: int, tls: bool, behaviour: str, title: str):
+        self.ip = ip
+        self.port = port
+        self.tls = tls
+        self.behaviour = behaviour
+        self.title = title
+        self.duplicate_of: Optional["FakeEndpoint"] = None
+
+    def __repr__(self):
+        scheme = "https" if self.tls else "http"
+        return f"<FakeEndpoint {scheme}://{self.ip}:{self.port} {self.behaviour}>"
+
+
+class FakeServiceFarm:
+    """A set of fake web services listening on loopback addresses"""
+
+    def __init__(
+        self,
+        hosts: int = 50,
+        ports: List[int] = None,
+        https_ratio: float = 0.25,
+        slow_delay: float = 1.0,
+        page_rows: int = 200,
+        dns_delay: float = 0.05,
+        network: str = "127.0.1.0/24",
+        seed: int = 42,
+        duplicate_ratio: float = 0,
+    ):
+        """
+        Initialize the farm (nothing listens until start())
+
+        Args:
+            hosts: Number of loopback addresses to use
+            ports: Ports opened on every host
+            https_ratio: Fraction of listeners speaking TLS
+            slow_delay: Delay in seconds of the "slow" behaviour
+            page_rows: Filler rows in each HTML page, controls parsing cost
+            dns_delay: Latency in seconds of reverse_lookup
+            network: Loopback network the host addresses are taken from
+            seed: Random seed, the same seed always builds the same farm
+            duplicate_ratio: Fraction of "app" endpoints turned into another
+                app's alias, half redirecting to it ("alias_redirect"), half
+                serving its page over the same protocol ("mirror")
+        """
+        self.network = network
+        self.ports = ports or DEFAULT_PORTS
+        self.slow_delay = slow_delay
+        self.page_rows = page_rows
+        self.dns_delay = dns_delay
+        self.endpoints: List[FakeEndpoint] = []
+        self._servers = []
+        self._connections = set()
+        self._tmpdir = None
+
+        rng = random.Random(seed)
+        names, weights = zip(*BEHAVIOURS)
+        addresses = list(ipaddress.ip_network(network).hosts())[:hosts]
+        for address in addresses:
+            for port in self.ports:
+                self.endpoints.append(FakeEndpoint(
+                    ip=str(address),
+                    port=port,
+                    tls=rng.random() < https_ratio,
+                    behaviour=rng.choices(names, weights)[0],
+                    title=f"{rng.choice(APP_TITLES)} {address}:{port}",
+                ))
+
+        if duplicate_ratio:
+            # Separate generator, so the farm without duplicates stays the same
+            dup_rng = random.Random(seed + 1)
+            apps = [e for e in self.endpoints if e.behaviour == "app"]
+            aliases = [e for e in apps if dup_rng.random() < duplicate_ratio]
+            targets = [e for e in apps if e not in aliases]
+            for endpoint in aliases if targets else []:
+                endpoint.duplicate_of = dup_rng.choice(targets)
+                endpoint.behaviour = dup_rng.choice(["alias_redirect", "mirror"])
+                if endpoint.behaviour == "mirror":
+                    endpoint.tls = endpoint.duplicate_of.tls
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def _ssl_context(self) -> Optional[ssl.SSLContext]:
+        """Build a server context with a throwaway self-signed certificate"""
+        if not shutil.which("openssl"):
+            logger.warning("openssl not found, HTTPS listeners are served as plain HTTP")
+            return None
+
+        self._tmpdir = tempfile.mkdtemp(prefix="neondeck-bench-")
+        cert = os.path.join(self._tmpdir, "cert.pem")
+        key = os.path.join(self._tmpdir, "key.pem")
+        subprocess.run(
+            [
+                "openssl", "req", "-x509", "-nodes", "-days", "1",
+                "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+                "-keyout", key, "-out", cert, "-subj", "/CN=neondeck-bench",
+            ],
+            check=True,
+            capture_output=True,
+        )
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+        return context
+
+    async def start(self):
+        """Start listening on every endpoint"""
+        context = None
+        if any(e.tls for e in self.endpoints):
+            context = self._ssl_context()
+
+        for endpoint in self.endpoints:
+            if endpoint.tls and context is None:
+                endpoint.tls = False
+            server = await asyncio.start_server(
+                lambda r, w, e=endpoint: self._handle(e, r, w),
+                host=endpoint.ip,
+                port=endpoint.port,
+                ssl=context if endpoint.tls else None,
+            )
+            self._servers.append(server)
+
+        logger.info(f"Fake service farm listening on {len(self.endpoints)} endpoints in {self.network}")
+
+    async def stop(self):
+        """Close listeners and open connections"""
+        for server in self._servers:
+            server.close()
+        for writer in list(self._connections):
+            writer.close()
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    async def _handle(self, endpoint: FakeEndpoint, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            if endpoint.behaviour == "hanging":
+                # A wedged server: the kernel accepts, nothing ever answers (not even TLS)
+                await reader.read()
+                return
+            first = await reader.read(1)
+            if not first or first == b"\x16":
+                # Closed, or a TLS ClientHello sent to a plain HTTP port
+                return
+            request = first + await reader.readuntil(b"\r\n\r\n")
+            path = request.split(b" ", 2)[1].decode(errors="replace")
+
+            if endpoint.behaviour == "slow":
+                await asyncio.sleep(self.slow_delay)
+
+            status, headers, body = self._response(endpoint, path)
+            head = [f"HTTP/1.1 {status}", f"Content-Length: {len(body)}", "Connection: close"]
+            head += [f"{k}: {v}" for k, v in headers.items()]
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    def _response(self, endpoint: FakeEndpoint, path: str):
+        """Build (status line, headers, body) for a request"""
+        html = {"Content-Type": "text/html; charset=utf-8"}
+
+        if endpoint.behaviour == "alias_redirect" and path == "/":
+            target = endpoint.duplicate_of
+            location = f"{'https' if target.tls else 'http'}://{target.ip}:{target.port}/"
+            return "302 Found", {"Location": location}, b""
+
+        if endpoint.behaviour == "mirror":
+            return self._response(endpoint.duplicate_of, path)
+
+        if endpoint.behaviour == "error":
+            return "503 Service Unavailable", html, b"<html><body>down</body></html>"
+
+        if endpoint.behaviour == "redirect" and path == "/":
+            return "302 Found", {"Location": "/login"}, b""
+
+        if endpoint.behaviour == "bare":
+            return "200 OK", html, b"<html><body>It works!</body></html>"
+
+        if endpoint.behaviour == "svg_favicon":
+            svg = "<svg xmlns='http://www.w3.org/2000/svg'>" + "<circle r='1'/>" * 60 + "</svg>"
+            icon = f'<link rel="icon" href="data:image/svg+xml,{svg}">'
+        else:
+            icon = '<link rel="shortcut icon" href="/static/favicon.png">'
+
+        body = (
+            "<!DOCTYPE html><html><head>"
+            f"<title>{endpoint.title}</title>"
+            f'<meta name="description" content="Fake {endpoint.behaviour} service for benchmarks">'
+            f"{icon}</head><body>"
+            + "<div class='row'>lorem ipsum dolor sit amet</div>" * self.page_rows
+            + "</body></html>"
+        )
+        return "200 OK", html, body.encode()
+
+    def hostname(self, ip: str) -> str:
+        """PTR name of a farm address"""
+        return f"fake-{ip.replace('.', '-')}.bench"
+
+    async def reverse_lookup(self, ip: str) -> Optional[str]:
+        """Stub resolver for ReverseResolver: farm addresses resolve after dns_delay, others don't"""
+        await asyncio.sleep(self.dns_delay)
+        if any(endpoint.ip == ip for endpoint in self.endpoints):
+            return self.hostname(ip)
+        return None
+
+    def nmap_xml(self, targets: str, resolve: bool = True, ports: List[int] = None, ping_only: bool = False) -> str:
+        """
+        Render the nmap -oX output a real scan would produce
+
+        Args:
+            targets: Space separated addresses or networks
+            resolve: Include hostnames (False for -n)
+            ports: Ports scanned (default: all farm ports)
+            ping_only: Host sweep output, hosts without ports (-sn)
+        """
+        nets = [ipaddress.ip_network(target, strict=False) for target in targets.split()]
+        total = sum(net.num_addresses for net in nets)
+        by_host: Dict[str, List[FakeEndpoint]] = {}
+        for endpoint in self.endpoints:
+            address = ipaddress.ip_address(endpoint.ip)
+            if any(address in net for net in nets) and (ports is None or endpoint.port in ports):
+                by_host.setdefault(endpoint.ip, []).append(endpoint)
+        if ping_only:
+            # Every farm host answers pings, open ports or not
+            for endpoint in self.endpoints:
+                if any(ipaddress.ip_address(endpoint.ip) in net for net in nets):
+                    by_host.setdefault(endpoint.ip, [])
+
+        now = int(time.time())
+        scanned = ports or self.ports
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            f'<nmaprun scanner="nmap" args="nmap -oX - {targets}" start="{now}" version="7.94">',
+        ]
+        if not ping_only:
+            parts.append(
+                f'<scaninfo type="connect" protocol="tcp" numservices="{len(scanned)}" '
+                f'services="{",".join(map(str, scanned))}"/>'
+            )
+        for ip, endpoints in by_host.items():
+            parts.append('<host><status state="up" reason="syn-ack"/>')
+            parts.append(f'<address addr="{ip}" addrtype="ipv4"/>')
+            if resolve:
+                parts.append(f'<hostnames><hostname name="{self.hostname(ip)}" type="PTR"/></hostnames>')
+            else:
+                parts.append('<hostnames/>')
+            if not ping_only:
+                parts.append("<ports>")
+                for endpoint in endpoints:
+                    parts.append(
+                        f'<port protocol="tcp" portid="{endpoint.port}">'
+                        '<state state="open" reason="syn-ack" reason_ttl="0"/>'
+                        '<service name="http" method="table" conf="3"/></port>'
+                    )
+                parts.append("</ports>")
+            parts.append('<times srtt="150" rttvar="50" to="100000"/></host>')
+        parts.append(
+            f'<runstats><finished time="{now}" timestr="" elapsed="0.01"/>'
+            f'<hosts up="{len(by_host)}" down="{total - len(by_host)}" '
+            f'total="{total}"/></runstats></nmaprun>'
+        )
+        return "".join(parts)
+
+
+class FakeBannerServices:
+    """BANNER_STUBS listening on one loopback address"""
+
+    def __init__(self, ip: str = "127.0.2.1", stubs: List[Dict] = None):
+        self.ip = ip
+        self.stubs = stubs or BANNER_STUBS
+        self._servers = []
+        self._connections = set()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def hosts(self) -> List[Dict]:
+        """The stubs as NetworkScanner reports them"""
+        return [{
+            "ip": self.ip,
+            "ports": [
+                {"port": stub["port"], "protocol": "tcp", "service": stub["service"], "state": "open"}
+                for stub in self.stubs
+            ],
+        }]
+
+    async def start(self):
+        for stub in self.stubs:
+            server = await asyncio.start_server(
+                lambda r, w, s=stub: self._handle(s, r, w), host=self.ip, port=stub["port"]
+            )
+            self._servers.append(server)
+        logger.info(f"Fake banner services listening on {len(self.stubs)} ports of {self.ip}")
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+        for writer in list(self._connections):
+            writer.close()
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+
+    async def _handle(self, stub: Dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            if stub.get("greeting"):
+                writer.write(stub["greeting"])
+                await writer.drain()
+            if stub.get("hello"):
+                data = await reader.read(1024)
+                if data.startswith(stub["hello"]):
+                    writer.write(stub["reply"])
+                    await writer.drain()
+            # Like a real server, wait for the client to hang up
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+
+class CannedPortScanner(nmap.PortScanner):
+    """
+    nmap.PortScanner that answers from a FakeServiceFarm instead of running nmap
+
+    `probes` estimates the packets a real nmap run would have sent: one per
+    address and ping probe for host discovery (4 by default, skipped by
+    -Pn, the only phase of -sn), then one per live host and port.
+    """
+
+    def __init__(self, farm: FakeServiceFarm):
+        # Skip PortScanner.__init__, it looks for the nmap binary
+        self._nmap_path = ""
+        self._scan_result = {}
+        self._nmap_version_number = 7
+        self._nmap_subversion_number = 94
+        self._nmap_last_output = ""
+        self._PortScanner__process = None
+        self.farm = farm
+        self.probes = 0
+
+    def scan(self, hosts="127.0.0.1", ports=None, arguments="-sV", sudo=False, timeout=0):
+        args = (arguments or "").split()
+        resolve = "-n" not in args
+        ping_only = "-sn" in args
+        addresses = sum(ipaddress.ip_network(target, strict=False).num_addresses for target in hosts.split())
+
+        port_list = None
+        if "-p" in args:
+            port_list = [int(port) for port in args[args.index("-p") + 1].split(",")]
+        pings = [arg for arg in args if arg[:3] in ("-PE", "-PA", "-PS", "-PP")]
+        if "-Pn" not in args:
+            ping_probes = sum(len(arg[3:].split(",")) if arg[3:] else 1 for arg in pings) if pings else 4
+            self.probes += addresses * ping_probes
+        result = self.analyse_nmap_xml_scan(self.farm.nmap_xml(hosts, resolve, port_list, ping_only))
+        if not ping_only:
+            self.probes += len(self.all_hosts()) * len(port_list or self.farm.ports)
+        return result
@@ -0,0 +1,148 @@
+"""
+Inventory export/import benchmark
+
+Fills a scratch database with a synthetic inventory, exports it as NDJSON
+and CSV through the streaming endpoint, then imports both files into an
+empty database and once more over the existing rows (the update path of
+the upsert). Requests are sent straight to the ASGI app, not through
+httpx's ASGI transport, which buffers whole response bodies and would
+hide whether the export streams; the upload is sent in 64 KiB chunks.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.inventory_transfer --services 100000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+
+from sqlalchemy import delete
+
+from benchmarks.common import Stage, print_report, use_scratch_database
+from benchmarks.synthetic import populate
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def call(app, method: str, path: str, body_chunks=None, headers: dict = None, sink=None) -> int:
+    """
+    Run one request through the ASGI app
+
+    Args:
+        body_chunks: Iterable of request body chunks
+        sink: Called with every response body chunk (default: collected and returned as JSON)
+
+    Returns:
+        Response status, or the decoded JSON body when no sink is given
+    """
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(), "root_path": "", "server": ("bench", 80), "client": ("bench", 1),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    }
+    chunks = iter(body_chunks or [])
+    collected = []
+    status = []
+    done = asyncio.Event()
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if body_sent:
+            # Starlette listens for a disconnect while streaming a response
+            await done.wait()
+            return {"type": "http.disconnect"}
+        chunk = next(chunks, None)
+        body_sent = chunk is None
+        return {"type": "http.request", "body": chunk or b"", "more_body": chunk is not None}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body":
+            (sink or collected.append)(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    if status[0] != 200:
+        raise SystemExit(f"{method} {path}: HTTP {status[0]} {b''.join(collected)[:200]!r}")
+    return status[0] if sink else json.loads(b"".join(collected))
+
+
+async def download(app, path: str, target: str) -> int:
+    """Stream an export to a file, returns its size in bytes"""
+    size = 0
+    with open(target, "wb") as f:
+        def write(chunk: bytes):
+            nonlocal size
+            f.write(chunk)
+            size += len(chunk)
+        await call(app, "GET", path, sink=write)
+    return size
+
+
+async def upload(app, path: str, source: str, content_type: str) -> dict:
+    """POST a file in chunks, returns the import report"""
+
+    def chunks():
+        with open(source, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+
+    return await call(app, "POST", path, chunks(), {"content-type": content_type})
+
+
+async def run(args, directory: str) -> dict:
+    from database import AsyncSessionLocal
+    from main import app
+    from models import Service
+
+    await populate(args.services, seed=args.seed, reset=True)
+
+    results = {}
+    files = {fmt: os.path.join(directory, f"inventory.{fmt}") for fmt in ("ndjson", "csv")}
+    content_types = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+    for fmt, path in files.items():
+        with Stage(f"export_{fmt}", args.services) as stage:
+            size = await download(app, f"/api/inventory/export?format={fmt}", path)
+        results[stage.name] = stage.as_dict()
+        print(f"{fmt}: {size / 1024 / 1024:.1f} MiB")
+
+    for fmt, path in files.items():
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Service))
+            await db.commit()
+
+        for name in (f"import_{fmt}", f"reimport_{fmt}"):
+            with Stage(name, args.services) as stage:
+                report = await upload(app, f"/api/inventory/import?format={fmt}", path, content_types[fmt])
+            results[stage.name] = stage.as_dict()
+            if report["failed"] or report["imported"] != args.services:
+                raise SystemExit(f"{name}: unexpected report {report}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        use_scratch_database(tmp)
+        results = asyncio.run(run(args, tmp))
+
+    print_report(f"Inventory transfer: {args.services} services", results, unit="rows")
+
+
+if __name__ == "__main__":
+    main()
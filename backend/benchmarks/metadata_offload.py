@@ -0,0 +1,89 @@
+"""
+Event loop blocking benchmark for HTML metadata extraction
+
+Probes a farm of local fake services twice, once parsing HTML inline on
+the event loop and once in the metadata process pool, while a ticker
+coroutine measures how late the loop wakes it up. Lag is what API
+handlers sharing the loop, and probes waiting on their timeouts, see.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.metadata_offload [--hosts 50] [--page-rows 2000]
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from benchmarks.fake_services import CannedPortScanner, FakeServiceFarm
+
+TICK = 0.001
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    """Record how late each 1 ms sleep wakes up"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def measure(mode: str, hosts: list, timeout: float) -> dict:
+    from scanner import HTTPProbe
+
+    probe = HTTPProbe(timeout=timeout, metadata_mode=mode)
+    if mode == "process":
+        # Spawn the workers before measuring, as a long running worker would have
+        await probe._metadata_pool().extract(b"<title>warmup</title>", None, "http://warmup")
+
+    lags = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+    start = time.perf_counter()
+    services = await probe.probe_multiple(hosts)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+
+    lags.sort()
+    return {
+        "services": len(services),
+        "seconds": elapsed,
+        "max_lag_ms": lags[-1] * 1000 if lags else 0.0,
+        "p99_lag_ms": lags[int(len(lags) * 0.99)] * 1000 if lags else 0.0,
+        "blocked_ms": sum(lag for lag in lags if lag > 0.005) * 1000,
+    }
+
+
+async def run(args) -> dict:
+    from scanner import NetworkScanner
+
+    results = {}
+    async with FakeServiceFarm(hosts=args.hosts, page_rows=args.page_rows) as farm:
+        scanner = NetworkScanner([farm.network], farm.ports, port_scanner=CannedPortScanner(farm))
+        hosts = await scanner.scan_all_networks()
+        for mode in ("inline", "process"):
+            results[mode] = await measure(mode, hosts, args.probe_timeout)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", type=int, default=50, help="loopback hosts to start (4 ports each)")
+    parser.add_argument("--page-rows", type=int, default=2000, help="size of the fake HTML pages")
+    parser.add_argument("--probe-timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = asyncio.run(run(args))
+
+    print(f"\n{'mode':<10} {'services':>9} {'seconds':>9} {'max lag ms':>11} {'p99 lag ms':>11} {'blocked ms':>11}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<10} {r['services']:>9} {r['seconds']:>9.2f} {r['max_lag_ms']:>11.1f} "
+            f"{r['p99_lag_ms']:>11.1f} {r['blocked_ms']:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
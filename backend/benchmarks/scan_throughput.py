@@ -0,0 +1,149 @@
+"""
+End-to-end scan throughput benchmark
+
+Runs the scan path against a farm of local fake services and reports
+endpoints per second and peak Python memory for each stage:
+
+    discovery       NetworkScanner fed with canned nmap output (-n), sweeping
+                    --sweep-network (the farm sits in 127.0.1.0/24)
+    resolve         ReverseResolver over the discovered hosts, cold cache,
+                    stub lookups with --dns-delay latency
+    probe           HTTPProbe.probe_multiple against the live listeners
+    reprobe         the same with the response times of the first probe, as a
+                    rescan sees them (sizes adaptive timeouts)
+    categorize      ServiceCategorizer over the probe results
+    persist_new     reconcile_services into an empty scratch database
+    persist_rescan  reconcile_services again, every service already known
+
+Usage (from the backend directory):
+
+    python -m benchmarks.scan_throughput [--hosts 50] [--update-baseline]
+
+With --duplicate-ratio some farm apps are also reachable through alias
+endpoints; the report then shows how many redirects and page parses the
+probe skipped and how many services the aliases collapsed into.
+
+Exits with status 1 when a stage regresses beyond --tolerance of the
+stored baseline in benchmarks/baselines/scan_throughput.json.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+
+from benchmarks.common import Stage, check_baseline, print_report, use_scratch_database
+from benchmarks.fake_services import CannedPortScanner, FakeServiceFarm
+
+BASELINE = "scan_throughput"
+
+
+async def run(args) -> dict:
+    from database import AsyncSessionLocal, init_db
+    from api.scanner import reconcile_services
+    from scanner import NetworkScanner, HTTPProbe, ReverseResolver, ScanRateLimiter, ServiceCategorizer
+
+    await init_db()
+    results = {}
+
+    async with FakeServiceFarm(
+        hosts=args.hosts, slow_delay=args.slow_delay, dns_delay=args.dns_delay, duplicate_ratio=args.duplicate_ratio
+    ) as farm:
+        endpoints = len(farm.endpoints)
+
+        port_scanner = CannedPortScanner(farm)
+        network_scanner = NetworkScanner(
+            [args.sweep_network], args.ports, port_scanner=port_scanner, discovery=args.discovery
+        )
+        with Stage("discovery", endpoints) as stage:
+            hosts = await network_scanner.scan_all_networks()
+        results[stage.name] = stage.as_dict()
+        print(f"Discovery: ~{port_scanner.probes} nmap probes ({args.discovery})")
+
+        resolver = ReverseResolver(lookup=farm.reverse_lookup)
+        with Stage("resolve", len(hosts)) as stage:
+            await resolver.resolve_many(host["ip"] for host in hosts)
+        results[stage.name] = stage.as_dict()
+
+        rate_limiter = ScanRateLimiter(global_rate=0, subnet_rate=args.subnet_rate) if args.subnet_rate else None
+        http_probe = HTTPProbe(
+            timeout=args.probe_timeout,
+            adaptive_timeouts=not args.fixed_timeouts,
+            rate_limiter=rate_limiter,
+            concurrency=args.concurrency,
+        )
+        with Stage("probe", endpoints) as stage:
+            web_services = await http_probe.probe_multiple(hosts)
+        results[stage.name] = stage.as_dict()
+        print(f"Probe: {len(web_services)} web services, fingerprints {http_probe.fingerprints.stats}")
+
+        response_times = {(ws["ip"], ws["port"]): ws["response_time"] for ws in web_services}
+        with Stage("reprobe", endpoints) as stage:
+            await http_probe.probe_multiple(hosts, response_times)
+        results[stage.name] = stage.as_dict()
+
+        # What the next scheduled (not full sweep) scan would send, ports trimmed by history
+        history = {}
+        for ws in web_services:
+            ports = history.setdefault(network_scanner.subnet_of(ws["ip"]), {})
+            ports[ws["port"]] = ports.get(ws["port"], 0) + 1
+        trimmed_scanner = CannedPortScanner(farm)
+        await NetworkScanner(
+            [args.sweep_network], args.ports, port_scanner=trimmed_scanner,
+            discovery=args.discovery, port_history=history, full_sweep=False
+        ).scan_all_networks()
+        print(f"Rediscovery with port history: ~{trimmed_scanner.probes} nmap probes")
+
+    if rate_limiter:
+        print(f"Probe connections throttled for {rate_limiter.metrics()['throttled_seconds']:.1f} s in total")
+
+    categorizer = ServiceCategorizer()
+    with Stage("categorize", len(web_services)) as stage:
+        for web_service in web_services:
+            categorizer.categorize(web_service.get("title", ""), web_service["url"], web_service.get("description"))
+    results[stage.name] = stage.as_dict()
+
+    for scan_id, name in enumerate(("persist_new", "persist_rescan"), start=1):
+        with Stage(name, len(web_services)) as stage:
+            async with AsyncSessionLocal() as db:
+                counts = await reconcile_services(db, web_services, categorizer, scan_id)
+                await db.commit()
+        results[stage.name] = stage.as_dict()
+        if name == "persist_new":
+            print(f"Persisted {counts['new']} services from {len(web_services)} web services")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", type=int, default=50, help="loopback hosts to start (4 ports each)")
+    parser.add_argument("--probe-timeout", type=float, default=5.0, help="HTTPProbe (maximum) timeout in seconds")
+    parser.add_argument(
+        "--ports", type=lambda value: [int(p) for p in value.split(",")],
+        default="80,443,8080,8443,3000,5000,5001,8000,8081,9000,9090",
+        help="ports discovery scans (default: the SCAN_PORTS default, the farm listens on 8080,8443,3000,9000)",
+    )
+    parser.add_argument("--sweep-network", default="127.0.1.0/24", help="network discovery scans")
+    parser.add_argument("--discovery", default="two_phase", choices=["two_phase", "single"])
+    parser.add_argument("--concurrency", type=int, help="endpoints probed at once (default: PROBE_CONCURRENCY)")
+    parser.add_argument("--subnet-rate", type=float, help="rate limit probe connections into the farm's /24")
+    parser.add_argument("--fixed-timeouts", action="store_true", help="disable adaptive probe timeouts")
+    parser.add_argument("--slow-delay", type=float, default=1.0, help="response delay of slow services")
+    parser.add_argument("--duplicate-ratio", type=float, default=0, help="fraction of apps given an alias endpoint")
+    parser.add_argument("--dns-delay", type=float, default=0.05, help="stub reverse lookup latency")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression, 0.25 = 25%%")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        use_scratch_database(tmp)
+        results = asyncio.run(run(args))
+
+    print_report(f"Scan throughput ({args.hosts} hosts)", results, unit="endpoints")
+    sys.exit(check_baseline(BASELINE, results, args.tolerance, args.update_baseline))
+
+
+if __name__ == "__main__":
+    main()
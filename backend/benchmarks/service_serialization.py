@@ -0,0 +1,137 @@
+"""
+Service listing serialization benchmark
+
+Builds the body of GET /api/services over a synthetic inventory two ways:
+
+    legacy          load every row through the ORM, format_service() each,
+                    validate the list against ServiceResponse and encode it
+                    with json, as FastAPI does for a returned list of dicts
+    fragments_cold  the fragment path with an empty cache: id/version query,
+                    rows loaded and encoded with orjson, fragments joined
+    fragments_warm  the same with every fragment cached
+    fragments_touch the same after --touch of the rows changed (a rescan)
+
+Both bodies are checked to decode to the same list.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.service_serialization --services 10000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import tempfile
+import time
+from typing import List
+
+from benchmarks.common import use_scratch_database
+from benchmarks.synthetic import populate
+
+
+async def legacy_body(db) -> bytes:
+    """The listing as built before fragments"""
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+    from api.services import ServiceResponse, format_service
+    from models import Service
+
+    result = await db.execute(
+        select(Service).options(selectinload(Service.category))
+        .where(Service.is_hidden == False).order_by(Service.name)
+    )
+    content = [format_service(s) for s in result.scalars().all()]
+    adapter = TypeAdapter(List[ServiceResponse])
+    validated = adapter.dump_python(adapter.validate_python(content), mode="json")
+    return json.dumps(validated, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+async def fragments_body(db) -> bytes:
+    from api.services import get_services
+    response = await get_services(category_id=None, status=None, search=None, db=db)
+    return response.body
+
+
+async def measure(build, repeat: int, items: int, prepare=None) -> tuple:
+    """
+    Median wall time of `repeat` builds, each in a new session
+
+    Returns:
+        ({items, seconds, items_per_sec, body_kib}, last body)
+    """
+    from database import AsyncSessionLocal
+
+    timings = []
+    for _ in range(repeat):
+        if prepare:
+            await prepare()
+        async with AsyncSessionLocal() as db:
+            start = time.perf_counter()
+            body = await build(db)
+            timings.append(time.perf_counter() - start)
+    seconds = statistics.median(timings)
+    return {
+        "items": items,
+        "seconds": round(seconds, 4),
+        "items_per_sec": round(items / seconds, 2),
+        "body_kib": round(len(body) / 1024, 1),
+    }, body
+
+
+async def run(args) -> dict:
+    from sqlalchemy import select, update
+    from api.fragments import service_fragments
+    from database import AsyncSessionLocal
+    from models import Service
+
+    await populate(args.services, seed=args.seed, reset=True)
+    async with AsyncSessionLocal() as db:
+        ids = (await db.execute(select(Service.id).order_by(Service.id))).scalars().all()
+    touched = ids[::max(1, round(1 / args.touch))] if args.touch else []
+
+    async def cold():
+        service_fragments.clear()
+
+    async def touch():
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Service).where(Service.id.in_(touched)).values(response_time=Service.response_time))
+            await db.commit()
+
+    results = {}
+    results["legacy"], legacy = await measure(legacy_body, args.repeat, len(ids))
+    results["fragments_cold"], body = await measure(fragments_body, args.repeat, len(ids), cold)
+    if json.loads(body) != json.loads(legacy):
+        raise SystemExit("fragment body differs from the legacy body")
+    results["fragments_warm"], _ = await measure(fragments_body, args.repeat, len(ids))
+    results["fragments_touch"], body = await measure(fragments_body, args.repeat, len(ids), touch)
+    if json.loads(body) != json.loads(legacy):
+        raise SystemExit("fragment body differs from the legacy body after touching rows")
+    print(f"Touched {len(touched)} rows per fragments_touch build")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5, help="builds per stage, the median is reported")
+    parser.add_argument("--touch", type=float, default=0.01, help="fraction of rows changed before each build")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        use_scratch_database(tmp)
+        results = asyncio.run(run(args))
+
+    print(f"\nService listing: {args.services} services (median of {args.repeat} builds)")
+    print(f"{'stage':<20} {'seconds':>10} {'rows/s':>14} {'body KiB':>12}")
+    for name, r in results.items():
+        print(f"{name:<20} {r['seconds']:>10.3f} {r['items_per_sec']:>14.1f} {r['body_kib']:>12.1f}")
+    speedup = results["legacy"]["seconds"] / results["fragments_warm"]["seconds"]
+    print(f"\nWarm fragments: {speedup:.1f}x faster than legacy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+API cold start benchmark
+
+Starts fresh interpreters that import `main` and run the app's lifespan
+startup against a scratch database, the way a restarted pod boots:
+
+    import          `import main`, the whole module graph of the API
+    first_boot      lifespan startup on an empty database (schema setup)
+    boot            lifespan startup on a set-up database, median of --runs
+
+One more run under `python -X importtime` lists the slowest imports
+(--report FILE keeps the raw output). The API must not import the
+scanning stack (nmap, httpx, bs4...) until a scan runs.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.startup [--runs 5] [--import-budget 2.0] [--startup-budget 0.5]
+
+Exits with status 1 when the median import or boot time exceeds its
+budget, or when a scanning module was imported at startup.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import use_scratch_database
+
+# Written to stderr right before `import main`, the importtime lines after it are main's
+MARKER = "-- import main --"
+
+# Only loaded when a scan runs
+SCAN_MODULES = ["scanner", "nmap", "httpx", "bs4", "cryptography", "numpy"]
+
+CHILD = """
+import asyncio, json, sys, time
+sys.stderr.write({marker!r} + "\\n")
+sys.stderr.flush()
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+eager = [m for m in {modules!r} if m in sys.modules]
+
+async def boot():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+booted = asyncio.run(boot())
+print(json.dumps({{"import": imported - start, "startup": booted - imported, "eager": eager}}))
+"""
+
+
+def boot(env: dict, importtime: bool = False) -> tuple:
+    """
+    Boot the API once in a fresh interpreter
+
+    Returns:
+        (timings dict, stderr: the -X importtime report when requested)
+    """
+    command = [sys.executable] + (["-X", "importtime"] if importtime else [])
+    command += ["-c", CHILD.format(marker=MARKER, modules=SCAN_MODULES)]
+    process = subprocess.run(command, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise SystemExit(f"API failed to start:\n{process.stderr[-2000:]}")
+    return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+
+def slowest_imports(report: str, top: int = 10) -> list:
+    """
+    Modules imported directly by main, slowest first
+
+    Returns:
+        (cumulative milliseconds, module) pairs
+    """
+    imports = []
+    for line in report.partition(MARKER)[2].splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # Header
+        # Nesting is shown by indentation: main has 1 space, the modules it imports 3
+        if len(name) - len(name.lstrip()) == 3:
+            imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="boots on the set-up database")
+    parser.add_argument("--import-budget", type=float, default=2.0, help="seconds allowed for `import main`")
+    parser.add_argument("--startup-budget", type=float, default=0.5, help="seconds allowed for lifespan startup")
+    parser.add_argument("--report", help="write the -X importtime output to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, LOG_LEVEL="WARNING")
+        env["DATABASE_URL"] = use_scratch_database(tmp)
+
+        first, _ = boot(env)
+        runs = [boot(env)[0] for _ in range(args.runs)]
+        _, report = boot(env, importtime=True)
+
+    import_time = statistics.median(run["import"] for run in runs)
+    startup_time = statistics.median(run["startup"] for run in runs)
+    eager = sorted({module for run in [first] + runs for module in run["eager"]})
+
+    print(f"\nAPI cold start ({args.runs} runs)")
+    print(f"{'phase':<20} {'seconds':>10} {'budget':>10}")
+    print(f"{'import':<20} {import_time:>10.3f} {args.import_budget:>10.3f}")
+    print(f"{'first_boot':<20} {first['startup']:>10.3f} {'':>10}")
+    print(f"{'boot':<20} {startup_time:>10.3f} {args.startup_budget:>10.3f}")
+
+    print("\nSlowest imports of main (cumulative, under -X importtime)")
+    for milliseconds, module in slowest_imports(report):
+        print(f"  {milliseconds:>8.1f} ms  {module}")
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(report)
+        print(f"Import time report written to {args.report}")
+
+    failures = []
+    if import_time > args.import_budget:
+        failures.append(f"import: {import_time:.3f}s over the {args.import_budget:.3f}s budget")
+    if startup_time > args.startup_budget:
+        failures.append(f"boot: {startup_time:.3f}s over the {args.startup_budget:.3f}s budget")
+    if eager:
+        failures.append(f"scanning modules imported at startup: {', '.join(eager)}")
+    if failures:
+        print("\nStartup budget exceeded:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nWithin budget")
+
+
+if __name__ == "__main__":
+    main()
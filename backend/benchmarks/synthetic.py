@@ -0,0 +1,169 @@
+"""
+Synthetic inventory generator
+
+Fills the categories, services and scan_history tables with a realistic,
+reproducible inventory: a skewed category mix, a few uncategorized and
+hidden services, mostly active hosts clustered in a handful of /24
+subnets, common web ports and log-normal response times. The same seed
+always produces the same rows.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.synthetic --services 10000 [--database-url URL] [--reset]
+"""
+import argparse
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+from benchmarks.fake_services import APP_TITLES
+
+# (category, weight), None means uncategorized
+CATEGORY_WEIGHTS = [
+    ("Infrastructure", 20), ("Monitoring", 18), ("Media", 12), ("Automation", 8),
+    ("Storage", 10), ("Development", 10), ("Security", 5), ("Networking", 7), (None, 10),
+]
+PORT_WEIGHTS = [
+    (80, 25), (443, 25), (8080, 15), (8443, 8), (3000, 8), (5000, 4),
+    (5001, 3), (8000, 5), (8081, 3), (9000, 2), (9090, 2),
+]
+DESCRIPTIONS = [
+    None, None, "Web interface", "Admin console", "Self-hosted dashboard",
+    "Metrics and alerting", "Media server", "Network storage",
+]
+BATCH_SIZE = 1000
+
+
+def generate_services(count: int, category_ids: dict, seed: int = 42, now: datetime = None) -> list:
+    """
+    Build service rows as dicts ready for a bulk insert
+
+    Args:
+        count: Number of services
+        category_ids: Category name -> id
+        seed: Random seed
+        now: Reference time for last_seen (default: utcnow)
+
+    Returns:
+        List of column dicts
+    """
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    cat_names, cat_weights = zip(*CATEGORY_WEIGHTS)
+    ports, port_weights = zip(*PORT_WEIGHTS)
+    subnets = [f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}" for _ in range(max(1, count // 200))]
+
+    rows = []
+    for i in range(count):
+        ip = f"{rng.choice(subnets)}.{rng.randint(1, 254)}"
+        port = rng.choices(ports, port_weights)[0]
+        protocol = "https" if port in (443, 8443) or rng.random() < 0.2 else "http"
+        category = rng.choices(cat_names, cat_weights)[0]
+        is_manual = rng.random() < 0.1
+        last_seen = now - timedelta(minutes=rng.expovariate(1 / 1440))
+
+        rows.append({
+            "name": f"{rng.choice(APP_TITLES)} {i}",
+            "url": f"{protocol}://{ip}:{port}/s{i}",
+            "description": rng.choice(DESCRIPTIONS),
+            "favicon_url": f"{protocol}://{ip}:{port}/favicon.ico",
+            "category_id": category_ids.get(category),
+            "ip_address": ip,
+            "port": port,
+            "protocol": protocol,
+            "status": "active" if rng.random() < 0.85 else "inactive",
+            "response_time": int(rng.lognormvariate(4, 0.8)),
+            "last_seen": last_seen,
+            "first_discovered": last_seen - timedelta(days=rng.randint(0, 365)),
+            "is_manual": is_manual,
+            "is_category_manual": is_manual or rng.random() < 0.05,
+            "is_hidden": rng.random() < 0.03,
+            "extra_data": {},
+            "created_at": last_seen,
+            "updated_at": last_seen,
+        })
+    return rows
+
+
+def generate_scan_history(count: int, services: int, seed: int = 42, now: datetime = None) -> list:
+    """Build one scan_history row per day going back `count` days"""
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    rows = []
+    for day in range(count):
+        started = (now - timedelta(days=day)).replace(hour=4, minute=0, second=0, microsecond=0)
+        failed = rng.random() < 0.05
+        rows.append({
+            "started_at": started,
+            "completed_at": started + timedelta(seconds=rng.randint(60, 1800)),
+            "services_found": 0 if failed else int(services * rng.uniform(0.8, 0.9)),
+            "new_services": 0 if failed else rng.randint(0, max(1, services // 100)),
+            "removed_services": 0 if failed else rng.randint(0, max(1, services // 200)),
+            "status": "failed" if failed else "completed",
+            "error_message": "nmap: host timeout" if failed else None,
+            "scan_config": {},
+        })
+    return rows
+
+
+async def populate(services: int = 10000, scans: int = 30, seed: int = 42, reset: bool = False) -> dict:
+    """
+    Fill the configured database with a synthetic inventory
+
+    Args:
+        services: Number of services to create
+        scans: Number of scan history rows
+        seed: Random seed
+        reset: Delete existing services and scan history first
+
+    Returns:
+        Category name -> id of the populated database
+    """
+    from database import AsyncSessionLocal, init_db, seed_categories
+    from models import Category, Service, ScanHistory
+
+    await init_db()
+    await seed_categories()
+
+    async with AsyncSessionLocal() as db:
+        if reset:
+            await db.execute(delete(Service))
+            await db.execute(delete(ScanHistory))
+            await db.commit()
+        elif (await db.execute(select(func.count(Service.id)))).scalar():
+            raise SystemExit("services table is not empty, pass --reset to replace its content")
+
+        result = await db.execute(select(Category))
+        category_ids = {c.name: c.id for c in result.scalars()}
+
+        now = datetime.utcnow()
+        rows = generate_services(services, category_ids, seed, now)
+        for start in range(0, len(rows), BATCH_SIZE):
+            await db.execute(insert(Service), rows[start:start + BATCH_SIZE])
+        await db.execute(insert(ScanHistory), generate_scan_history(scans, services, seed, now))
+        await db.commit()
+
+    return category_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=10000)
+    parser.add_argument("--scans", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="target database (default: DATABASE_URL)")
+    parser.add_argument("--reset", action="store_true", help="delete existing services and scan history first")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    asyncio.run(populate(args.services, args.scans, args.seed, args.reset))
+    print(f"Inserted {args.services} services and {args.scans} scans")
+
+
+if __name__ == "__main__":
+    main()
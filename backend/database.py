@@ -3,9 +3,17 @@ Database configuration and session management
 Supports SQLite for development and PostgreSQL for production
 """
 import os
+import hashlib
+import logging
+from datetime import datetime
+from sqlalchemy import event, inspect, literal, select, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from models import Base
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.exc import IntegrityError
+from models import Base, SchemaVersion
+
+logger = logging.getLogger(__name__)
 
 # Default to SQLite for development, PostgreSQL for production
 DATABASE_URL = os.getenv(
@@ -13,16 +21,57 @@ DATABASE_URL = os.getenv(
     "sqlite+aiosqlite:///./data/neondeck.db"
 )
 
+# "auto" (default): set the schema up only when the models changed since
+# the last setup, "always": on every start
+DB_SCHEMA_SETUP = os.getenv("DB_SCHEMA_SETUP", "auto")
+
+# SQLite profile: "development" (default) or "production"
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "development")
+
+# Pragmas applied to every connection of the production SQLite profile
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB, 64 MiB
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),  # milliseconds
+}
+
+# Engine used for reads in the production SQLite profile, None otherwise
+read_engine = None
+
 # Handle SQLite vs PostgreSQL
 if DATABASE_URL.startswith("sqlite"):
     # SQLite - create data directory if needed
     import os
     os.makedirs("data", exist_ok=True)
-    engine = create_async_engine(
-        DATABASE_URL,
-        echo=os.getenv("LOG_LEVEL") == "DEBUG",
-        connect_args={"check_same_thread": False}
-    )
+    if SQLITE_PROFILE == "production":
+        # Single writer connection: write transactions queue for it in the
+        # pool instead of failing with "database is locked"
+        engine = create_async_engine(
+            DATABASE_URL,
+            echo=os.getenv("LOG_LEVEL") == "DEBUG",
+            connect_args={"check_same_thread": False},
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=int(os.getenv("SQLITE_WRITE_TIMEOUT", "30")),
+        )
+        # Read pool, WAL lets these run while the writer commits
+        read_engine = create_async_engine(
+            DATABASE_URL,
+            echo=os.getenv("LOG_LEVEL") == "DEBUG",
+            connect_args={"check_same_thread": False},
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=int(os.getenv("SQLITE_READ_POOL_SIZE", "5")),
+            max_overflow=0,
+        )
+    else:
+        engine = create_async_engine(
+            DATABASE_URL,
+            echo=os.getenv("LOG_LEVEL") == "DEBUG",
+            connect_args={"check_same_thread": False}
+        )
 else:
     # PostgreSQL
     engine = create_async_engine(
@@ -33,16 +82,65 @@ else:
         max_overflow=20,
     )
 
+
+def _apply_pragmas(dbapi_connection, read_only: bool):
+    """Apply SQLITE_PRAGMAS to a new connection"""
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    if read_only:
+        # Writes must go through the writer connection
+        cursor.execute("PRAGMA query_only=1")
+    cursor.close()
+
+
+def _is_write(clause) -> bool:
+    """True for INSERT/UPDATE/DELETE and SELECT ... FOR UPDATE"""
+    if clause is None:
+        return False
+    return getattr(clause, "is_dml", False) or getattr(clause, "_for_update_arg", None) is not None
+
+
+class RoutingSession(Session):
+    """
+    Session for the production SQLite profile
+
+    Reads go to the read pool. Flushes and DML go to the writer connection,
+    and stay there until the transaction ends so the session reads its own
+    uncommitted writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or self.info.get("writer") or _is_write(clause):
+            self.info["writer"] = True
+            return engine.sync_engine
+        return read_engine.sync_engine
+
+
+if read_engine is not None:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _writer_connect(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, read_only=False)
+
+    @event.listens_for(read_engine.sync_engine, "connect")
+    def _reader_connect(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, read_only=True)
+
+    @event.listens_for(RoutingSession, "after_transaction_end")
+    def _release_writer(session, transaction):
+        if transaction.parent is None:
+            session.info.pop("writer", None)
+
 # Create async session maker
 AsyncSessionLocal = sessionmaker(
     engine,
     class_=AsyncSession,
+    sync_session_class=RoutingSession if read_engine is not None else Session,
     expire_on_commit=False,
     autocommit=False,
     autoflush=False,
 )
 
-
 async def get_db():
     """Dependency to get database session"""
     async with AsyncSessionLocal() as session:
@@ -52,14 +150,124 @@ async def get_db():
             await session.close()
 
 
+async def begin_snapshot(db: AsyncSession):
+    """
+    Make the session's next reads see one snapshot of the database
+    
+    Must be called before the session's first statement. PostgreSQL runs
+    the transaction as REPEATABLE READ; pysqlite only opens a transaction
+    before writes, so on SQLite a deferred one is opened explicitly and
+    every read in it sees the database as of the first one.
+    """
+    if engine.dialect.name == "postgresql":
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    else:
+        await db.execute(text("BEGIN"))
+
+
 async def init_db():
-    """Initialize database tables"""
+    """
+    Initialize database tables
+    
+    Creating tables, adding missing columns and seeding inspect the whole
+    schema, which slows every restart. They are skipped when the schema
+    was already set up for the current models (see schema_version()).
+    """
+    version = schema_version()
+    if DB_SCHEMA_SETUP != "always":
+        async with engine.connect() as conn:
+            if await conn.run_sync(_recorded_version) == version:
+                logger.info(f"Database schema is current ({version[:12]}), skipping setup")
+                return
+    
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
     
     # Seed default categories for SQLite
     if DATABASE_URL.startswith("sqlite"):
         await seed_categories()
+    
+    # Recorded last, an interrupted setup runs again on the next start
+    async with engine.begin() as conn:
+        await conn.run_sync(_record_version, version)
+    logger.info(f"Database schema set up ({version[:12]})")
+
+
+def schema_version() -> str:
+    """
+    Fingerprint of the models: tables, columns (type, nullability, scalar
+    default) and indexes, so any model change triggers a setup
+    """
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(f"table {table.name}")
+        for column in table.columns:
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            parts.append(f"column {column.name} {column.type!r} {column.nullable} {default!r}")
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            parts.append(f"index {index.name} {list(index.columns.keys())} {index.unique}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def _recorded_version(sync_conn):
+    """Schema version recorded by the last setup, None before the first one"""
+    if not inspect(sync_conn).has_table(SchemaVersion.__tablename__):
+        return None
+    return sync_conn.execute(
+        select(SchemaVersion.version).where(SchemaVersion.name == "models")
+    ).scalar_one_or_none()
+
+
+def _record_version(sync_conn, version: str):
+    values = {"version": version, "applied_at": datetime.utcnow()}
+    updated = sync_conn.execute(
+        SchemaVersion.__table__.update().where(SchemaVersion.name == "models").values(**values)
+    )
+    if updated.rowcount == 0:
+        try:
+            with sync_conn.begin_nested():
+                sync_conn.execute(SchemaVersion.__table__.insert().values(name="models", **values))
+        except IntegrityError:
+            # Another instance recorded it first
+            pass
+
+
+def _add_missing_columns(sync_conn):
+    """
+    Add model columns and indexes missing from existing tables
+    
+    create_all only creates missing tables, so columns added to a model
+    later are added here with ALTER TABLE, with their scalar default (if
+    any) as server default so existing rows get it too. Indexes added to
+    a model (on new or existing columns) are created after them.
+    """
+    inspector = inspect(sync_conn)
+    dialect = sync_conn.dialect
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect)}"
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if isinstance(default, (bool, int, float, str)):
+                rendered = literal(default, column.type).compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+                ddl += f" DEFAULT {rendered}"
+            sync_conn.execute(text(ddl))
+            logger.info(f"Added column {table.name}.{column.name}")
+        
+        # Matched by columns: init.sql names its indexes differently, and keys are indexed already
+        covered = [tuple(index["column_names"]) for index in inspector.get_indexes(table.name)]
+        covered += [tuple(unique["column_names"]) for unique in inspector.get_unique_constraints(table.name)]
+        covered.append(tuple(inspector.get_pk_constraint(table.name)["constrained_columns"]))
+        for index in table.indexes:
+            columns = tuple(index.columns.keys())
+            if not any(indexed[:len(columns)] == columns for indexed in covered):
+                index.create(sync_conn, checkfirst=True)
+                logger.info(f"Added index {index.name}")
 
 
 async def seed_categories():
@@ -0,0 +1,345 @@
+"""
+Database-backed scan job queue
+
+/scan/trigger and the scheduler only enqueue rows in scan_jobs. Scan
+workers (worker.py, or the API leader in embedded mode) claim them under
+a lease, report progress into the row and renew the lease while the scan
+runs. A job whose worker died is claimed again once its lease expires.
+At most SCAN_MAX_CONCURRENT jobs run at once, higher priorities first.
+"""
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import select, update, func, text, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from database import AsyncSessionLocal, engine
+from models import ScanJob, ScanHistory
+
+logger = logging.getLogger(__name__)
+
+# "embedded": the API leader runs jobs itself, "external": only worker.py does
+SCAN_WORKER_MODE = os.getenv("SCAN_WORKER_MODE", "embedded")
+
+JOB_LEASE_SECONDS = int(os.getenv("SCAN_JOB_LEASE", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("SCAN_JOB_MAX_ATTEMPTS", "3"))
+
+# Scans running at once across all workers
+SCAN_MAX_CONCURRENT = int(os.getenv("SCAN_MAX_CONCURRENT", "1"))
+
+# PostgreSQL advisory lock serializing claims, so the concurrency cap holds
+CLAIM_LOCK_KEY = 0x5CA4
+
+ACTIVE_STATUSES = ["queued", "running"]
+
+
+async def get_active_job(db: AsyncSession) -> Optional[ScanJob]:
+    """Most recent running job, else most recent queued one, if any"""
+    result = await db.execute(
+        select(ScanJob)
+        .where(ScanJob.status.in_(ACTIVE_STATUSES))
+        .order_by((ScanJob.status == "running").desc(), ScanJob.created_at.desc())
+    )
+    return result.scalars().first()
+
+
+async def active_job_for(db: AsyncSession, schedule_id: Optional[int]) -> Optional[ScanJob]:
+    """Queued or running job of a schedule, or of the manual and daily scans with None"""
+    condition = ScanJob.schedule_id.is_(None) if schedule_id is None else ScanJob.schedule_id == schedule_id
+    result = await db.execute(
+        select(ScanJob)
+        .where(ScanJob.status.in_(ACTIVE_STATUSES), condition)
+        .order_by(ScanJob.created_at.desc())
+    )
+    return result.scalars().first()
+
+
+async def enqueue_scan(
+    db: AsyncSession,
+    priority: int = 0,
+    payload: dict = None,
+    schedule_id: Optional[int] = None
+) -> ScanJob:
+    """
+    Queue a scan job, or return the one already queued or running for the same schedule
+
+    A queued job asked for again with a higher priority takes that
+    priority, so a manual trigger overtakes lower-priority queued work.
+
+    Args:
+        db: Database session (committed by this function)
+        priority: Higher priority jobs are claimed first
+        payload: Scan parameters for the worker
+        schedule_id: ScanSchedule queuing the job (default: a scan of every network)
+
+    Returns:
+        The queued or already active job
+    """
+    job = await active_job_for(db, schedule_id)
+    if job:
+        if job.status == "queued" and (job.priority or 0) < priority:
+            job.priority = priority
+            await db.commit()
+            logger.info(f"Raised scan job {job.id} to priority {priority}")
+        return job
+
+    job = ScanJob(status="queued", priority=priority, payload=payload or {}, schedule_id=schedule_id)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    logger.info(f"Queued scan job {job.id}")
+    return job
+
+
+async def enqueue_resume(db: AsyncSession, scan_id: int, priority: int = 0, units: list = None) -> ScanJob:
+    """
+    Queue a job running a scan's incomplete units again, or return the one already active for it
+
+    Args:
+        db: Database session (committed by this function)
+        scan_id: ScanHistory entry to resume
+        priority: Higher priority jobs are claimed first
+        units: ScanUnit ids to run (default: every unit not completed)
+
+    Returns:
+        The queued or already active job
+    """
+    result = await db.execute(
+        select(ScanJob)
+        .where(ScanJob.scan_id == scan_id, ScanJob.status.in_(ACTIVE_STATUSES))
+        .order_by(ScanJob.created_at.desc())
+    )
+    job = result.scalars().first()
+    if job:
+        return job
+
+    # Still counts as a run of the schedule that queued the scan
+    result = await db.execute(
+        select(ScanJob.schedule_id).where(ScanJob.scan_id == scan_id).order_by(ScanJob.created_at.desc()).limit(1)
+    )
+    job = ScanJob(
+        status="queued",
+        priority=priority,
+        payload={"units": units} if units else {},
+        schedule_id=result.scalar(),
+        scan_id=scan_id
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    logger.info(f"Queued scan job {job.id} resuming scan {scan_id}")
+    return job
+
+
+def _claimable(now: datetime):
+    """Queued jobs, and running jobs whose worker stopped renewing the lease"""
+    return or_(
+        ScanJob.status == "queued",
+        and_(ScanJob.status == "running", ScanJob.lease_expires_at < now),
+    )
+
+
+def _below_concurrency_cap(now: datetime):
+    """Fewer than SCAN_MAX_CONCURRENT jobs hold a live lease"""
+    running = aliased(ScanJob)
+    count = (
+        select(func.count())
+        .select_from(running)
+        .where(running.status == "running", running.lease_expires_at >= now)
+        .scalar_subquery()
+    )
+    return count < SCAN_MAX_CONCURRENT
+
+
+async def claim_job(worker_id: str) -> Optional[ScanJob]:
+    """
+    Claim the next job for a worker
+
+    The candidate is selected with FOR UPDATE SKIP LOCKED on PostgreSQL; the
+    claiming UPDATE repeats the claimable condition, so on SQLite (no row
+    locks) only one of several racing workers gets the row. The UPDATE also
+    checks the concurrency cap; SQLite runs it under the database write
+    lock and PostgreSQL claims under an advisory lock, so racing workers
+    can't both take the last slot.
+
+    Returns:
+        The claimed job, None when the queue is empty or the cap is reached
+    """
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        if engine.dialect.name == "postgresql":
+            await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CLAIM_LOCK_KEY})
+        result = await db.execute(
+            select(ScanJob)
+            .where(_claimable(now))
+            .order_by(ScanJob.priority.desc(), ScanJob.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job = result.scalars().first()
+        if job is None:
+            return None
+
+        if job.attempts >= JOB_MAX_ATTEMPTS:
+            await _give_up(db, job)
+            return None
+
+        result = await db.execute(
+            update(ScanJob)
+            .where(ScanJob.id == job.id, _claimable(now), _below_concurrency_cap(now))
+            .values(
+                status="running",
+                claimed_by=worker_id,
+                lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                attempts=ScanJob.attempts + 1,
+                started_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount != 1:
+            return None
+
+        await db.refresh(job)
+        logger.info(f"Worker {worker_id} claimed scan job {job.id} (attempt {job.attempts})")
+        return job
+
+
+async def _give_up(db: AsyncSession, job: ScanJob):
+    """Fail a job that keeps losing its worker"""
+    job.status = "failed"
+    job.error_message = f"Gave up after {job.attempts} attempts"
+    job.completed_at = datetime.utcnow()
+    if job.scan_id:
+        await db.execute(
+            update(ScanHistory)
+            .where(ScanHistory.id == job.scan_id, ScanHistory.status == "running")
+            .values(status="failed", error_message=job.error_message, completed_at=job.completed_at)
+        )
+    await db.commit()
+    logger.error(f"Scan job {job.id}: {job.error_message}")
+
+
+async def update_job(job_id: int, worker_id: str, **values) -> bool:
+    """
+    Update a job we hold and extend its lease
+
+    Returns:
+        False when the lease was lost to another worker
+    """
+    values["lease_expires_at"] = datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(ScanJob)
+            .where(ScanJob.id == job_id, ScanJob.claimed_by == worker_id)
+            .values(**values)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+
+class ScanWorker:
+    """Claims scan jobs and runs them"""
+
+    def __init__(self, worker_id: str = None, poll_interval: float = None):
+        """
+        Initialize a scan worker
+
+        Args:
+            worker_id: Name recorded on claimed jobs (default: host:pid:random)
+            poll_interval: Seconds between queue polls (default: SCAN_WORKER_POLL or 5)
+        """
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.poll_interval = poll_interval or float(os.getenv("SCAN_WORKER_POLL", "5"))
+
+    async def run_once(self) -> bool:
+        """
+        Claim and run one job
+
+        Returns:
+            True if a job was run
+        """
+        job = await claim_job(self.worker_id)
+        if job is None:
+            return False
+        await self.run_job(job)
+        return True
+
+    async def run_forever(self, enabled: Callable[[], bool] = None):
+        """
+        Poll the queue until cancelled
+
+        Args:
+            enabled: Only claim jobs while this returns True (e.g. leadership)
+        """
+        logger.info(f"Scan worker {self.worker_id} started")
+        while True:
+            ran = False
+            if enabled is None or enabled():
+                try:
+                    ran = await self.run_once()
+                except Exception as e:
+                    logger.error(f"Scan worker error: {e}", exc_info=True)
+            if not ran:
+                await asyncio.sleep(self.poll_interval)
+
+    async def run_job(self, job: ScanJob):
+        """Run a claimed job, renewing its lease and recording progress"""
+        from api.scanner import perform_scan
+
+        async def report(progress: dict):
+            await update_job(job.id, self.worker_id, progress=progress)
+
+        async def on_start(scan_id: int):
+            await update_job(job.id, self.worker_id, scan_id=scan_id)
+
+        running = asyncio.create_task(perform_scan(
+            job.scan_id,
+            networks=job.payload.get("networks"),
+            ports=job.payload.get("ports"),
+            full_sweep=job.payload.get("full_sweep"),
+            units=job.payload.get("units"),
+            progress=report,
+            on_start=on_start,
+        ))
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            await asyncio.wait({running, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            heartbeat.cancel()
+            if not running.done():
+                running.cancel()
+                await asyncio.wait({running})
+        if running.cancelled():
+            # The job's new holder resumes the scan from its unfinished units
+            logger.warning(f"Abandoned scan job {job.id} after losing its lease")
+            return
+        scan = running.result()
+
+        if scan is not None and scan.status == "completed":
+            await update_job(job.id, self.worker_id, status="completed", completed_at=datetime.utcnow())
+        else:
+            await update_job(
+                job.id,
+                self.worker_id,
+                status="failed",
+                error_message=scan.error_message if scan is not None else "Scan did not start",
+                completed_at=datetime.utcnow(),
+            )
+
+    async def _heartbeat(self, job_id: int):
+        """Renew the lease until cancelled, returns when the lease is lost"""
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                if not await update_job(job_id, self.worker_id):
+                    logger.warning(f"Lost the lease on scan job {job_id}")
+                    return
+            except Exception as e:
+                logger.error(f"Scan job {job_id} heartbeat failed: {e}")
@@ -0,0 +1,140 @@
+"""
+Database-backed leader election
+
+Every API worker serves reads, but only the one holding the lease runs
+scans. The leader renews its lease on a heartbeat; when it dies the lease
+expires and another worker takes over on its next heartbeat.
+"""
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import AsyncSessionLocal
+from models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElector:
+    """Lease-based leader election backed by the scheduler_leases table"""
+
+    def __init__(self, name: str = "scheduler", ttl: int = None, heartbeat: int = None):
+        """
+        Initialize leader election
+
+        Args:
+            name: Lease name, workers competing for the same role share it
+            ttl: Lease duration in seconds (default: LEADER_LEASE_TTL or 30)
+            heartbeat: Renewal interval in seconds (default: LEADER_HEARTBEAT or ttl / 3)
+        """
+        self.name = name
+        self.ttl = ttl or int(os.getenv("LEADER_LEASE_TTL", "30"))
+        self.heartbeat = heartbeat or int(os.getenv("LEADER_HEARTBEAT", str(max(1, self.ttl // 3))))
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._expires_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        """True while this process holds an unexpired lease"""
+        return self._expires_at is not None and datetime.utcnow() < self._expires_at
+
+    async def start(self):
+        """Try to acquire the lease now, then keep renewing it in the background"""
+        await self._tick()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop heartbeating and release the lease so another worker can take over"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.is_leader:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(SchedulerLease)
+                    .where(SchedulerLease.name == self.name, SchedulerLease.holder == self.holder)
+                    .values(expires_at=datetime.utcnow())
+                )
+                await db.commit()
+            logger.info(f"Released {self.name} lease")
+        self._expires_at = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            await self._tick()
+
+    async def _tick(self):
+        was_leader = self.is_leader
+        try:
+            acquired = await self._acquire()
+        except Exception as e:
+            # Keep leadership until the current lease runs out, a renewal may still succeed
+            logger.error(f"Leader election heartbeat failed: {e}")
+            return
+
+        if acquired and not was_leader:
+            logger.info(f"Elected {self.name} leader ({self.holder})")
+        elif was_leader and not acquired:
+            logger.warning(f"Lost {self.name} leadership")
+
+    async def _acquire(self) -> bool:
+        """Renew our lease, or take over a missing or expired one"""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+
+        async with AsyncSessionLocal() as db:
+            # Renew
+            result = await db.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name, SchedulerLease.holder == self.holder)
+                .values(heartbeat_at=now, expires_at=expires_at)
+            )
+            if result.rowcount == 0:
+                # Take over an expired lease
+                result = await db.execute(
+                    update(SchedulerLease)
+                    .where(SchedulerLease.name == self.name, SchedulerLease.expires_at < now)
+                    .values(holder=self.holder, acquired_at=now, heartbeat_at=now, expires_at=expires_at)
+                )
+            if result.rowcount == 0:
+                existing = await db.execute(select(SchedulerLease.name).where(SchedulerLease.name == self.name))
+                if existing.scalar_one_or_none():
+                    # Someone else holds a live lease
+                    await db.rollback()
+                    self._expires_at = None
+                    return False
+                db.add(SchedulerLease(
+                    name=self.name,
+                    holder=self.holder,
+                    acquired_at=now,
+                    heartbeat_at=now,
+                    expires_at=expires_at,
+                ))
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Another worker created the lease first
+                await db.rollback()
+                self._expires_at = None
+                return False
+
+        self._expires_at = expires_at
+        return True
+
+
+# Process-wide elector for the scan scheduler
+elector = LeaderElector()
@@ -5,14 +5,20 @@ import os
 import logging
 import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
-from database import get_db, init_db
-from api import services_router, scanner_router
+from database import get_db, init_db, AsyncSessionLocal
+from leader import elector
+from jobs import ScanWorker, SCAN_WORKER_MODE, SCAN_MAX_CONCURRENT, enqueue_scan
+from readmodel import read_model, READ_MODEL_ENABLED
+from schedules import SCAN_SCHEDULE_TICK, dispatch_due_schedules, has_schedules
+from agents import dispatch_agent_scans
+from api import services_router, scanner_router, inventory_router, certificates_router, dashboard_router, schedules_router, agents_router
 
 # Configure logging
 logging.basicConfig(
@@ -24,18 +30,44 @@ logger = logging.getLogger(__name__)
 # Global scheduler instance
 scheduler = AsyncIOScheduler()
 
+# Scan workers used by the leader when SCAN_WORKER_MODE=embedded, one per concurrent scan
+embedded_workers = [ScanWorker() for _ in range(SCAN_MAX_CONCURRENT)]
+
 
 async def scheduled_scan():
-    """Run scheduled network scan"""
-    from api.scanner import perform_scan
-    logger.info("Starting scheduled daily scan at 4:00 AM")
+    """Queue scheduled network scan"""
+    if not elector.is_leader:
+        logger.info("Skipping scheduled scan, another worker is the scan leader")
+        return
+    try:
+        if await has_schedules():
+            logger.info("Skipping scheduled daily scan, per-network schedules are enabled")
+            return
+    except Exception as e:
+        logger.error(f"Failed to read scan schedules: {e}")
+    logger.info("Queueing scheduled daily scan")
     try:
-        await perform_scan()
-        logger.info("Scheduled daily scan completed successfully")
+        async with AsyncSessionLocal() as db:
+            job = await enqueue_scan(db)
+        logger.info(f"Scheduled daily scan queued as job {job.id}")
     except Exception as e:
         logger.error(f"Scheduled scan failed: {e}")
 
 
+async def schedule_tick():
+    """Queue the per-network scans that are due, and start or finish agent scans"""
+    if not elector.is_leader:
+        return
+    try:
+        await dispatch_due_schedules()
+    except Exception as e:
+        logger.error(f"Dispatching scan schedules failed: {e}")
+    try:
+        await dispatch_agent_scans()
+    except Exception as e:
+        logger.error(f"Dispatching agent scans failed: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan events for startup and shutdown"""
@@ -44,6 +76,14 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("Database initialized")
     
+    # Listings are served from memory once the read model has loaded, from the database until then
+    if READ_MODEL_ENABLED:
+        await read_model.start()
+    
+    # Only the elected leader schedules scans, every worker serves reads
+    await elector.start()
+    logger.info(f"Leader election started ({elector.holder}, leader: {elector.is_leader})")
+    
     # Configure scheduler for daily scan at 4:00 AM
     scan_hour = int(os.getenv("SCAN_HOUR", "4"))
     scan_minute = int(os.getenv("SCAN_MINUTE", "0"))
@@ -55,14 +95,33 @@ async def lifespan(app: FastAPI):
         name="Daily Network Scan",
         replace_existing=True
     )
+    scheduler.add_job(
+        schedule_tick,
+        IntervalTrigger(seconds=SCAN_SCHEDULE_TICK),
+        id="schedule_tick",
+        name="Per-network Scan Schedules",
+        replace_existing=True
+    )
     scheduler.start()
     logger.info(f"Scheduler started - Daily scan scheduled at {scan_hour:02d}:{scan_minute:02d}")
     
+    # Embedded mode: the leader also runs the queued scans itself
+    worker_tasks = []
+    if SCAN_WORKER_MODE == "embedded":
+        worker_tasks = [
+            asyncio.create_task(worker.run_forever(lambda: elector.is_leader))
+            for worker in embedded_workers
+        ]
+    
     yield
     
     # Shutdown
     logger.info("Shutting down scheduler...")
     scheduler.shutdown(wait=False)
+    for task in worker_tasks:
+        task.cancel()
+    await read_model.stop()
+    await elector.stop()
     logger.info("Shutting down NeonDeck API")
 
 
@@ -87,6 +146,11 @@ app.add_middleware(
 # Include routers
 app.include_router(services_router, prefix="/api", tags=["services"])
 app.include_router(scanner_router, prefix="/api", tags=["scanner"])
+app.include_router(inventory_router, prefix="/api", tags=["inventory"])
+app.include_router(certificates_router, prefix="/api", tags=["certificates"])
+app.include_router(dashboard_router, prefix="/api", tags=["dashboard"])
+app.include_router(schedules_router, prefix="/api", tags=["schedules"])
+app.include_router(agents_router, prefix="/api", tags=["agents"])
 
 
 @app.get("/health")
@@ -108,17 +172,43 @@ async def root():
 @app.get("/api/scheduler/status")
 async def scheduler_status():
     """Get scheduler status and next run time"""
+    return scheduler_info()
+
+
+def scheduler_info() -> dict:
+    """Daily scan schedule, next run and this worker's role"""
     job = scheduler.get_job("daily_scan")
     if job:
         return {
             "enabled": True,
             "job_id": job.id,
             "next_run": job.next_run_time.isoformat() if job.next_run_time else None,
-            "schedule": f"{os.getenv('SCAN_HOUR', '4')}:{os.getenv('SCAN_MINUTE', '0')}"
+            "schedule": f"{os.getenv('SCAN_HOUR', '4')}:{os.getenv('SCAN_MINUTE', '0')}",
+            "leader": elector.is_leader,
+            "worker": elector.holder,
+            "worker_mode": SCAN_WORKER_MODE
         }
     return {"enabled": False}
 
 
+# The dashboard endpoint reports the next scheduled scan
+app.state.scheduler_info = scheduler_info
+
+
+@app.get("/api/read-model/status")
+async def read_model_status():
+    """Size and freshness of this worker's in-memory inventory"""
+    return read_model.status()
+
+
+@app.post("/api/read-model/check")
+async def read_model_check(repair: bool = True):
+    """Compare this worker's in-memory inventory with the database, repairing differences"""
+    if not read_model.ready:
+        raise HTTPException(status_code=503, detail="Read model is not loaded")
+    return await read_model.check(repair=repair)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -39,8 +39,10 @@ class Service(Base):
     favicon_url = Column(String(512))
     category_id = Column(Integer, ForeignKey("categories.id", ondelete="SET NULL"))
     ip_address = Column(String(45))  # Support IPv4 and IPv6
+    hostname = Column(String(255), index=True)  # Reverse DNS name
     port = Column(Integer)
     protocol = Column(String(10), default="https")
+    version = Column(String(100))  # Product and version from the banner of a non-web service
     status = Column(String(20), default="active", index=True)
     response_time = Column(Integer)  # milliseconds
     last_seen = Column(DateTime, default=datetime.utcnow, index=True)
@@ -49,8 +51,12 @@ class Service(Base):
     is_category_manual = Column(Boolean, default=False)
     is_hidden = Column(Boolean, default=False, index=True)  # Soft delete - hidden from UI and ignored by scanner
     extra_data = Column(JSON, default={})
+    fingerprint = Column(String(64), index=True)  # Certificate + title + favicon hash, set for TLS endpoints
+    aliases = Column(JSON, default=list)  # Other endpoints serving the same application
+    certificate = Column(JSON(none_as_null=True))  # TLS certificate seen by the last probe: subject, issuer, sans, sha256...
+    cert_expires_at = Column(DateTime, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Change feed position
 
     # Relationship
     category = relationship("Category", back_populates="services")
@@ -75,3 +81,146 @@ class ScanHistory(Base):
 
     def __repr__(self):
         return f"<ScanHistory {self.id} ({self.status})>"
+
+
+class SchedulerLease(Base):
+    """Lease held by the worker elected to run scans"""
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(255), nullable=False)
+    acquired_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<SchedulerLease {self.name} ({self.holder})>"
+
+
+class ScanJob(Base):
+    """Scan queued for the scan workers"""
+    __tablename__ = "scan_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), default="queued", index=True)  # queued, running, completed, failed
+    priority = Column(Integer, default=0)
+    payload = Column(JSON, default={})
+    schedule_id = Column(Integer, index=True)  # ScanSchedule that queued it, None for manual and daily scans
+    scan_id = Column(Integer)  # ScanHistory entry, set once the scan starts
+    claimed_by = Column(String(255))
+    lease_expires_at = Column(DateTime)
+    attempts = Column(Integer, default=0)
+    progress = Column(JSON, default={})
+    error_message = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"<ScanJob {self.id} ({self.status})>"
+
+
+class ScanSchedule(Base):
+    """Recurring scan of some networks, queued by the leader's scheduler"""
+    __tablename__ = "scan_schedules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, nullable=False)
+    networks = Column(JSON, nullable=False)  # CIDR strings
+    ports = Column(JSON)  # None: SCAN_PORTS
+    interval_minutes = Column(Integer, nullable=False)
+    priority = Column(Integer, default=0)
+    enabled = Column(Boolean, default=True)
+    next_run_at = Column(DateTime, index=True)
+    last_run_at = Column(DateTime)
+    last_job_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ScanSchedule {self.name} (every {self.interval_minutes} min)>"
+
+
+class ScanUnit(Base):
+    """Network or shard of one scan, committed with its results as a checkpoint"""
+    __tablename__ = "scan_units"
+
+    id = Column(Integer, primary_key=True)
+    scan_id = Column(Integer, nullable=False, index=True)
+    network = Column(String(64), nullable=False)  # CIDR
+    status = Column(String(20), default="pending")  # pending, running, completed, failed
+    attempts = Column(Integer, default=0)
+    hosts = Column(Integer, default=0)
+    services_found = Column(Integer, default=0)
+    new_services = Column(Integer, default=0)
+    removed_services = Column(Integer, default=0)
+    changed_services = Column(Integer, default=0)
+    full_sweep = Column(Boolean, default=False)  # Every port scanned, not only those seen in its subnets
+    error_message = Column(Text)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    agent_id = Column(Integer)  # Agent scanning the unit, None when the scan workers run it
+    lease_expires_at = Column(DateTime)  # Agent units go back to other agents after this
+
+    def __repr__(self):
+        return f"<ScanUnit {self.network} of scan {self.scan_id} ({self.status})>"
+
+
+class Agent(Base):
+    """Remote scanner pushing the results of its networks to the ingest endpoint"""
+    __tablename__ = "agents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, nullable=False)
+    token_hash = Column(String(64), unique=True, nullable=False)  # SHA-256 of the bearer token
+    networks = Column(JSON, nullable=False)  # CIDR strings the agent can reach
+    ports = Column(JSON)  # None: SCAN_PORTS
+    enabled = Column(Boolean, default=True)
+    last_seen_at = Column(DateTime)
+    last_address = Column(String(45))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Agent {self.name}>"
+
+
+class AgentBatch(Base):
+    """Results of an agent unit received so far, reconciled once the last batch is in"""
+    __tablename__ = "agent_batches"
+
+    id = Column(Integer, primary_key=True)
+    unit_id = Column(Integer, nullable=False, index=True)
+    attempt = Column(Integer, nullable=False)
+    batch = Column(Integer, nullable=False)
+    hosts = Column(Integer, default=0)
+    services = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<AgentBatch {self.batch} of unit {self.unit_id}>"
+
+
+class ScanChange(Base):
+    """One service added, removed or changed by a scan"""
+    __tablename__ = "scan_changes"
+
+    id = Column(Integer, primary_key=True)
+    scan_id = Column(Integer, nullable=False, index=True)  # Kept after the ScanHistory entry is pruned
+    service_id = Column(Integer, nullable=False, index=True)
+    kind = Column(String(10), nullable=False)  # added, removed, changed
+    fields = Column(JSON)  # {field: [old, new]}, None for added
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<ScanChange scan={self.scan_id} service={self.service_id} ({self.kind})>"
+
+
+class SchemaVersion(Base):
+    """Fingerprint of the models the database schema was last set up for"""
+    __tablename__ = "schema_version"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SchemaVersion {self.name} {self.version[:12]}>"
@@ -0,0 +1,403 @@
+"""
+In-memory read model of the service inventory
+
+The inventory fits in memory and is read far more often than it is
+written, so every API worker keeps its visible services as compact
+records with indexes by category, status and IP, plus a trigram index
+for search. Service listings and category counts are answered from it
+once it is loaded; until then they go to the database as before.
+
+Writes made in this process notify the model right after their commit.
+Writes from other processes (an external scan worker, another API
+worker) are picked up by polling services.updated_at, and a periodic
+consistency check against the database repairs anything both missed.
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from database import AsyncSessionLocal
+from models import Service, Category
+
+logger = logging.getLogger(__name__)
+
+# READ_MODEL=off serves every listing from the database
+READ_MODEL_ENABLED = os.getenv("READ_MODEL", "on").lower() not in ("off", "false", "0", "no")
+
+# Rows loaded per query when records are (re)built
+LOAD_BATCH = 500
+
+# Search index gram length, shorter terms are matched without the index
+NGRAM = 3
+
+_EMPTY: frozenset = frozenset()
+
+
+def trigrams(text: str) -> Set[str]:
+    """Every 3-character substring of a lower-cased text"""
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class ServiceRecord:
+    """A visible service: the fields the indexes need and its encoded API representation"""
+
+    __slots__ = ("id", "name", "category_id", "status", "ip", "updated_at", "fields", "fragment")
+
+    def __init__(self, service: Service, row: dict):
+        """
+        Args:
+            service: Service row, with its category loaded
+            row: format_service() output for it
+        """
+        self.id = service.id
+        self.name = service.name
+        self.category_id = service.category_id
+        self.status = service.status
+        self.ip = row["ip_address"]
+        self.updated_at = service.updated_at
+        # The columns search matches, lower-cased like ILIKE compares them
+        self.fields = tuple(
+            value.lower() for value in (service.name, service.url, service.description, service.hostname) if value
+        )
+        self.fragment = orjson.dumps(row)
+
+    def grams(self) -> Set[str]:
+        grams = set()
+        for value in self.fields:
+            grams |= trigrams(value)
+        return grams
+
+    def matches(self, term: str) -> bool:
+        """True when a lower-cased term is a substring of one of the searched columns"""
+        return any(term in value for value in self.fields)
+
+
+def _index(index: Dict, key, record_id: int):
+    index.setdefault(key, set()).add(record_id)
+
+
+def _unindex(index: Dict, key, record_id: int):
+    ids = index.get(key)
+    if ids is not None:
+        ids.discard(record_id)
+        if not ids:
+            del index[key]
+
+
+class InventoryReadModel:
+    """Visible services and categories held in memory, kept in sync with the database"""
+
+    def __init__(self, poll: float = None, skew: float = None, check_interval: float = None):
+        """
+        Initialize the read model
+
+        Args:
+            poll: Seconds between polls for writes made by other processes
+                (default: READ_MODEL_POLL or 5)
+            skew: Seconds a poll looks back before the newest updated_at it has
+                seen, for transactions that committed after later ones
+                (default: READ_MODEL_SKEW or 30)
+            check_interval: Seconds between consistency checks against the
+                database (default: READ_MODEL_CHECK_INTERVAL or 300)
+        """
+        self.poll = poll or float(os.getenv("READ_MODEL_POLL", "5"))
+        self.skew = timedelta(seconds=skew if skew is not None else float(os.getenv("READ_MODEL_SKEW", "30")))
+        self.check_interval = check_interval or float(os.getenv("READ_MODEL_CHECK_INTERVAL", "300"))
+        self.ready = False
+        self.records: Dict[int, ServiceRecord] = {}
+        self.categories: Dict[int, dict] = {}
+        self.by_category: Dict[Optional[int], Set[int]] = {}
+        self.by_status: Dict[str, Set[int]] = {}
+        self.by_ip: Dict[Optional[str], Set[int]] = {}
+        self.by_trigram: Dict[str, Set[int]] = {}
+        self.last_sync: Optional[datetime] = None
+        self.last_check: Optional[dict] = None
+        self._ordered: Optional[List[ServiceRecord]] = None
+        self._watermark: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Load the inventory in the background, then keep polling and checking it"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.ready = False
+
+    async def _run(self):
+        while not self.ready:
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Failed to load the read model: {e}")
+                await asyncio.sleep(self.poll)
+
+        next_check = time.monotonic() + self.check_interval
+        while True:
+            await asyncio.sleep(self.poll)
+            try:
+                if time.monotonic() >= next_check:
+                    await self.check()
+                    next_check = time.monotonic() + self.check_interval
+                else:
+                    await self.sync()
+            except Exception as e:
+                logger.error(f"Read model refresh failed: {e}")
+
+    async def load(self):
+        """Build every record from the database"""
+        start = time.perf_counter()
+        async with self._lock:
+            async with AsyncSessionLocal() as db:
+                await self._load_categories(db)
+                result = await db.execute(select(Service.id).where(Service.is_hidden == False))
+                await self._refresh(db, result.scalars().all())
+            self.ready = True
+            self.last_sync = datetime.utcnow()
+        logger.info(f"Read model loaded {len(self.records)} services in {time.perf_counter() - start:.2f}s")
+
+    async def notify(self, since: Optional[datetime] = None):
+        """
+        Apply a write this process just committed
+
+        Args:
+            since: Oldest updated_at the write may have set, for long
+                transactions (default: the poll window)
+        """
+        if not self.ready:
+            return
+        try:
+            await self.sync(since)
+        except Exception as e:
+            # The write itself succeeded, the next poll catches up
+            logger.error(f"Read model sync failed: {e}")
+
+    async def sync(self, since: Optional[datetime] = None):
+        """Apply the services and categories changed since the last sync"""
+        async with self._lock:
+            async with AsyncSessionLocal() as db:
+                renamed = await self._load_categories(db)
+
+                query = select(Service.id, Service.updated_at, Service.is_hidden)
+                start = self._watermark - self.skew if self._watermark else None
+                if since is not None and (start is None or since < start):
+                    start = since
+                if start is not None:
+                    query = query.where(Service.updated_at >= start)
+                stale = set()
+                for service_id, updated_at, is_hidden in await db.execute(query):
+                    record = self.records.get(service_id)
+                    if is_hidden:
+                        if record:
+                            self._remove(record)
+                    elif record is None or record.updated_at != updated_at:
+                        stale.add(service_id)
+
+                # category_name is part of each fragment
+                for category_id in renamed:
+                    stale |= self.by_category.get(category_id, _EMPTY)
+                await self._refresh(db, stale)
+            self.last_sync = datetime.utcnow()
+
+    async def check(self, repair: bool = True) -> dict:
+        """
+        Compare the records with the database
+
+        Args:
+            repair: Rebuild missing and stale records, drop extra ones
+
+        Returns:
+            Counts of the services found in the database and of the missing,
+            extra and stale records
+        """
+        async with self._lock:
+            async with AsyncSessionLocal() as db:
+                renamed = await self._load_categories(db)
+                result = await db.execute(
+                    select(Service.id, Service.updated_at, Service.category_id).where(Service.is_hidden == False)
+                )
+                expected = {service_id: (updated_at, category_id) for service_id, updated_at, category_id in result}
+
+                missing = expected.keys() - self.records.keys()
+                extra = self.records.keys() - expected.keys()
+                stale = {
+                    service_id for service_id, record in self.records.items()
+                    if service_id in expected
+                    and (expected[service_id] != (record.updated_at, record.category_id) or record.category_id in renamed)
+                }
+                if repair:
+                    for service_id in extra:
+                        self._remove(self.records[service_id])
+                    await self._refresh(db, missing | stale)
+
+        report = {
+            "checked_at": datetime.utcnow().isoformat(),
+            "services": len(expected),
+            "missing": len(missing),
+            "extra": len(extra),
+            "stale": len(stale),
+            "consistent": not (missing or extra or stale),
+            "repaired": repair,
+        }
+        if not report["consistent"]:
+            logger.warning(
+                f"Read model was out of sync: {report['missing']} missing, {report['extra']} extra, "
+                f"{report['stale']} stale records{' (repaired)' if repair else ''}"
+            )
+        self.last_check = report
+        return report
+
+    async def _load_categories(self, db) -> Set[int]:
+        """Reload the categories, returns the ids of those renamed or deleted since the last load"""
+        result = await db.execute(select(Category))
+        categories = {
+            category.id: {
+                "id": category.id,
+                "name": category.name,
+                "icon": category.icon,
+                "color": category.color,
+                "order_index": category.order_index,
+            }
+            for category in result.scalars()
+        }
+        renamed = {
+            category_id for category_id, category in self.categories.items()
+            if categories.get(category_id, {}).get("name") != category["name"]
+        }
+        self.categories = categories
+        return renamed
+
+    async def _refresh(self, db, ids: Iterable[int]):
+        """Rebuild the records of these services from their rows, dropping hidden or deleted ones"""
+        from api.services import format_service
+
+        ids = list(ids)
+        for start in range(0, len(ids), LOAD_BATCH):
+            batch = ids[start:start + LOAD_BATCH]
+            result = await db.execute(
+                select(Service).options(selectinload(Service.category)).where(Service.id.in_(batch))
+            )
+            found = set()
+            for service in result.scalars():
+                found.add(service.id)
+                if service.updated_at and (self._watermark is None or service.updated_at > self._watermark):
+                    self._watermark = service.updated_at
+                if service.is_hidden:
+                    if service.id in self.records:
+                        self._remove(self.records[service.id])
+                else:
+                    self._put(ServiceRecord(service, format_service(service)))
+            for service_id in set(batch) - found:
+                if service_id in self.records:
+                    self._remove(self.records[service_id])
+
+    def _put(self, record: ServiceRecord):
+        old = self.records.get(record.id)
+        if old is not None:
+            self._drop_indexes(old, grams=old.fields != record.fields)
+            if old.name != record.name:
+                self._ordered = None
+        else:
+            self._ordered = None
+        self.records[record.id] = record
+        _index(self.by_category, record.category_id, record.id)
+        _index(self.by_status, record.status, record.id)
+        _index(self.by_ip, record.ip, record.id)
+        if old is None or old.fields != record.fields:
+            for gram in record.grams():
+                _index(self.by_trigram, gram, record.id)
+
+    def _remove(self, record: ServiceRecord):
+        self._drop_indexes(record)
+        del self.records[record.id]
+        self._ordered = None
+
+    def _drop_indexes(self, record: ServiceRecord, grams: bool = True):
+        _unindex(self.by_category, record.category_id, record.id)
+        _unindex(self.by_status, record.status, record.id)
+        _unindex(self.by_ip, record.ip, record.id)
+        if grams:
+            for gram in record.grams():
+                _unindex(self.by_trigram, gram, record.id)
+
+    def ordered(self) -> List[ServiceRecord]:
+        """Every record by name, rebuilt after names change"""
+        if self._ordered is None:
+            self._ordered = sorted(self.records.values(), key=lambda record: (record.name, record.id))
+        return self._ordered
+
+    def services(
+        self,
+        category_id: Optional[int] = None,
+        status: Optional[str] = None,
+        search: Optional[str] = None,
+        uncategorized: bool = False,
+        ip: Optional[str] = None
+    ) -> List[ServiceRecord]:
+        """Records matching the filters of service_filters(), ordered by name"""
+        candidates = []
+        if category_id:
+            candidates.append(self.by_category.get(category_id, _EMPTY))
+        if uncategorized:
+            candidates.append(self.by_category.get(None, _EMPTY))
+        if status:
+            candidates.append(self.by_status.get(status, _EMPTY))
+        if ip:
+            candidates.append(self.by_ip.get(ip, _EMPTY))
+        term = search.lower() if search else None
+        if term and len(term) >= NGRAM:
+            # Services having every gram of the term, confirmed by a substring test below.
+            # Shorter terms only get the substring test: the grams they start are too many to merge
+            postings = sorted((self.by_trigram.get(gram, _EMPTY) for gram in trigrams(term)), key=len)
+            candidates.append(postings[0].intersection(*postings[1:]))
+
+        if not candidates:
+            records = self.ordered()
+        else:
+            candidates.sort(key=len)
+            ids = candidates[0].intersection(*candidates[1:])
+            if len(ids) * 8 > len(self.records):
+                # Cheaper to walk the sorted records than to sort the matches
+                records = [record for record in self.ordered() if record.id in ids]
+            else:
+                records = sorted((self.records[i] for i in ids), key=lambda record: (record.name, record.id))
+        if term:
+            records = [record for record in records if record.matches(term)]
+        return records
+
+    def category_list(self) -> List[dict]:
+        """Categories with the count of their visible services, as get_categories returns them"""
+        categories = sorted(self.categories.values(), key=lambda category: (category["order_index"] or 0, category["name"]))
+        return [
+            dict(category, service_count=len(self.by_category.get(category["id"], _EMPTY)))
+            for category in categories
+        ]
+
+    def status(self) -> dict:
+        return {
+            "enabled": READ_MODEL_ENABLED,
+            "ready": self.ready,
+            "services": len(self.records),
+            "categories": len(self.categories),
+            "trigrams": len(self.by_trigram),
+            "last_sync": self.last_sync.isoformat() if self.last_sync else None,
+            "last_check": self.last_check,
+        }
+
+
+# Shared read model of this API worker
+read_model = InventoryReadModel()
@@ -4,5 +4,14 @@ Scanner package initialization
 from .network import NetworkScanner
 from .http_probe import HTTPProbe
 from .categorizer import ServiceCategorizer
+from .resolver import ReverseResolver, resolver
+from .ratelimit import ScanRateLimiter
+from .fingerprint import FingerprintIndex, collapse_aliases
+from .banners import grab_banner, match_banner
+from .classifier import CategoryClassifier, category_classifier
 
-__all__ = ["NetworkScanner", "HTTPProbe", "ServiceCategorizer"]
+__all__ = [
+    "NetworkScanner", "HTTPProbe", "ServiceCategorizer", "ReverseResolver", "resolver", "ScanRateLimiter",
+    "FingerprintIndex", "collapse_aliases", "grab_banner", "match_banner",
+    "CategoryClassifier", "category_classifier",
+]
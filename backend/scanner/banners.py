@@ -0,0 +1,209 @@
+"""
+Protocol identification for open ports that don't serve HTTP
+
+Servers of most non-web protocols speak first (SSH, FTP, SMTP, MySQL...):
+the banner they send on connect names the protocol and often the product
+and version. When the server stays silent and the port is expected to
+run a protocol where the client speaks first, one minimal hello is sent
+on the same connection. The reply is matched against SIGNATURES.
+"""
+import re
+import time
+import asyncio
+import logging
+from typing import Dict, NamedTuple, Optional, Pattern
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the server, enough for any greeting in SIGNATURES
+BANNER_BYTES = 1024
+
+
+class Signature(NamedTuple):
+    """A protocol recognized by what its server sends"""
+    protocol: str  # Service.protocol, also the URL scheme
+    label: str  # Display name
+    pattern: Pattern[bytes]  # Optional "product" and "version" groups
+    hello: Optional[str] = None  # Only matched against the reply to this hello
+
+
+def _signature(protocol: str, label: str, pattern: bytes, hello: str = None) -> Signature:
+    return Signature(protocol, label, re.compile(pattern, re.DOTALL), hello)
+
+
+# First match wins, so the more specific patterns come first
+SIGNATURES = [
+    _signature("ssh", "SSH", rb"^SSH-[\d.]+-(?P<version>[^\s]+)"),
+    _signature(
+        "smtp", "SMTP",
+        rb"^220[ -][^\r\n]*?\bE?SMTP\b(?:[^\r\n]*?\b(?P<product>Postfix|Exim|Sendmail|OpenSMTPD)\b"
+        rb"[ /]?(?P<version>\d[\w.]*)?)?"
+    ),
+    _signature(
+        "ftp", "FTP",
+        rb"^220[ -][^\r\n]*?(?:(?P<product>vsFTPd|ProFTPD|Pure-FTPd|FileZilla Server)[ ]?(?P<version>\d[\w.]*)?|FTP)"
+    ),
+    _signature("pop3", "POP3", rb"^\+OK\b(?:[^\r\n]*?\b(?P<product>Dovecot|Courier))?"),
+    _signature("imap", "IMAP", rb"^\* OK\b(?:[^\r\n]*?\b(?P<product>Dovecot|Cyrus|Courier))?"),
+    # Handshake packet: 3-byte length, sequence 0, protocol 10, version string
+    _signature("mysql", "MySQL", rb"^.{3}\x00\x0a(?P<version>[\w.+~-]+)\x00"),
+    # Error packet sent instead, e.g. to hosts not allowed to connect
+    _signature("mysql", "MySQL", rb"^.{3}\x00\xff.{2}.*?(?:MySQL|MariaDB)"),
+    _signature("vnc", "VNC", rb"^RFB (?P<version>\d{3}\.\d{3})\n"),
+    # Option negotiation (IAC WILL/WONT/DO/DONT)
+    _signature("telnet", "Telnet", rb"^\xff[\xfb-\xfe]"),
+    _signature("redis", "Redis", rb"^\$\d+\r\n.*?redis_version:(?P<version>[\d.]+)", hello="redis"),
+    _signature("redis", "Redis", rb"^-(?:NOAUTH|DENIED)\b", hello="redis"),
+    _signature("memcached", "Memcached", rb"^VERSION (?P<version>[\d.]+)", hello="memcached"),
+    # CONNACK
+    _signature("mqtt", "MQTT", rb"^\x20\x02[\x00\x01][\x00-\x05]", hello="mqtt"),
+    # Single byte answer to SSLRequest
+    _signature("postgresql", "PostgreSQL", rb"^[SN]$", hello="postgresql"),
+    # Connection.Start method frame, server properties in a field table
+    _signature(
+        "amqp", "AMQP",
+        rb"^\x01\x00\x00.{4}\x00\x0a\x00\x0a"
+        rb"(?:.*?\x07productS\x00\x00\x00.(?P<product>[\w ]+))?"
+        rb"(?:.*?\x07versionS\x00\x00\x00.(?P<version>[\w.+-]+))?",
+        hello="amqp"
+    ),
+]
+
+# Minimal client-first greetings
+HELLOS = {
+    "redis": b"INFO server\r\n",
+    "memcached": b"version\r\n",
+    # CONNECT, MQTT 3.1.1, clean session, 60 s keepalive, client id "neondeck"
+    "mqtt": b"\x10\x14\x00\x04MQTT\x04\x02\x00\x3c\x00\x08neondeck",
+    # SSLRequest: the server answers one byte without authenticating anything
+    "postgresql": b"\x00\x00\x00\x08\x04\xd2\x16\x2f",
+    "amqp": b"AMQP\x00\x00\x09\x01",
+}
+
+# nmap service names of the protocols above
+NMAP_SERVICES = {
+    "ssh": "ssh", "smtp": "smtp", "submission": "smtp", "ftp": "ftp", "pop3": "pop3", "imap": "imap",
+    "mysql": "mysql", "vnc": "vnc", "telnet": "telnet", "redis": "redis", "memcache": "memcached",
+    "memcached": "memcached", "mqtt": "mqtt", "postgresql": "postgresql", "amqp": "amqp",
+}
+
+# Used when nmap didn't name the service
+WELL_KNOWN_PORTS = {
+    21: "ftp", 22: "ssh", 23: "telnet", 25: "smtp", 110: "pop3", 143: "imap", 587: "smtp",
+    1883: "mqtt", 3306: "mysql", 5432: "postgresql", 5672: "amqp", 5900: "vnc",
+    6379: "redis", 11211: "memcached",
+}
+
+
+def expected_protocol(port: int, service: Optional[str] = None) -> Optional[str]:
+    """
+    Non-web protocol a port most likely runs
+
+    Args:
+        port: Port number
+        service: Service name nmap reported for the port
+
+    Returns:
+        Protocol of SIGNATURES, None when the port may well serve HTTP
+    """
+    return NMAP_SERVICES.get((service or "").lower()) or WELL_KNOWN_PORTS.get(port)
+
+
+def match_banner(data: bytes, hello: Optional[str] = None) -> Optional[Dict]:
+    """
+    Identify a protocol from what its server sent
+
+    Args:
+        data: Bytes received
+        hello: Hello the bytes answer, None for an unprompted greeting
+
+    Returns:
+        {"protocol", "label", "version"}, None when nothing matches
+    """
+    if not data:
+        return None
+    for signature in SIGNATURES:
+        if signature.hello != hello:
+            continue
+        match = signature.pattern.match(data)
+        if match:
+            groups = match.groupdict()
+            parts = [groups.get("product"), groups.get("version")]
+            version = " ".join(part.decode("ascii", "replace") for part in parts if part) or None
+            return {"protocol": signature.protocol, "label": signature.label, "version": version}
+    return None
+
+
+def banner_text(data: bytes) -> Optional[str]:
+    """First line of a text banner, None for binary ones"""
+    line = data.split(b"\n", 1)[0].rstrip(b"\r").decode("ascii", "replace")
+    return line[:255] if line and line.isprintable() else None
+
+
+async def grab_banner(
+    ip: str,
+    port: int,
+    expected: Optional[str],
+    connect_timeout: float,
+    read_timeout: float
+) -> Optional[Dict]:
+    """
+    Identify the protocol of an open port on a single connection
+
+    Args:
+        ip: IP address
+        port: Port number
+        expected: Protocol from expected_protocol, whose hello is sent when
+            the server doesn't speak first (default: greeting only)
+        connect_timeout: TCP connect budget in seconds
+        read_timeout: Budget of each read in seconds
+
+    Returns:
+        match_banner result with "banner" (its text, if any) and
+        "response_time" (ms to the first byte), None when unidentified
+    """
+    hello = expected if expected in HELLOS else None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), connect_timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        logger.debug(f"Failed to connect to {ip}:{port} for its banner: {e or 'timeout'}")
+        return None
+
+    start = time.monotonic()
+    try:
+        # Greeting servers answer the connect within a round trip, so a port
+        # expecting a hello doesn't wait out the whole read budget
+        data = await _read(reader, connect_timeout if hello else read_timeout)
+        if data:
+            hello = None
+        elif hello:
+            start = time.monotonic()
+            writer.write(HELLOS[hello])
+            await writer.drain()
+            data = await _read(reader, read_timeout)
+        elapsed = time.monotonic() - start
+    except OSError as e:
+        logger.debug(f"Failed to read banner of {ip}:{port}: {e}")
+        return None
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    found = match_banner(data, hello)
+    if found is None:
+        logger.debug(f"Unidentified banner on {ip}:{port}: {data[:64]!r}")
+        return None
+    found["banner"] = banner_text(data) if hello is None else None
+    found["response_time"] = int(elapsed * 1000)
+    return found
+
+
+async def _read(reader: asyncio.StreamReader, timeout: float) -> bytes:
+    """Whatever arrives first, b"" on timeout or EOF"""
+    try:
+        return await asyncio.wait_for(reader.read(BANNER_BYTES), timeout)
+    except asyncio.TimeoutError:
+        return b""
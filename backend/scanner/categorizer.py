@@ -2,7 +2,9 @@
 Auto-categorization logic for NeonDeck
 """
 import re
-from typing import Optional
+from typing import Collection, List, Optional, Tuple
+
+from .classifier import CategoryClassifier
 
 # Categorization rules based on title, URL, and description
 CATEGORY_RULES = {
@@ -47,7 +49,15 @@ CATEGORY_RULES = {
 class ServiceCategorizer:
     """Auto-categorize services based on their metadata"""
 
-    def __init__(self):
+    def __init__(self, classifier: Optional[CategoryClassifier] = None):
+        """
+        Initialize the categorizer
+
+        Args:
+            classifier: Classifier learned from manual categorizations, consulted
+                before the rules by categorize_batch (default: rules only)
+        """
+        self.classifier = classifier
         # Compile regex patterns for performance
         self.compiled_rules = {}
         for category, patterns in CATEGORY_RULES.items():
@@ -90,6 +100,37 @@ class ServiceCategorizer:
         # Default category if no match
         return "Other"
 
+    def categorize_batch(
+        self,
+        items: List[Tuple[str, str, Optional[str]]],
+        categories: Optional[Collection[str]] = None
+    ) -> List[str]:
+        """
+        Categorize the new services of a scan at once
+
+        The classifier scores the whole batch; services it isn't confident
+        about, or that it puts in a category missing from `categories`,
+        get the rules' category.
+
+        Args:
+            items: (title, url, description) per service
+            categories: Category names the classifier may answer (default: any)
+
+        Returns:
+            Category name per item
+        """
+        if self.classifier is not None:
+            predictions = self.classifier.classify_batch(items)
+        else:
+            predictions = [(None, 0.0)] * len(items)
+
+        names = []
+        for (title, url, description), (name, _) in zip(items, predictions):
+            if name is None or (categories is not None and name not in categories):
+                name = self.categorize(title, url, description)
+            names.append(name)
+        return names
+
     def get_category_icon(self, category: str) -> str:
         """Get icon name for category"""
         icons = {
@@ -0,0 +1,98 @@
+"""
+TLS certificate metadata from the probe's own handshake
+"""
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import httpx
+from cryptography import x509
+
+logger = logging.getLogger(__name__)
+
+
+def peer_certificate(response: httpx.Response) -> Optional[bytes]:
+    """DER certificate the server presented, None over plain HTTP"""
+    stream = response.extensions.get("network_stream")
+    if stream is None:
+        return None
+    try:
+        ssl_object = stream.get_extra_info("ssl_object")
+        # The binary form is available even without verification (verify=False)
+        return ssl_object.getpeercert(binary_form=True) if ssl_object else None
+    except Exception:
+        return None
+
+
+def parse_certificate(der: bytes) -> Dict:
+    """
+    Decode the fields worth tracking from a DER certificate
+
+    Returns:
+        sha256, subject, issuer, sans, serial, not_before and not_after
+        (naive UTC ISO 8601, like the API's other timestamps)
+    """
+    cert = x509.load_der_x509_certificate(der)
+    try:
+        san = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        sans = san.get_values_for_type(x509.DNSName) + [str(ip) for ip in san.get_values_for_type(x509.IPAddress)]
+    except x509.ExtensionNotFound:
+        sans = []
+    return {
+        "sha256": hashlib.sha256(der).hexdigest(),
+        "subject": cert.subject.rfc4514_string(),
+        "issuer": cert.issuer.rfc4514_string(),
+        "sans": sans,
+        "serial": format(cert.serial_number, "x"),
+        "not_before": cert.not_valid_before_utc.replace(tzinfo=None).isoformat(),
+        "not_after": cert.not_valid_after_utc.replace(tzinfo=None).isoformat(),
+    }
+
+
+class CertificateCache:
+    """
+    Parsed certificates by SHA-256, shared by successive scans
+
+    Certificates change rarely and many endpoints present the same one
+    (wildcards, reverse proxies), so each is decoded once.
+    """
+
+    def __init__(self, max_entries: int = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Certificates kept, least recently used dropped first
+                (default: CERT_CACHE_SIZE or 4096)
+        """
+        self.max_entries = max_entries or int(os.getenv("CERT_CACHE_SIZE", "4096"))
+        self._cache: "OrderedDict[str, Optional[Dict]]" = OrderedDict()
+
+    def get(self, der: Optional[bytes]) -> Optional[Dict]:
+        """
+        Metadata of a DER certificate
+
+        Returns:
+            Parsed certificate (a copy), None without a certificate or when it can't be decoded
+        """
+        if not der:
+            return None
+        sha256 = hashlib.sha256(der).hexdigest()
+        if sha256 in self._cache:
+            self._cache.move_to_end(sha256)
+        else:
+            try:
+                self._cache[sha256] = parse_certificate(der)
+            except Exception as e:
+                logger.debug(f"Failed to decode certificate {sha256}: {e}")
+                self._cache[sha256] = None
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        certificate = self._cache[sha256]
+        return dict(certificate) if certificate else None
+
+
+# Shared cache instance
+certificates = CertificateCache()
@@ -0,0 +1,193 @@
+"""
+Category classifier learned from manual categorizations
+
+The categorizer's rules only know a fixed list of keywords. When a user
+moves a service to another category, the classifier learns from it, so
+similar services found later land in the same category. It's a
+multinomial naive Bayes over the tokens of the title, URL and
+description. NumPy is optional: without it the rules categorize
+everything.
+"""
+import os
+import re
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Learn categories from manual categorizations (needs NumPy)
+CATEGORY_CLASSIFIER = os.getenv("CATEGORY_CLASSIFIER", "true").lower() == "true"
+
+TOKEN = re.compile(r"[a-z][a-z0-9]+")
+
+
+def features(title: Optional[str], url: Optional[str], description: Optional[str] = None) -> Counter:
+    """
+    Token counts of a service
+
+    Words of the title, the URL's scheme, host name and path and the
+    description, plus the port. Numbers alone (IP addresses) are left out.
+    """
+    tokens = Counter()
+    parsed = urlparse(url or "")
+    for text in (title, parsed.scheme, parsed.hostname, parsed.path, description):
+        if text:
+            tokens.update(TOKEN.findall(text.lower()))
+    try:
+        if parsed.port:
+            tokens[f"port:{parsed.port}"] += 1
+    except ValueError:
+        pass
+    return tokens
+
+
+class CategoryClassifier:
+    """
+    Multinomial naive Bayes over service tokens
+
+    Learning and forgetting a service only update per-category token
+    counts; the probability matrices are rebuilt from them by the next
+    batch, so retraining is incremental. A batch is scored with one
+    vectorized pass over all its tokens.
+    """
+
+    def __init__(self, min_confidence: float = None, min_samples: int = None, alpha: float = 1.0):
+        """
+        Initialize the classifier
+
+        Args:
+            min_confidence: Probability below which a service is left to the
+                rules (default: CATEGORY_CLASSIFIER_MIN_CONFIDENCE or 0.8)
+            min_samples: Services to learn from before classifying anything
+                (default: CATEGORY_CLASSIFIER_MIN_SAMPLES or 5)
+            alpha: Additive smoothing of token counts
+        """
+        self.min_confidence = min_confidence or float(os.getenv("CATEGORY_CLASSIFIER_MIN_CONFIDENCE", "0.8"))
+        self.min_samples = min_samples or int(os.getenv("CATEGORY_CLASSIFIER_MIN_SAMPLES", "5"))
+        self.alpha = alpha
+        # Updated-at position of the last sync, see api.scanner.train_classifier
+        self.synced_at = None
+        self._samples: Dict[int, Tuple[str, Counter]] = {}
+        self._token_counts: Dict[str, Counter] = {}
+        self._documents = Counter()
+        self._vocabulary: Dict[str, int] = {}
+        self._model = None
+
+    @property
+    def enabled(self) -> bool:
+        """False when turned off or NumPy is missing"""
+        return CATEGORY_CLASSIFIER and np is not None
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def sample_ids(self) -> List[int]:
+        """Ids of the services learned from"""
+        return list(self._samples)
+
+    def learn(
+        self,
+        sample_id: int,
+        category: str,
+        title: Optional[str],
+        url: Optional[str],
+        description: Optional[str] = None
+    ):
+        """Learn a service's category, replacing what was learned from it before"""
+        self.forget(sample_id)
+        tokens = features(title, url, description)
+        for token in tokens:
+            self._vocabulary.setdefault(token, len(self._vocabulary))
+        self._samples[sample_id] = (category, tokens)
+        self._token_counts.setdefault(category, Counter()).update(tokens)
+        self._documents[category] += 1
+        self._model = None
+
+    def forget(self, sample_id: int):
+        """Unlearn a service, e.g. when it is no longer manually categorized"""
+        sample = self._samples.pop(sample_id, None)
+        if sample is None:
+            return
+        category, tokens = sample
+        self._token_counts[category] -= tokens
+        self._documents[category] -= 1
+        if self._documents[category] <= 0:
+            del self._documents[category]
+            del self._token_counts[category]
+        self._model = None
+
+    def classify_batch(self, items: List[Tuple[str, str, Optional[str]]]) -> List[Tuple[Optional[str], float]]:
+        """
+        Classify many services at once
+
+        Args:
+            items: (title, url, description) per service
+
+        Returns:
+            (category, probability) per item, category None when the
+            probability is below min_confidence, none of the item's tokens
+            were learned, or there isn't enough to learn from yet
+        """
+        if not self.enabled or len(self._samples) < self.min_samples or len(self._documents) < 2:
+            return [(None, 0.0)] * len(items)
+        if self._model is None:
+            self._model = self._fit()
+        categories, log_prior, log_likelihood, learned = self._model
+
+        # Sparse (row, token column, count) triples of the whole batch
+        rows, columns, counts = [], [], []
+        for row, (title, url, description) in enumerate(items):
+            for token, count in features(title, url, description).items():
+                column = self._vocabulary.get(token)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+                    counts.append(count)
+        rows = np.array(rows, dtype=np.intp)
+        columns = np.array(columns, dtype=np.intp)
+        counts = np.array(counts, dtype=np.float64)
+
+        scores = np.tile(log_prior, (len(items), 1))
+        np.add.at(scores, rows, counts[:, None] * log_likelihood[columns])
+        known = np.bincount(rows, weights=learned[columns], minlength=len(items)) > 0
+
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        best = probabilities.argmax(axis=1)
+        confidence = probabilities[np.arange(len(items)), best]
+
+        return [
+            (categories[index] if is_known and probability >= self.min_confidence else None, float(probability))
+            for index, probability, is_known in zip(best, confidence, known)
+        ]
+
+    def _fit(self) -> tuple:
+        """(categories, log priors, token x category log likelihoods, learned token mask)"""
+        categories = sorted(self._documents)
+        counts = np.zeros((len(categories), len(self._vocabulary)))
+        for index, category in enumerate(categories):
+            tokens = self._token_counts[category]
+            if tokens:
+                counts[index, [self._vocabulary[token] for token in tokens]] = list(tokens.values())
+
+        documents = np.array([self._documents[category] for category in categories], dtype=np.float64)
+        log_prior = np.log(documents / documents.sum())
+        smoothed = counts + self.alpha
+        log_likelihood = np.log(smoothed / smoothed.sum(axis=1, keepdims=True))
+        learned = (counts.sum(axis=0) > 0).astype(np.float64)
+        return categories, log_prior, np.ascontiguousarray(log_likelihood.T), learned
+
+
+# Shared instance, trained incrementally across scans
+category_classifier = CategoryClassifier()
+
+if CATEGORY_CLASSIFIER and np is None:
+    logger.info("NumPy is not installed, new services are categorized by the rules only")
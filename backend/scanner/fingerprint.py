@@ -0,0 +1,188 @@
+"""
+Endpoint fingerprints, to recognise one application behind several endpoints
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def url_key(url) -> str:
+    """Normalized form of a URL: explicit port, path "/" when empty, no fragment"""
+    url = httpx.URL(str(url))
+    port = url.port or DEFAULT_PORTS.get(url.scheme)
+    return f"{url.scheme}://{url.host}:{port}{url.raw_path.decode('ascii', 'replace')}"
+
+
+def short_hash(value: Optional[str]) -> str:
+    return hashlib.sha256((value or "").encode()).hexdigest()[:16]
+
+
+def fingerprint(metadata: Dict, final_url: str, cert_sha256: Optional[str]) -> Dict[str, Optional[str]]:
+    """
+    Fingerprint of an endpoint
+
+    Title and favicon hashes alone are shared by unrelated hosts (default
+    pages, appliances of one vendor), so the combined key is only set for
+    titled TLS endpoints, where the certificate ties them to one server;
+    untitled pages are too generic even then (one wildcard certificate in
+    front of several default pages). The favicon is hashed by path, hosts
+    serving one app under different names reference the same icon.
+
+    Returns:
+        final_url, title_hash, favicon_hash, cert_sha256 and key (None
+        without a certificate or a title)
+    """
+    title_hash = short_hash(metadata.get("title"))
+    favicon = metadata.get("favicon") or ""
+    favicon_hash = short_hash(urlparse(favicon).path if favicon.startswith("http") else favicon)
+    key = None
+    if cert_sha256 and metadata.get("title"):
+        key = hashlib.sha256(f"{cert_sha256}|{title_hash}|{favicon_hash}".encode()).hexdigest()
+    return {
+        "final_url": final_url,
+        "title_hash": title_hash,
+        "favicon_hash": favicon_hash,
+        "cert_sha256": cert_sha256,
+        "key": key,
+    }
+
+
+def rebase_metadata(metadata: Dict, url: str) -> Dict:
+    """Metadata parsed from an identical page served at another URL"""
+    rebased = dict(metadata, canonical_url=url)
+    favicon = metadata.get("favicon")
+    source = urlparse(metadata.get("canonical_url") or "")
+    if favicon and urlparse(favicon).netloc == source.netloc:
+        target = urlparse(url)
+        rebased["favicon"] = urlparse(favicon)._replace(scheme=target.scheme, netloc=target.netloc).geturl()
+    return rebased
+
+
+class FingerprintIndex:
+    """
+    What one scan already fetched and parsed
+
+    URLs map to the probe result they led to, so an endpoint redirecting
+    to a URL another endpoint already reached (or is fetching right now)
+    reuses that result instead of following the redirect again. Page
+    bodies map to their parsed metadata, so identical pages are parsed
+    once.
+    """
+
+    def __init__(self, wait_timeout: float = 10):
+        """
+        Initialize the index
+
+        Args:
+            wait_timeout: Seconds to wait for another endpoint fetching the
+                same URL before fetching it anyway (breaks redirect cycles)
+        """
+        self.wait_timeout = wait_timeout
+        self._urls: Dict[str, asyncio.Future] = {}
+        self._bodies: Dict[str, Dict] = {}
+        self.stats = {"redirects_skipped": 0, "parses_skipped": 0, "fingerprinted": 0}
+
+    async def claim(self, url) -> Tuple[bool, Optional[Dict]]:
+        """
+        Claim a URL before requesting it
+
+        Returns:
+            (True, None) when the caller should fetch it and later settle()
+            it, (False, result) when another endpoint already did
+        """
+        key = url_key(url)
+        future = self._urls.get(key)
+        if future is None:
+            self._urls[key] = asyncio.get_running_loop().create_future()
+            return True, None
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+        except asyncio.TimeoutError:
+            return False, None
+        if result is not None:
+            self.stats["redirects_skipped"] += 1
+        return False, result
+
+    def settle(self, urls: Iterable, result: Optional[Dict]):
+        """Publish the result reached from claimed URLs (None when nothing was found)"""
+        for url in urls:
+            future = self._urls.get(url_key(url))
+            if future is not None and not future.done():
+                future.set_result(result)
+
+    def cached_metadata(self, body: bytes, url: str) -> Tuple[str, Optional[Dict]]:
+        """
+        Metadata of an identical page parsed earlier in the scan
+
+        Returns:
+            (body digest, metadata rebased on url or None)
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        metadata = self._bodies.get(digest)
+        if metadata is None:
+            return digest, None
+        self.stats["parses_skipped"] += 1
+        return digest, rebase_metadata(metadata, url)
+
+    def remember_metadata(self, digest: str, metadata: Dict):
+        self._bodies[digest] = metadata
+
+
+def collapse_aliases(results: List[Dict], known: Dict[str, Optional[str]] = None) -> Dict[str, Dict]:
+    """
+    Group probe results by application
+
+    Results with the same final URL, then final URLs sharing a fingerprint
+    key, collapse into one result. The canonical URL of a group is a known
+    service's URL when there is one (even if only an alias answered this
+    time), else the smallest, so repeated scans pick the same one whatever
+    order the probes finished in.
+
+    Args:
+        results: Probe results with "url", "endpoint" and "fingerprint"
+        known: URL -> fingerprint key of the services already in the inventory
+
+    Returns:
+        canonical URL -> result, with "aliases": the endpoints other than
+        its own that led to the same application
+    """
+    known = known or {}
+    by_url: Dict[str, Dict] = {}
+    aliases: Dict[str, set] = {}
+    for result in results:
+        url = result["url"]
+        current = by_url.get(url)
+        # Prefer a result fetched by its own endpoint over one reused from another
+        if current is None or (current.get("reused") and not result.get("reused")):
+            by_url[url] = result
+        aliases.setdefault(url, set()).add(result.get("endpoint") or url)
+
+    canonical: Dict[str, str] = {}  # fingerprint key -> canonical URL
+    for url in sorted(known, key=lambda u: (u not in by_url, u)):
+        if known[url]:
+            canonical.setdefault(known[url], url)
+
+    collapsed = {}
+    for url in sorted(by_url, key=lambda u: (u not in known, u)):
+        result = by_url[url]
+        fp_key = (result.get("fingerprint") or {}).get("key")
+        target = canonical.setdefault(fp_key, url) if fp_key else url
+        if target != url:
+            if target not in by_url and target not in collapsed:
+                # The known service only answered through this alias
+                collapsed[target] = dict(result, url=target, endpoint=target)
+            aliases.setdefault(target, set()).update(aliases.pop(url))
+            continue
+        collapsed[url] = result
+
+    for url, result in collapsed.items():
+        result["aliases"] = sorted(aliases[url] - {result.get("endpoint")})
+    return collapsed
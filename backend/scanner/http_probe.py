@@ -1,71 +1,465 @@
 """
 HTTP probe to detect web interfaces
 """
+import os
+import time
 import asyncio
 import logging
-from typing import Optional, Dict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Dict, List, Tuple
+from urllib.parse import urljoin, urlparse
 import httpx
 from bs4 import BeautifulSoup
 
+from .banners import expected_protocol, grab_banner
+from .certificates import certificates, peer_certificate
+from .fingerprint import FingerprintIndex, fingerprint
+from .ratelimit import ScanRateLimiter
+from .timeouts import TimeoutPolicy
+
 logger = logging.getLogger(__name__)
 
 
+def extract_metadata(content: bytes, encoding: Optional[str], url: str) -> Dict:
+    """
+    Extract title, description and favicon from an HTML page
+    
+    Pure function so it can run in a worker process.
+    
+    Args:
+        content: Raw response body
+        encoding: Charset from the Content-Type header, if any
+        url: Final URL of the response (after redirects)
+        
+    Returns:
+        Metadata dictionary
+    """
+    metadata = {
+        "canonical_url": url
+    }
+    
+    try:
+        soup = BeautifulSoup(content, 'html.parser', from_encoding=encoding)
+        
+        # Extract title
+        title_tag = soup.find('title')
+        if title_tag:
+            metadata["title"] = title_tag.get_text().strip()
+        
+        # Extract description
+        desc_tag = soup.find('meta', attrs={'name': 'description'})
+        if desc_tag and desc_tag.get('content'):
+            metadata["description"] = desc_tag['content'].strip()
+        
+        # Extract favicon
+        favicon_tag = soup.find('link', rel=lambda x: x and 'icon' in x.lower())
+        if favicon_tag and favicon_tag.get('href'):
+            favicon_url = favicon_tag['href']
+            if not favicon_url.startswith('http'):
+                # Convert relative URL to absolute
+                favicon_url = urljoin(url, favicon_url)
+            metadata["favicon"] = favicon_url
+        else:
+            # Try default favicon location
+            parsed = urlparse(url)
+            metadata["favicon"] = f"{parsed.scheme}://{parsed.netloc}/favicon.ico"
+            
+    except Exception as e:
+        logger.debug(f"Error extracting metadata from {url}: {e}")
+    
+    return metadata
+
+
+def extract_metadata_batch(items: List[Tuple[bytes, Optional[str], str]]) -> List[Dict]:
+    """Run extract_metadata over a batch of (content, encoding, url)"""
+    return [extract_metadata(content, encoding, url) for content, encoding, url in items]
+
+
+class MetadataPool:
+    """
+    Process pool for HTML parsing
+    
+    Responses are collected into batches (flushed when full or after
+    max_delay) so one pickled task carries many pages, and the event loop
+    only does I/O.
+    """
+
+    _shared = {}
+
+    def __init__(self, workers: int = None, batch_size: int = 16, max_delay: float = 0.005):
+        """
+        Initialize the pool
+        
+        Args:
+            workers: Number of worker processes (default: CPU count)
+            batch_size: Responses per task
+            max_delay: Seconds to wait for a batch to fill up
+        """
+        # spawn, not fork: the parent has event loop and DB driver threads
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        # Set once a worker died, the pool then refuses every task
+        self.broken = False
+        self._pending = []
+        self._timer = None
+
+    @classmethod
+    def shared(cls, workers: int = None, batch_size: int = 16) -> "MetadataPool":
+        """Process-wide pool, so repeated scans don't respawn workers"""
+        key = (workers, batch_size)
+        if key not in cls._shared:
+            cls._shared[key] = cls(workers, batch_size)
+        return cls._shared[key]
+
+    async def extract(self, content: bytes, encoding: Optional[str], url: str) -> Dict:
+        """Queue a response for parsing and wait for its metadata"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((content, encoding, url), future))
+        
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            task = asyncio.get_running_loop().run_in_executor(self.executor, extract_metadata_batch, items)
+        except Exception as e:
+            # Raised right away when the pool is already broken; from the
+            # timer nobody would see it, so it goes to the waiting probes
+            if isinstance(e, BrokenProcessPool):
+                self._discard()
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        def deliver(done):
+            error = done.exception()
+            if isinstance(error, BrokenProcessPool):
+                self._discard()
+            for i, future in enumerate(futures):
+                if future.done():
+                    continue
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(done.result()[i])
+        
+        task.add_done_callback(deliver)
+
+    def _discard(self):
+        """Forget a pool whose worker died (e.g. OOM on a huge page), the next shared() spawns a new one"""
+        if self.broken:
+            return
+        self.broken = True
+        logger.warning("Metadata process pool broke, a new one is started for the next pages")
+        for key, pool in list(MetadataPool._shared.items()):
+            if pool is self:
+                del MetadataPool._shared[key]
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
 class HTTPProbe:
     """HTTP/HTTPS probe for web service detection"""
 
-    def __init__(self, timeout: int = 10):
+    def __init__(
+        self,
+        timeout: int = 10,
+        metadata_mode: str = None,
+        metadata_workers: int = None,
+        metadata_batch_size: int = None,
+        adaptive_timeouts: bool = None,
+        rate_limiter: ScanRateLimiter = None,
+        concurrency: int = None,
+        banners: bool = None
+    ):
         """
         Initialize HTTP probe
         
         Args:
-            timeout: Request timeout in seconds
+            timeout: Request timeout in seconds, with adaptive timeouts the total
+                budget of an endpoint across attempts
+            metadata_mode: "process" to parse HTML in a process pool, "inline" to
+                parse on the event loop (default: PROBE_METADATA_MODE or "process")
+            metadata_workers: Process pool size (default: PROBE_METADATA_WORKERS or CPU count)
+            metadata_batch_size: Responses sent to the pool per task (default: PROBE_METADATA_BATCH or 16)
+            adaptive_timeouts: Size timeouts per endpoint from RTT and response time
+                history (default: PROBE_ADAPTIVE_TIMEOUTS or True)
+            rate_limiter: Connection rate limits, one token per attempt (default: none)
+            concurrency: Endpoints probed at once (default: PROBE_CONCURRENCY or 256)
+            banners: Identify non-web services from their banners (default: PROBE_BANNERS or True)
         """
         self.timeout = timeout
+        if adaptive_timeouts is None:
+            adaptive_timeouts = os.getenv("PROBE_ADAPTIVE_TIMEOUTS", "true").lower() == "true"
+        self.adaptive_timeouts = adaptive_timeouts
+        self.timeouts = TimeoutPolicy(max_timeout=timeout)
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency or int(os.getenv("PROBE_CONCURRENCY", "256"))
+        if banners is None:
+            banners = os.getenv("PROBE_BANNERS", "true").lower() == "true"
+        self.banners = banners
+        self.metadata_mode = metadata_mode or os.getenv("PROBE_METADATA_MODE", "process")
+        self.metadata_workers = metadata_workers or int(os.getenv("PROBE_METADATA_WORKERS", "0")) or None
+        self.metadata_batch_size = metadata_batch_size or int(os.getenv("PROBE_METADATA_BATCH", "16"))
+        self._pool = None
+        # Index of the last probe_multiple call
+        self.fingerprints = FingerprintIndex(timeout)
 
-    async def probe_port(self, ip: str, port: int) -> Optional[Dict]:
+    async def probe_port(
+        self,
+        ip: str,
+        port: int,
+        rtt: Optional[Dict[str, float]] = None,
+        previous_ms: Optional[int] = None,
+        index: Optional[FingerprintIndex] = None,
+        service: Optional[str] = None
+    ) -> Optional[Dict]:
         """
-        Probe a specific port for HTTP/HTTPS service
+        Probe a specific port for HTTP/HTTPS service, else identify its protocol
+        
+        Ports expected to run a non-web protocol (by nmap's service name or
+        the port number) get the banner stage first. Other ports get it
+        when HTTP failed without an HTTP answer, as greeting servers make
+        it fail, or time out waiting for a status line they never send.
         
         Args:
             ip: IP address
             port: Port number
+            rtt: {"srtt", "rttvar"} of the host in seconds, from discovery
+            previous_ms: Response time recorded for this endpoint by the previous scan
+            index: URLs and pages already handled in this scan (default: none shared)
+            service: Service name nmap reported for the port
             
         Returns:
-            Service info dict if web service found, None otherwise
+            Service info dict if web or identified service found, None otherwise
+        """
+        expected = expected_protocol(port, service) if self.banners else None
+        if expected:
+            service_info = await self._probe_banner(ip, port, expected, rtt, previous_ms)
+            if service_info:
+                return service_info
+        
+        service_info, outcome = await self._probe_http(ip, port, rtt, previous_ms, index)
+        if service_info is None and self.banners and not expected and outcome in (None, 'read'):
+            # After a read timeout only a greeting sent right on connect counts
+            service_info = await self._probe_banner(ip, port, None, rtt, previous_ms, quick=outcome == 'read')
+        return service_info
+
+    async def _probe_http(
+        self,
+        ip: str,
+        port: int,
+        rtt: Optional[Dict[str, float]],
+        previous_ms: Optional[int],
+        index: Optional[FingerprintIndex]
+    ) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Try HTTPS, then HTTP
+        
+        Returns:
+            (service info or None, outcome): 'http' when an attempt got an
+            HTTP answer, else 'read' or 'connect' when one timed out in that
+            phase, None when every attempt failed fast
         """
         # Try HTTPS first, then HTTP
         protocols = ['https', 'http']
+        index = index or FingerprintIndex(self.timeout)
+        phases = set()
+        
+        def outcome() -> Optional[str]:
+            return next((phase for phase in ('http', 'read', 'connect') if phase in phases), None)
+        
+        if not self.adaptive_timeouts:
+            for protocol in protocols:
+                await self._throttle(ip)
+                service_info, phase = await self._probe_url(protocol, ip, port, httpx.Timeout(self.timeout), index)
+                if service_info:
+                    return service_info, 'http'
+                phases.add(phase)
+            return None, outcome()
         
+        start = time.monotonic()
+        timed_out = {}  # protocol -> phase that timed out
         for protocol in protocols:
-            url = f"{protocol}://{ip}:{port}"
-            try:
-                async with httpx.AsyncClient(verify=False, timeout=self.timeout) as client:
-                    response = await client.get(url, follow_redirects=True)
-                    
-                    if response.status_code < 500:  # Consider anything < 500 as a valid web service
-                        # Extract metadata
-                        metadata = await self._extract_metadata(response, url)
-                        
+            # Time spent throttled doesn't count against the endpoint's budget
+            start += await self._throttle(ip)
+            budget = self.timeouts.first_attempt(protocol, rtt, previous_ms)
+            service_info, phase = await self._probe_url(protocol, ip, port, budget, index)
+            if service_info:
+                return service_info, 'http'
+            if phase in ('connect', 'read'):
+                timed_out[protocol] = phase
+            phases.add(phase)
+        
+        if not timed_out:
+            return None, outcome()
+        
+        # Single slower retry, on the protocol that got furthest (read beats connect)
+        protocol = next((p for p in protocols if timed_out.get(p) == 'read'), next(iter(timed_out)))
+        start += await self._throttle(ip)
+        budget = self.timeouts.retry(time.monotonic() - start)
+        service_info, phase = await self._probe_url(protocol, ip, port, budget, index)
+        phases.add(phase)
+        return service_info, 'http' if service_info else outcome()
+
+    async def _probe_banner(
+        self,
+        ip: str,
+        port: int,
+        expected: Optional[str],
+        rtt: Optional[Dict[str, float]],
+        previous_ms: Optional[int],
+        quick: bool = False
+    ) -> Optional[Dict]:
+        """
+        Identify a non-web service from its banner, under the HTTP probe's limits
+        
+        Args:
+            quick: Wait for the greeting no longer than for the connect
+        
+        Returns:
+            Service info dict if the protocol was identified, None otherwise
+        """
+        await self._throttle(ip)
+        if self.adaptive_timeouts:
+            connect_timeout = self.timeouts.connect_budget(rtt)
+            read_timeout = self.timeouts.read_budget(previous_ms)
+        else:
+            connect_timeout = read_timeout = self.timeout
+        if quick:
+            read_timeout = connect_timeout
+        found = await grab_banner(ip, port, expected, connect_timeout, read_timeout)
+        if found is None:
+            return None
+        
+        endpoint = f"{found['protocol']}://{ip}:{port}"
+        service_info = {
+            "url": endpoint,
+            "protocol": found["protocol"],
+            "ip": ip,
+            "port": port,
+            "endpoint": endpoint,
+            "status_code": None,
+            "response_time": found["response_time"],
+            "title": f"{found['label']} ({ip}:{port})",
+            "description": found["banner"],
+            "favicon": None,
+            "version": found["version"],
+            "certificate": None,
+            "fingerprint": {"key": None},
+        }
+        logger.info(f"Found {found['label']} service: {endpoint} (version: {found['version']})")
+        return service_info
+
+    async def _throttle(self, ip: str) -> float:
+        """Wait for the rate limiter, returns the seconds waited"""
+        if self.rate_limiter is None:
+            return 0.0
+        return await self.rate_limiter.acquire(ip)
+
+    async def _probe_url(
+        self,
+        protocol: str,
+        ip: str,
+        port: int,
+        timeout: httpx.Timeout,
+        index: FingerprintIndex
+    ) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Request one URL
+        
+        Redirects are followed hop by hop: a hop another endpoint of this
+        scan already requested reuses that endpoint's result.
+        
+        Returns:
+            (service info or None, "connect" or "read" when the attempt timed out,
+            "http" when the server answered HTTP without a service)
+        """
+        endpoint = f"{protocol}://{ip}:{port}"
+        claimed = []
+        service_info = None
+        try:
+            async with httpx.AsyncClient(verify=False, timeout=timeout) as client:
+                url = endpoint
+                for _ in range(client.max_redirects + 1):
+                    owner, shared = await index.claim(url)
+                    if shared is not None:
                         service_info = {
-                            "url": metadata.get("canonical_url", url),
-                            "protocol": protocol,
-                            "ip": ip,
-                            "port": port,
-                            "status_code": response.status_code,
-                            "response_time": int(response.elapsed.total_seconds() * 1000),
-                            "title": metadata.get("title", f"{ip}:{port}"),
-                            "description": metadata.get("description"),
-                            "favicon": metadata.get("favicon"),
+                            **shared,
+                            "protocol": protocol, "ip": ip, "port": port,
+                            "endpoint": endpoint, "reused": True,
                         }
-                        
-                        logger.info(f"Found web service: {url} (title: {service_info['title']})")
-                        return service_info
-                        
-            except Exception as e:
-                logger.debug(f"Failed to probe {url}: {e}")
-                continue
+                        return service_info, None
+                    if owner:
+                        claimed.append(url)
+                    response = await client.get(url)
+                    if not response.has_redirect_location:
+                        break
+                    url = str(response.next_request.url)
+                else:
+                    logger.debug(f"Failed to probe {endpoint}: too many redirects")
+                    return None, 'http'
+                
+                if response.status_code < 500:  # Consider anything < 500 as a valid web service
+                    # Extract metadata, once per distinct page
+                    digest, metadata = index.cached_metadata(response.content, endpoint)
+                    if metadata is None:
+                        metadata = await self._extract_metadata(response, endpoint)
+                        index.remember_metadata(digest, metadata)
+                    # Certificate of the handshake just made, no extra connection
+                    certificate = certificates.get(peer_certificate(response))
+                    
+                    service_info = {
+                        "url": metadata.get("canonical_url", endpoint),
+                        "protocol": protocol,
+                        "ip": ip,
+                        "port": port,
+                        "endpoint": endpoint,
+                        "status_code": response.status_code,
+                        "response_time": int(response.elapsed.total_seconds() * 1000),
+                        "title": metadata.get("title", f"{ip}:{port}"),
+                        "description": metadata.get("description"),
+                        "favicon": metadata.get("favicon"),
+                        "certificate": certificate,
+                        "fingerprint": fingerprint(
+                            metadata, str(response.url), certificate["sha256"] if certificate else None
+                        ),
+                    }
+                    
+                    logger.info(f"Found web service: {endpoint} (title: {service_info['title']})")
+                    return service_info, None
+                
+                return None, 'http'
+                    
+        except (httpx.ConnectTimeout, httpx.PoolTimeout):
+            logger.debug(f"Failed to probe {endpoint}: connect timeout after {timeout.connect}s")
+            return None, 'connect'
+        except (httpx.ReadTimeout, httpx.WriteTimeout):
+            logger.debug(f"Failed to probe {endpoint}: read timeout after {timeout.read}s")
+            return None, 'read'
+        except Exception as e:
+            logger.debug(f"Failed to probe {endpoint}: {e}")
+        finally:
+            index.settle(claimed, service_info)
         
-        return None
+        return None, None
 
     async def _extract_metadata(self, response: httpx.Response, url: str) -> Dict:
         """
@@ -78,62 +472,53 @@ class HTTPProbe:
         Returns:
             Metadata dictionary
         """
-        metadata = {
-            "canonical_url": str(response.url)
-        }
-        
-        try:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extract title
-            title_tag = soup.find('title')
-            if title_tag:
-                metadata["title"] = title_tag.get_text().strip()
-            
-            # Extract description
-            desc_tag = soup.find('meta', attrs={'name': 'description'})
-            if desc_tag and desc_tag.get('content'):
-                metadata["description"] = desc_tag['content'].strip()
-            
-            # Extract favicon
-            favicon_tag = soup.find('link', rel=lambda x: x and 'icon' in x.lower())
-            if favicon_tag and favicon_tag.get('href'):
-                favicon_url = favicon_tag['href']
-                if not favicon_url.startswith('http'):
-                    # Convert relative URL to absolute
-                    from urllib.parse import urljoin
-                    favicon_url = urljoin(str(response.url), favicon_url)
-                metadata["favicon"] = favicon_url
-            else:
-                # Try default favicon location
-                from urllib.parse import urlparse
-                parsed = urlparse(str(response.url))
-                metadata["favicon"] = f"{parsed.scheme}://{parsed.netloc}/favicon.ico"
-                
-        except Exception as e:
-            logger.debug(f"Error extracting metadata from {url}: {e}")
-        
-        return metadata
+        if self.metadata_mode == "process":
+            try:
+                return await self._metadata_pool().extract(
+                    response.content, response.charset_encoding, str(response.url)
+                )
+            except Exception as e:
+                logger.warning(f"Metadata process pool failed, parsing {url} inline: {e}")
+        return extract_metadata(response.content, response.charset_encoding, str(response.url))
+
+    def _metadata_pool(self) -> "MetadataPool":
+        if self._pool is None or self._pool.broken:
+            self._pool = MetadataPool.shared(self.metadata_workers, self.metadata_batch_size)
+        return self._pool
 
-    async def probe_multiple(self, hosts: list) -> list:
+    async def probe_multiple(self, hosts: list, response_times: Dict[Tuple[str, int], int] = None) -> list:
         """
         Probe multiple hosts concurrently
         
         Args:
-            hosts: List of host dicts with 'ip' and 'ports'
+            hosts: List of host dicts with 'ip', 'ports' and optionally 'rtt'
+            response_times: (ip, port) -> response time in ms from the previous scan
             
         Returns:
-            List of discovered web services
+            List of discovered web services, and of identified non-web ones
         """
+        response_times = response_times or {}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self.fingerprints = index = FingerprintIndex(self.timeout)
+        
+        async def probe(host: dict, port_info: dict):
+            port = port_info["port"]
+            async with semaphore:
+                return await self.probe_port(
+                    host["ip"], port, host.get("rtt"), response_times.get((host["ip"], port)), index,
+                    port_info.get("service")
+                )
+        
         tasks = []
         for host in hosts:
             for port_info in host.get("ports", []):
-                tasks.append(self.probe_port(host["ip"], port_info["port"]))
+                tasks.append(probe(host, port_info))
         
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
         # Filter out None and exceptions
         services = [r for r in results if r and not isinstance(r, Exception)]
         
-        logger.info(f"Probed {len(tasks)} endpoints, found {len(services)} web services")
+        index.stats["fingerprinted"] = sum(1 for s in services if s["fingerprint"]["key"] and not s.get("reused"))
+        logger.info(f"Probed {len(tasks)} endpoints, found {len(services)} services ({index.stats})")
         return services
@@ -1,86 +1,249 @@
 """
 Network scanner using nmap
 """
+import os
 import asyncio
+import ipaddress
 import logging
+import xml.etree.ElementTree as ET
 from typing import List, Dict
 import nmap
 
+from .ratelimit import ScanRateLimiter
+
 logger = logging.getLogger(__name__)
 
+# Live hosts per nmap port scan run in two-phase discovery
+PORT_SCAN_BATCH = 256
+
+# Top-ranked ports used as TCP SYN pings by the host sweep
+SWEEP_PING_PORTS = 2
+
 
 class NetworkScanner:
     """Network scanner for discovering hosts and services"""
 
-    def __init__(self, networks: List[str], ports: List[int] = None):
+    def __init__(
+        self,
+        networks: List[str],
+        ports: List[int] = None,
+        port_scanner=None,
+        nmap_dns: bool = None,
+        rate_limiter: ScanRateLimiter = None,
+        discovery: str = None,
+        port_history: Dict[str, Dict[int, int]] = None,
+        full_sweep: bool = True,
+        subnet_prefix: int = 24
+    ):
         """
         Initialize network scanner
         
         Args:
             networks: List of CIDR networks to scan (e.g., ["192.168.1.0/24"])
             ports: List of ports to scan (default: common web ports)
+            port_scanner: nmap.PortScanner compatible object (default: a new nmap.PortScanner)
+            nmap_dns: Let nmap reverse-resolve hosts itself (default: NMAP_DNS or False,
+                hostnames are resolved after discovery by scanner.resolver)
+            rate_limiter: Limits applied to nmap with --max-rate (default: none)
+            discovery: "two_phase" to sweep for live hosts before port scanning them,
+                "single" for one port scan of every address (default: SCAN_DISCOVERY or "two_phase")
+            port_history: subnet -> {port: services found} used to trim ports and pick ping ports
+            full_sweep: Scan every port in every subnet, not trimmed
+                (default for scan_network)
+            subnet_prefix: Prefix length of the subnets port_history is keyed by
         """
         self.networks = networks
         self.ports = ports or [80, 443, 8080, 8443, 3000, 5000, 8000, 9090, 3001, 5001]
-        self.nm = nmap.PortScanner()
+        self.nm = port_scanner or nmap.PortScanner()
+        if nmap_dns is None:
+            nmap_dns = os.getenv("NMAP_DNS", "false").lower() == "true"
+        self.nmap_dns = nmap_dns
+        self.rate_limiter = rate_limiter
+        self.discovery = discovery or os.getenv("SCAN_DISCOVERY", "two_phase")
+        self.port_history = port_history or {}
+        self.full_sweep = full_sweep
+        self.subnet_prefix = subnet_prefix
+        self.stats = {"mode": self.discovery, "full_sweeps": 0, "live_hosts": 0, "port_scans": 0}
 
-    async def scan_network(self, network: str) -> List[Dict]:
+    async def scan_network(self, network: str, full_sweep: bool = None) -> List[Dict]:
         """
         Scan a network for hosts with open web ports
         
         Args:
-            network: CIDR network to scan
+            network: CIDR network (or other nmap target) to scan
+            full_sweep: Scan every port of its subnets (default: the scanner's full_sweep)
             
         Returns:
             List of discovered hosts with open ports
+            
+        Raises:
+            Exception: nmap failed, the network's results are incomplete
         """
         logger.info(f"Scanning network: {network}")
         discovered = []
+        if full_sweep is None:
+            full_sweep = self.full_sweep
+        if full_sweep:
+            self.stats["full_sweeps"] += 1
 
-        try:
-            # Run nmap scan in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            ports_str = ",".join(map(str, self.ports))
-            
-            await loop.run_in_executor(
-                None,
-                lambda: self.nm.scan(
-                    hosts=network,
-                    arguments=f'-p {ports_str} --open -T4 --host-timeout 30s'
-                )
+        if self.discovery == "single":
+            return await self._port_scan(network, self.ports, network)
+        
+        # Phase 1: which addresses answer at all
+        live_hosts = await self._sweep(network)
+        self.stats["live_hosts"] += len(live_hosts)
+        
+        # Phase 2: port scan of live hosts only, with each subnet's port list
+        by_subnet = {}
+        for ip in live_hosts:
+            by_subnet.setdefault(self.subnet_of(ip), []).append(ip)
+        for subnet, ips in by_subnet.items():
+            ports = self.ports_for(subnet, full_sweep)
+            for start in range(0, len(ips), PORT_SCAN_BATCH):
+                targets = " ".join(ips[start:start + PORT_SCAN_BATCH])
+                discovered.extend(await self._port_scan(targets, ports, network, ping=False))
+
+        return discovered
+
+    def subnet_of(self, ip: str) -> str:
+        """Subnet an address is ranked in"""
+        address = ipaddress.ip_address(ip)
+        prefix = min(self.subnet_prefix, address.max_prefixlen)
+        return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+    def ports_for(self, subnet: str, full_sweep: bool = None) -> List[int]:
+        """
+        Ports to scan in a subnet
+        
+        Outside full sweeps (default: the scanner's full_sweep), ports on
+        which no service was ever found in the subnet are skipped; subnets
+        without history always get the full list. The order doesn't
+        matter, nmap scans the ports in random order.
+        """
+        history = self.port_history.get(subnet)
+        if not history or (self.full_sweep if full_sweep is None else full_sweep):
+            return self.ports
+        return [port for port in self.ports if history.get(port)]
+
+    async def _run_nmap(self, hosts: str, arguments: str, network: str):
+        """Run nmap in the thread pool (python-nmap blocks), with the common options"""
+        if not self.nmap_dns:
+            arguments += ' -n'
+        max_rate = self.rate_limiter.discovery_rate(network) if self.rate_limiter else None
+        if max_rate:
+            arguments += f' --max-rate {max_rate}'
+        
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            None,
+            lambda: self.nm.scan(
+                hosts=hosts,
+                arguments=arguments
             )
+        )
 
-            # Process scan results
-            for host in self.nm.all_hosts():
-                host_info = {
-                    "ip": host,
-                    "hostname": self.nm[host].hostname() or host,
-                    "state": self.nm[host].state(),
-                    "ports": []
-                }
-
-                # Check each protocol
-                for proto in self.nm[host].all_protocols():
-                    ports = self.nm[host][proto].keys()
-                    for port in ports:
-                        port_info = self.nm[host][proto][port]
-                        if port_info['state'] == 'open':
-                            host_info["ports"].append({
-                                "port": port,
-                                "protocol": proto,
-                                "service": port_info.get('name', 'unknown'),
-                                "state": port_info['state']
-                            })
-
-                if host_info["ports"]:
-                    discovered.append(host_info)
-                    logger.info(f"Found host: {host} with {len(host_info['ports'])} open ports")
-
-        except Exception as e:
-            logger.error(f"Error scanning network {network}: {e}")
+    async def _sweep(self, network: str) -> List[str]:
+        """
+        Host discovery without port scan
+        
+        Same number of probes as nmap's default discovery, but the SYN pings
+        go to the ports most often open in the inventory (instead of 443
+        and an ICMP timestamp request), so hosts dropping ICMP but serving
+        one of them are found.
+        
+        Returns:
+            Addresses of the hosts that are up
+        """
+        totals = {}
+        for counts in self.port_history.values():
+            for port, count in counts.items():
+                totals[port] = totals.get(port, 0) + count
+        ranked = sorted(self.ports, key=lambda port: -totals.get(port, 0))
+        ping_ports = ",".join(map(str, ranked[:SWEEP_PING_PORTS]))
+        await self._run_nmap(network, f'-sn -PE -PA80 -PS{ping_ports} -T4', network)
+        live = [host for host in self.nm.all_hosts() if self.nm[host].state() == 'up']
+        logger.info(f"Host sweep of {network}: {len(live)} hosts up")
+        return live
+
+    async def _port_scan(self, hosts: str, ports: List[int], network: str, ping: bool = True) -> List[Dict]:
+        """
+        Port scan and collect the hosts with open ports
+        
+        Args:
+            hosts: nmap target specification
+            ports: Ports to scan
+            network: Network the targets belong to (for the rate limit)
+            ping: Let nmap check that hosts are up first (False after a sweep)
+        """
+        if not ports:
+            return []
+        ports_str = ",".join(map(str, ports))
+        arguments = f'-p {ports_str} --open -T4 --host-timeout 30s'
+        if not ping:
+            arguments += ' -Pn'
+        await self._run_nmap(hosts, arguments, network)
+        self.stats["port_scans"] += 1
+        
+        discovered = []
+        # Process scan results
+        rtts = self._host_rtts()
+        for host in self.nm.all_hosts():
+            host_info = {
+                "ip": host,
+                "hostname": self.nm[host].hostname() or None,
+                "state": self.nm[host].state(),
+                "rtt": rtts.get(host),
+                "ports": []
+            }
+
+            # Check each protocol
+            for proto in self.nm[host].all_protocols():
+                ports = self.nm[host][proto].keys()
+                for port in ports:
+                    port_info = self.nm[host][proto][port]
+                    if port_info['state'] == 'open':
+                        host_info["ports"].append({
+                            "port": port,
+                            "protocol": proto,
+                            "service": port_info.get('name', 'unknown'),
+                            "state": port_info['state']
+                        })
+
+            if host_info["ports"]:
+                discovered.append(host_info)
+                logger.info(f"Found host: {host} with {len(host_info['ports'])} open ports")
 
         return discovered
 
+    def _host_rtts(self) -> Dict[str, Dict[str, float]]:
+        """
+        Round-trip times nmap measured for each host
+        
+        python-nmap does not parse the <times> element, so it is read from
+        the raw XML output.
+        
+        Returns:
+            ip -> {"srtt": seconds, "rttvar": seconds}
+        """
+        rtts = {}
+        try:
+            root = ET.fromstring(self.nm.get_nmap_last_output())
+        except (ET.ParseError, TypeError, ValueError) as e:
+            logger.debug(f"Could not read host RTTs from nmap output: {e}")
+            return rtts
+        
+        for host in root.iter('host'):
+            address = host.find('address')
+            times = host.find('times')
+            if address is None or times is None or times.get('srtt') is None:
+                continue
+            # nmap reports microseconds
+            rtts[address.get('addr')] = {
+                "srtt": int(times.get('srtt')) / 1e6,
+                "rttvar": int(times.get('rttvar', 0)) / 1e6,
+            }
+        return rtts
+
     async def scan_all_networks(self) -> List[Dict]:
         """
         Scan all configured networks
@@ -92,8 +255,10 @@ class NetworkScanner:
         all_hosts = []
 
         for network in self.networks:
-            hosts = await self.scan_network(network)
-            all_hosts.extend(hosts)
+            try:
+                all_hosts.extend(await self.scan_network(network))
+            except Exception as e:
+                logger.error(f"Error scanning network {network}: {e}")
 
         logger.info(f"Scan complete. Found {len(all_hosts)} hosts")
         return all_hosts
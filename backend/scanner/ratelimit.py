@@ -0,0 +1,202 @@
+"""
+Token bucket rate limiting of scan traffic, globally and per subnet
+"""
+import os
+import time
+import asyncio
+import ipaddress
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket for asyncio tasks
+
+    Callers reserve tokens immediately (the balance may go negative) and
+    sleep until their reservation is covered, so waiters are served in
+    arrival order without a lock.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        """
+        Initialize the bucket
+
+        Args:
+            rate: Tokens added per second
+            burst: Bucket capacity (default: one second worth of tokens)
+        """
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.throttled = 0.0
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens, waiting for them if needed
+
+        Returns:
+            Seconds spent waiting
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= tokens
+
+        if self.tokens >= 0:
+            return 0.0
+        wait = -self.tokens / self.rate
+        self.throttled += wait
+        await asyncio.sleep(wait)
+        return wait
+
+
+class ScanRateLimiter:
+    """
+    Connection rate limits shared by the discovery and probe stages
+
+    Every connection to a host takes a token from the global bucket and
+    from the bucket of its subnet: a network with a configured rate has
+    one bucket for the whole network, other addresses get one bucket per
+    /subnet_prefix.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = None,
+        subnet_rate: float = None,
+        network_rates: Dict[str, float] = None,
+        subnet_prefix: int = None
+    ):
+        """
+        Initialize the limiter
+
+        Args:
+            global_rate: Connections per second across all hosts, 0 for no
+                limit (default: SCAN_RATE_LIMIT or 500)
+            subnet_rate: Connections per second into one subnet, 0 for no
+                limit (default: SCAN_SUBNET_RATE_LIMIT or 100)
+            network_rates: CIDR -> connections per second for that network
+                (default: SCAN_NETWORK_RATE_LIMITS, "192.168.1.0/24=20,10.0.0.0/16=200")
+            subnet_prefix: Prefix length of the default subnets (default: SCAN_SUBNET_PREFIX or 24)
+        """
+        if global_rate is None:
+            global_rate = float(os.getenv("SCAN_RATE_LIMIT", "500"))
+        if subnet_rate is None:
+            subnet_rate = float(os.getenv("SCAN_SUBNET_RATE_LIMIT", "100"))
+        if network_rates is None:
+            network_rates = parse_network_rates(os.getenv("SCAN_NETWORK_RATE_LIMITS", ""))
+
+        self.global_rate = global_rate
+        self.subnet_rate = subnet_rate
+        self.subnet_prefix = subnet_prefix or int(os.getenv("SCAN_SUBNET_PREFIX", "24"))
+        self.network_rates = {ipaddress.ip_network(net, strict=False): rate for net, rate in network_rates.items()}
+
+        self.global_bucket = TokenBucket(global_rate) if global_rate > 0 else None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.connections = 0
+        self.throttled = 0.0
+
+    def subnet_of(self, ip: str) -> str:
+        """Name of the bucket an address belongs to"""
+        address = ipaddress.ip_address(ip)
+        for network in self.network_rates:
+            if address in network:
+                return str(network)
+        prefix = min(self.subnet_prefix, address.max_prefixlen)
+        return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+    def rate_of(self, subnet: str) -> float:
+        """Connections per second allowed into a subnet, 0 for no limit"""
+        return self.network_rates.get(ipaddress.ip_network(subnet), self.subnet_rate)
+
+    def _bucket(self, subnet: str) -> Optional[TokenBucket]:
+        if subnet not in self._buckets:
+            rate = self.rate_of(subnet)
+            self._buckets[subnet] = TokenBucket(rate) if rate > 0 else None
+        return self._buckets[subnet]
+
+    async def acquire(self, ip: str) -> float:
+        """
+        Wait until a connection to `ip` is allowed
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        if self.global_bucket:
+            waited += await self.global_bucket.acquire()
+        bucket = self._bucket(self.subnet_of(ip))
+        if bucket:
+            waited += await bucket.acquire()
+        self.connections += 1
+        self.throttled += waited
+        return waited
+
+    def discovery_rate(self, network: str) -> Optional[int]:
+        """
+        Packet rate for nmap --max-rate when scanning a network
+
+        nmap paces its own packets, so discovery gets the same budget as a
+        rate (the smallest of the global rate and the network's subnets
+        combined) instead of sharing the buckets.
+
+        Other nmap targets (address ranges, host names) can't be sized
+        against the subnet limits and only get the global rate.
+
+        Returns:
+            Packets per second, None for no limit
+        """
+        rates = []
+        if self.global_rate > 0:
+            rates.append(self.global_rate)
+        try:
+            net = ipaddress.ip_network(network, strict=False)
+        except ValueError:
+            return int(max(1, self.global_rate)) if rates else None
+        configured = next(
+            (rate for n, rate in self.network_rates.items() if n.version == net.version and net.subnet_of(n)),
+            None
+        )
+        if configured is not None:
+            if configured > 0:
+                rates.append(configured)
+        elif self.subnet_rate > 0:
+            subnets = 2 ** max(0, min(self.subnet_prefix, net.max_prefixlen) - net.prefixlen)
+            rates.append(self.subnet_rate * subnets)
+        return int(max(1, min(rates))) if rates else None
+
+    def metrics(self) -> dict:
+        """Configured rates and time spent throttled, for scan_config"""
+        subnets = {
+            subnet: round(bucket.throttled, 3)
+            for subnet, bucket in self._buckets.items()
+            if bucket and bucket.throttled
+        }
+        return {
+            "global_rate": self.global_rate,
+            "subnet_rate": self.subnet_rate,
+            "network_rates": {str(net): rate for net, rate in self.network_rates.items()},
+            "connections": self.connections,
+            "throttled_seconds": round(self.throttled, 3),
+            "global_throttled_seconds": round(self.global_bucket.throttled, 3) if self.global_bucket else 0.0,
+            "subnet_throttled_seconds": subnets,
+        }
+
+
+def parse_network_rates(value: str) -> Dict[str, float]:
+    """Parse "192.168.1.0/24=20,10.0.0.0/16=200" into {cidr: rate}"""
+    rates = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        try:
+            network, rate = item.split("=")
+            ipaddress.ip_network(network.strip(), strict=False)
+            rates[network.strip()] = float(rate)
+        except ValueError:
+            logger.warning(f"Ignoring invalid network rate limit: {item!r}")
+    return rates
@@ -0,0 +1,121 @@
+"""
+Asynchronous reverse DNS resolution with a TTL cache
+"""
+import os
+import time
+import socket
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Lookup = Callable[[str], Awaitable[Optional[str]]]
+
+
+async def system_lookup(ip: str) -> Optional[str]:
+    """PTR lookup through the system resolver (getnameinfo, run in a thread)"""
+    loop = asyncio.get_running_loop()
+    try:
+        hostname, _ = await loop.getnameinfo((ip, 0), socket.NI_NAMEREQD)
+    except (socket.gaierror, socket.herror, OSError):
+        return None
+    return hostname
+
+
+class ReverseResolver:
+    """
+    Reverse resolver shared by successive scans
+
+    Hosts rarely change names between scans, so answers (and failures,
+    for a shorter time) are cached and only new or expired addresses are
+    looked up, concurrently and with a per-lookup timeout.
+    """
+
+    def __init__(
+        self,
+        ttl: int = None,
+        negative_ttl: int = None,
+        concurrency: int = None,
+        timeout: float = None,
+        lookup: Lookup = None
+    ):
+        """
+        Initialize the resolver
+
+        Args:
+            ttl: Seconds a resolved hostname is cached (default: DNS_CACHE_TTL or 3600)
+            negative_ttl: Seconds a failed lookup is cached (default: DNS_NEGATIVE_TTL or 300)
+            concurrency: Maximum lookups in flight (default: DNS_CONCURRENCY or 32)
+            timeout: Seconds before a lookup is given up (default: DNS_TIMEOUT or 2)
+            lookup: Async ip -> hostname function (default: system resolver)
+        """
+        self.ttl = ttl if ttl is not None else int(os.getenv("DNS_CACHE_TTL", "3600"))
+        self.negative_ttl = negative_ttl if negative_ttl is not None else int(os.getenv("DNS_NEGATIVE_TTL", "300"))
+        self.concurrency = concurrency or int(os.getenv("DNS_CONCURRENCY", "32"))
+        self.timeout = timeout or float(os.getenv("DNS_TIMEOUT", "2"))
+        self.lookup = lookup or system_lookup
+        self._cache: Dict[str, Tuple[Optional[str], float]] = {}
+
+    def cached(self, ip: str) -> Tuple[bool, Optional[str]]:
+        """
+        Look an address up in the cache only
+
+        Returns:
+            (hit, hostname), hostname is None for cached failures
+        """
+        entry = self._cache.get(ip)
+        if entry is None or entry[1] < time.monotonic():
+            return False, None
+        return True, entry[0]
+
+    async def resolve_many(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Resolve a batch of addresses
+
+        Args:
+            ips: IP addresses, duplicates are looked up once
+
+        Returns:
+            ip -> hostname, None when the address has no PTR record
+        """
+        results = {}
+        missing = []
+        for ip in dict.fromkeys(ips):
+            hit, hostname = self.cached(ip)
+            if hit:
+                results[ip] = hostname
+            else:
+                missing.append(ip)
+
+        if missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def resolve(ip: str):
+                async with semaphore:
+                    results[ip] = await self._resolve(ip)
+
+            await asyncio.gather(*(resolve(ip) for ip in missing))
+            logger.info(f"Resolved {len(missing)} addresses ({len(results) - len(missing)} cached)")
+
+        return results
+
+    async def _resolve(self, ip: str) -> Optional[str]:
+        try:
+            hostname = await asyncio.wait_for(self.lookup(ip), self.timeout)
+        except Exception as e:
+            # Timeouts are not cached as failures, the next scan tries again
+            logger.debug(f"Reverse lookup of {ip} failed: {e}")
+            return None
+
+        ttl = self.ttl if hostname else self.negative_ttl
+        self._cache[ip] = (hostname, time.monotonic() + ttl)
+        return hostname
+
+    def clear(self):
+        """Forget every cached answer"""
+        self._cache.clear()
+
+
+# Process-wide resolver, so the cache survives across scans
+resolver = ReverseResolver()
@@ -0,0 +1,98 @@
+"""
+Per-endpoint probe timeouts from observed round-trip times
+"""
+import os
+from typing import Dict, Optional
+
+import httpx
+
+# Floor of the TCP connect budget, below it scheduling jitter causes false timeouts
+MIN_CONNECT = 0.25
+
+
+class TimeoutPolicy:
+    """
+    Chooses connect, TLS and read budgets for one probe attempt
+
+    The TCP connect budget follows the RTT nmap measured for the host, the
+    read budget follows the response time recorded for the service by the
+    previous scan. Endpoints without history get short budgets first; the
+    single retry gets whatever is left of max_timeout.
+
+    httpx has no separate TLS timeout: the handshake runs under the
+    connect timeout, so for HTTPS the connect budget is TCP + TLS.
+    """
+
+    def __init__(
+        self,
+        max_timeout: float = 10,
+        fast_timeout: float = None,
+        tls_timeout: float = None,
+        rtt_factor: float = 4,
+        response_factor: float = 3
+    ):
+        """
+        Initialize the policy
+
+        Args:
+            max_timeout: Upper bound of any phase, and of all attempts on an endpoint
+            fast_timeout: Connect and read budget of a first attempt without
+                history (default: PROBE_FAST_TIMEOUT or 2)
+            tls_timeout: TLS handshake budget of a first attempt (default: PROBE_TLS_TIMEOUT or 1)
+            rtt_factor: Connect budget in smoothed RTTs, on top of 4 RTT variations
+            response_factor: Read budget as a multiple of the previous response time
+        """
+        self.max_timeout = max_timeout
+        self.fast_timeout = min(fast_timeout or float(os.getenv("PROBE_FAST_TIMEOUT", "2")), max_timeout)
+        self.tls_timeout = min(tls_timeout or float(os.getenv("PROBE_TLS_TIMEOUT", "1")), max_timeout)
+        self.rtt_factor = rtt_factor
+        self.response_factor = response_factor
+
+    def connect_budget(self, rtt: Optional[Dict[str, float]]) -> float:
+        """TCP connect budget from nmap's srtt/rttvar (seconds)"""
+        if not rtt or rtt.get("srtt") is None:
+            return self.fast_timeout
+        budget = rtt["srtt"] * self.rtt_factor + 4 * rtt.get("rttvar", 0)
+        return min(max(budget, MIN_CONNECT), self.fast_timeout)
+
+    def read_budget(self, previous_ms: Optional[int]) -> float:
+        """Read budget from the previous response time (milliseconds)"""
+        if not previous_ms:
+            return self.fast_timeout
+        return min(max(previous_ms / 1000 * self.response_factor, self.fast_timeout), self.max_timeout)
+
+    def first_attempt(
+        self,
+        protocol: str,
+        rtt: Optional[Dict[str, float]] = None,
+        previous_ms: Optional[int] = None
+    ) -> httpx.Timeout:
+        """
+        Budgets of the first attempt on an endpoint
+
+        Args:
+            protocol: "https" or "http"
+            rtt: {"srtt": seconds, "rttvar": seconds} from discovery
+            previous_ms: Response time recorded by the previous scan
+
+        Returns:
+            httpx timeout configuration
+        """
+        connect = self.connect_budget(rtt)
+        if protocol == "https":
+            connect += self.tls_timeout
+        read = self.read_budget(previous_ms)
+        return httpx.Timeout(connect=connect, read=read, write=self.fast_timeout, pool=None)
+
+    def retry(self, spent: float) -> httpx.Timeout:
+        """
+        Budgets of the slower retry
+
+        Args:
+            spent: Seconds already spent on the endpoint
+
+        Returns:
+            httpx timeout configuration, every phase gets the remaining budget
+        """
+        remaining = max(self.max_timeout - spent, self.fast_timeout)
+        return httpx.Timeout(remaining, pool=None)
@@ -0,0 +1,99 @@
+"""
+Per-network scan schedules
+
+Each schedule scans its own networks and ports every interval_minutes.
+The scan leader dispatches the due ones to the job queue on every tick,
+higher priorities first. Runs are spread with jitter so schedules sharing
+an interval drift apart instead of bursting together, and a schedule
+whose previous scan is still queued or running isn't queued twice. The
+job queue caps how many scans run at once (SCAN_MAX_CONCURRENT).
+"""
+import os
+import random
+import logging
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from jobs import enqueue_scan
+from models import ScanJob, ScanSchedule
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two looks for due schedules
+SCAN_SCHEDULE_TICK = int(os.getenv("SCAN_SCHEDULE_TICK", "30"))
+
+# Each run is moved by up to this fraction of the interval, either way
+SCAN_SCHEDULE_JITTER = float(os.getenv("SCAN_SCHEDULE_JITTER", "0.1"))
+
+
+def first_run(interval_minutes: int, now: datetime = None) -> datetime:
+    """First run of a new schedule, within the jitter window so new schedules don't start together"""
+    now = now or datetime.utcnow()
+    return now + timedelta(minutes=interval_minutes * random.uniform(0, SCAN_SCHEDULE_JITTER))
+
+
+def next_run(interval_minutes: int, now: datetime = None) -> datetime:
+    """Run after the one dispatched at `now`: one interval later, give or take the jitter"""
+    now = now or datetime.utcnow()
+    jitter = random.uniform(-SCAN_SCHEDULE_JITTER, SCAN_SCHEDULE_JITTER)
+    return now + timedelta(minutes=interval_minutes * (1 + jitter))
+
+
+async def has_schedules() -> bool:
+    """True when enabled schedules replace the daily scan of every network"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(ScanSchedule.id).where(ScanSchedule.enabled == True).limit(1))
+        return result.first() is not None
+
+
+async def schedule_networks(db: AsyncSession) -> List[str]:
+    """Networks of the enabled schedules, each once"""
+    result = await db.execute(
+        select(ScanSchedule.networks).where(ScanSchedule.enabled == True).order_by(ScanSchedule.id)
+    )
+    networks = []
+    for scheduled in result.scalars():
+        networks.extend(network for network in scheduled or [] if network not in networks)
+    return networks
+
+
+async def dispatch_due_schedules(now: datetime = None) -> List[ScanJob]:
+    """
+    Queue a scan for every enabled schedule that is due
+
+    Returns:
+        The jobs of the dispatched schedules, already active ones included
+    """
+    now = now or datetime.utcnow()
+    jobs = []
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(ScanSchedule)
+            .where(
+                ScanSchedule.enabled == True,
+                or_(ScanSchedule.next_run_at.is_(None), ScanSchedule.next_run_at <= now)
+            )
+            .order_by(ScanSchedule.priority.desc(), ScanSchedule.next_run_at)
+        )
+        for schedule in result.scalars().all():
+            job = await enqueue_scan(
+                db,
+                priority=schedule.priority or 0,
+                payload={"networks": schedule.networks, "ports": schedule.ports},
+                schedule_id=schedule.id
+            )
+            if job.id == schedule.last_job_id:
+                # This run is skipped rather than piled up behind the slow one
+                logger.info(f"Schedule {schedule.name}: previous scan (job {job.id}) is still {job.status}")
+            else:
+                logger.info(f"Schedule {schedule.name}: queued scan job {job.id} for {', '.join(schedule.networks)}")
+                schedule.last_run_at = now
+                schedule.last_job_id = job.id
+            schedule.next_run_at = next_run(schedule.interval_minutes, now)
+            jobs.append(job)
+        await db.commit()
+    return jobs
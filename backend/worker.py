@@ -0,0 +1,35 @@
+"""
+Scan worker for NeonDeck
+
+Runs scan jobs queued in the database outside the API process, so
+probing, parsing and large flushes never share the API event loop.
+Start any number of them next to the API (with SCAN_WORKER_MODE=external):
+
+    python worker.py
+"""
+import os
+import asyncio
+import logging
+
+from database import init_db
+from jobs import ScanWorker
+
+# Configure logging
+logging.basicConfig(
+    level=getattr(logging, os.getenv("LOG_LEVEL", "INFO")),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    await init_db()
+    worker = ScanWorker()
+    await worker.run_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Scan worker stopped")
@@ -17,14 +17,20 @@ CREATE TABLE IF NOT EXISTS services (
     favicon_url VARCHAR(512),
     category_id INTEGER REFERENCES categories(id) ON DELETE SET NULL,
     ip_address INET,
+    hostname VARCHAR(255),
     port INTEGER,
     protocol VARCHAR(10) DEFAULT 'https',
+    version VARCHAR(100),
     status VARCHAR(20) DEFAULT 'active',
     response_time INTEGER,
     last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     first_discovered TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     is_manual BOOLEAN DEFAULT FALSE,
     metadata JSONB DEFAULT '{}',
+    fingerprint VARCHAR(64),
+    aliases JSONB DEFAULT '[]',
+    certificate JSONB,
+    cert_expires_at TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -42,12 +48,128 @@ CREATE TABLE IF NOT EXISTS scan_history (
     scan_config JSONB DEFAULT '{}'
 );
 
+-- Scan leader election lease
+CREATE TABLE IF NOT EXISTS scheduler_leases (
+    name VARCHAR(50) PRIMARY KEY,
+    holder VARCHAR(255) NOT NULL,
+    acquired_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- Scan job queue
+CREATE TABLE IF NOT EXISTS scan_jobs (
+    id SERIAL PRIMARY KEY,
+    status VARCHAR(20) DEFAULT 'queued',
+    priority INTEGER DEFAULT 0,
+    payload JSONB DEFAULT '{}',
+    schedule_id INTEGER,
+    scan_id INTEGER,
+    claimed_by VARCHAR(255),
+    lease_expires_at TIMESTAMP,
+    attempts INTEGER DEFAULT 0,
+    progress JSONB DEFAULT '{}',
+    error_message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+-- Recurring per-network scans
+CREATE TABLE IF NOT EXISTS scan_schedules (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    networks JSONB NOT NULL,
+    ports JSONB,
+    interval_minutes INTEGER NOT NULL,
+    priority INTEGER DEFAULT 0,
+    enabled BOOLEAN DEFAULT TRUE,
+    next_run_at TIMESTAMP,
+    last_run_at TIMESTAMP,
+    last_job_id INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Networks or shards of each scan, checkpointed one by one
+CREATE TABLE IF NOT EXISTS scan_units (
+    id SERIAL PRIMARY KEY,
+    scan_id INTEGER NOT NULL,
+    network VARCHAR(64) NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    hosts INTEGER DEFAULT 0,
+    services_found INTEGER DEFAULT 0,
+    new_services INTEGER DEFAULT 0,
+    removed_services INTEGER DEFAULT 0,
+    changed_services INTEGER DEFAULT 0,
+    full_sweep BOOLEAN DEFAULT FALSE,
+    error_message TEXT,
+    started_at TIMESTAMP,
+    completed_at TIMESTAMP,
+    agent_id INTEGER,
+    lease_expires_at TIMESTAMP
+);
+
+-- Remote scanner agents
+CREATE TABLE IF NOT EXISTS agents (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    token_hash VARCHAR(64) NOT NULL UNIQUE,
+    networks JSONB NOT NULL,
+    ports JSONB,
+    enabled BOOLEAN DEFAULT TRUE,
+    last_seen_at TIMESTAMP,
+    last_address VARCHAR(45),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Agent results waiting for the last batch of their unit
+CREATE TABLE IF NOT EXISTS agent_batches (
+    id SERIAL PRIMARY KEY,
+    unit_id INTEGER NOT NULL,
+    attempt INTEGER NOT NULL,
+    batch INTEGER NOT NULL,
+    hosts INTEGER DEFAULT 0,
+    services JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-scan service changes
+CREATE TABLE IF NOT EXISTS scan_changes (
+    id SERIAL PRIMARY KEY,
+    scan_id INTEGER NOT NULL,
+    service_id INTEGER NOT NULL,
+    kind VARCHAR(10) NOT NULL,
+    fields JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Models fingerprint of the last schema setup (skips it on restarts)
+CREATE TABLE IF NOT EXISTS schema_version (
+    name VARCHAR(50) PRIMARY KEY,
+    version VARCHAR(64) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_services_category ON services(category_id);
 CREATE INDEX IF NOT EXISTS idx_services_status ON services(status);
 CREATE INDEX IF NOT EXISTS idx_services_url ON services(url);
 CREATE INDEX IF NOT EXISTS idx_services_last_seen ON services(last_seen DESC);
+CREATE INDEX IF NOT EXISTS idx_services_hostname ON services(hostname);
+CREATE INDEX IF NOT EXISTS idx_services_fingerprint ON services(fingerprint);
+CREATE INDEX IF NOT EXISTS idx_services_cert_expires ON services(cert_expires_at);
+CREATE INDEX IF NOT EXISTS idx_services_updated ON services(updated_at, id);
 CREATE INDEX IF NOT EXISTS idx_scan_history_started ON scan_history(started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_status ON scan_jobs(status);
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_created ON scan_jobs(created_at);
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_schedule ON scan_jobs(schedule_id);
+CREATE INDEX IF NOT EXISTS idx_scan_schedules_next_run ON scan_schedules(next_run_at);
+CREATE INDEX IF NOT EXISTS idx_scan_units_scan ON scan_units(scan_id);
+CREATE INDEX IF NOT EXISTS idx_agent_batches_unit ON agent_batches(unit_id);
+CREATE INDEX IF NOT EXISTS idx_scan_changes_scan ON scan_changes(scan_id);
+CREATE INDEX IF NOT EXISTS idx_scan_changes_service ON scan_changes(service_id);
+CREATE INDEX IF NOT EXISTS idx_scan_changes_created ON scan_changes(created_at);
 
 -- Insert default categories with cyberpunk colors
 INSERT INTO categories (name, icon, color, order_index) VALUES
@@ -1,10 +1,24 @@
 import React, { useState } from 'react';
-import { X, Plus, Globe, Type, Tag, AlignLeft, Loader2 } from 'lucide-react';
+import { X, Plus, Globe, Type, Tag, AlignLeft, Loader2, List } from 'lucide-react';
 import { toast } from 'react-toastify';
 import { servicesAPI } from '../services/api';
 
+// Parse "Name, URL" lines of the multiple entry mode
+const parseLines = (text) => text
+    .split('\n')
+    .map((line) => line.trim())
+    .filter(Boolean)
+    .map((line) => {
+        const comma = line.lastIndexOf(',');
+        return comma === -1
+            ? { name: line, url: line }
+            : { name: line.slice(0, comma).trim(), url: line.slice(comma + 1).trim() };
+    });
+
 const AddServiceModal = ({ isOpen, onClose, categories, onServiceAdded }) => {
     const [loading, setLoading] = useState(false);
+    const [multiple, setMultiple] = useState(false);
+    const [lines, setLines] = useState('');
     const [formData, setFormData] = useState({
         name: '',
         url: '',
@@ -14,9 +28,53 @@ const AddServiceModal = ({ isOpen, onClose, categories, onServiceAdded }) => {
 
     if (!isOpen) return null;
 
+    const handleSubmitMultiple = async () => {
+        const entries = parseLines(lines);
+        if (entries.length === 0) {
+            toast.error('Enter one "Name, URL" per line');
+            return;
+        }
+        const invalid = entries.find((s) => !s.url.startsWith('http://') && !s.url.startsWith('https://'));
+        if (invalid) {
+            toast.error(`URL must start with http:// or https://: ${invalid.url}`);
+            return;
+        }
+
+        const categoryId = formData.category_id ? parseInt(formData.category_id) : null;
+        try {
+            setLoading(true);
+            const response = await servicesAPI.bulkCreate(entries.map((entry) => ({
+                ...entry,
+                description: formData.description || null,
+                category_id: categoryId
+            })));
+
+            const { matched, results } = response.data;
+            const rejected = results.filter((r) => r.status === 'conflict' || r.status === 'duplicate');
+            if (matched > 0) {
+                toast.success(`Added ${matched} service${matched === 1 ? '' : 's'}`);
+            }
+            rejected.forEach((r) => toast.warn(`${r.url}: ${r.detail}`));
+            onServiceAdded(null);
+            if (rejected.length === 0) {
+                handleClose();
+            }
+        } catch (error) {
+            console.error('Error adding services:', error);
+            toast.error(error.response?.data?.detail || 'Failed to add services');
+        } finally {
+            setLoading(false);
+        }
+    };
+
     const handleSubmit = async (e) => {
         e.preventDefault();
 
+        if (multiple) {
+            await handleSubmitMultiple();
+            return;
+        }
+
         // Basic validation
         if (!formData.name || !formData.url) {
             toast.error('Name and URL are required');
@@ -49,6 +107,8 @@ const AddServiceModal = ({ isOpen, onClose, categories, onServiceAdded }) => {
 
     const handleClose = () => {
         setFormData({ name: '', url: '', description: '', category_id: '' });
+        setLines('');
+        setMultiple(false);
         onClose();
     };
 
@@ -61,6 +121,15 @@ const AddServiceModal = ({ isOpen, onClose, categories, onServiceAdded }) => {
                         <Plus className="w-5 h-5 mr-2 text-cyber-cyan" />
                         Add Manual Service
                     </h2>
+                    <button
+                        type="button"
+                        onClick={() => setMultiple(!multiple)}
+                        className={`ml-auto mr-4 px-3 py-1 rounded-lg text-xs font-bold uppercase tracking-wider flex items-center border transition-all ${multiple ? 'border-cyber-cyan/60 text-cyber-cyan bg-cyber-cyan/10' : 'border-gray-600 text-gray-400 hover:text-white'}`}
+                        title="Add several services at once"
+                    >
+                        <List className="w-4 h-4 mr-1" />
+                        Multiple
+                    </button>
                     <button
                         onClick={handleClose}
                         className="text-gray-400 hover:text-white transition-colors"
@@ -71,35 +140,52 @@ const AddServiceModal = ({ isOpen, onClose, categories, onServiceAdded }) => {
 
                 {/* Form */}
                 <form onSubmit={handleSubmit} className="p-6 space-y-4">
-                    <div>
-                        <label className="block text-sm font-medium text-gray-300 mb-1.5 flex items-center">
-                            <Type className="w-4 h-4 mr-2 text-cyber-cyan" />
-                            Service Name
-                        </label>
-                        <input
-                            type="text"
-                            required
-                            className="w-full bg-cyber-darker border border-cyber-cyan/20 rounded-lg px-4 py-2.5 text-white focus:outline-none focus:border-cyber-cyan/60 transition-colors"
-                            placeholder="e.g., My Personal NAS"
-                            value={formData.name}
-                            onChange={(e) => setFormData({ ...formData, name: e.target.value })}
-                        />
-                    </div>
+                    {multiple ? (
+                        <div>
+                            <label className="block text-sm font-medium text-gray-300 mb-1.5 flex items-center">
+                                <Globe className="w-4 h-4 mr-2 text-cyber-cyan" />
+                                Services (one "Name, URL" per line)
+                            </label>
+                            <textarea
+                                className="w-full bg-cyber-darker border border-cyber-cyan/20 rounded-lg px-4 py-2.5 text-white font-mono text-sm focus:outline-none focus:border-cyber-cyan/60 transition-colors h-40 resize-none"
+                                placeholder={'My NAS, https://192.168.1.10:5001\nPrinter, http://192.168.1.20'}
+                                value={lines}
+                                onChange={(e) => setLines(e.target.value)}
+                            />
+                        </div>
+                    ) : (
+                        <>
+                            <div>
+                                <label className="block text-sm font-medium text-gray-300 mb-1.5 flex items-center">
+                                    <Type className="w-4 h-4 mr-2 text-cyber-cyan" />
+                                    Service Name
+                                </label>
+                                <input
+                                    type="text"
+                                    required
+                                    className="w-full bg-cyber-darker border border-cyber-cyan/20 rounded-lg px-4 py-2.5 text-white focus:outline-none focus:border-cyber-cyan/60 transition-colors"
+                                    placeholder="e.g., My Personal NAS"
+                                    value={formData.name}
+                                    onChange={(e) => setFormData({ ...formData, name: e.target.value })}
+                                />
+                            </div>
 
-                    <div>
-                        <label className="block text-sm font-medium text-gray-300 mb-1.5 flex items-center">
-                            <Globe className="w-4 h-4 mr-2 text-cyber-cyan" />
-                            URL
-                        </label>
-                        <input
-                            type="text"
-                            required
-                            className="w-full bg-cyber-darker border border-cyber-cyan/20 rounded-lg px-4 py-2.5 text-white focus:outline-none focus:border-cyber-cyan/60 transition-colors"
-                            placeholder="https://192.168.1.X:PORT"
-                            value={formData.url}
-                            onChange={(e) => setFormData({ ...formData, url: e.target.value })}
-                        />
-                    </div>
+                            <div>
+                                <label className="block text-sm font-medium text-gray-300 mb-1.5 flex items-center">
+                                    <Globe className="w-4 h-4 mr-2 text-cyber-cyan" />
+                                    URL
+                                </label>
+                                <input
+                                    type="text"
+                                    required
+                                    className="w-full bg-cyber-darker border border-cyber-cyan/20 rounded-lg px-4 py-2.5 text-white focus:outline-none focus:border-cyber-cyan/60 transition-colors"
+                                    placeholder="https://192.168.1.X:PORT"
+                                    value={formData.url}
+                                    onChange={(e) => setFormData({ ...formData, url: e.target.value })}
+                                />
+                            </div>
+                        </>
+                    )}
 
                     <div>
                         <label className="block text-sm font-medium text-gray-300 mb-1.5 flex items-center">
@@ -149,7 +235,7 @@ const AddServiceModal = ({ isOpen, onClose, categories, onServiceAdded }) => {
                             {loading ? (
                                 <Loader2 className="w-5 h-5 animate-spin" />
                             ) : (
-                                'Add Service'
+                                multiple ? 'Add Services' : 'Add Service'
                             )}
                         </button>
                     </div>
@@ -0,0 +1,144 @@
+import React, { useState } from 'react';
+import { X, Layers, Tag, AlignLeft, Loader2, Save } from 'lucide-react';
+import { toast } from 'react-toastify';
+import { servicesAPI } from '../services/api';
+
+const BulkEditModal = ({ isOpen, onClose, serviceIds, categories, onServicesUpdated }) => {
+    const [loading, setLoading] = useState(false);
+    const [categoryId, setCategoryId] = useState('');
+    const [description, setDescription] = useState('');
+    const [changeDescription, setChangeDescription] = useState(false);
+
+    if (!isOpen) return null;
+
+    const handleSubmit = async (e) => {
+        e.preventDefault();
+
+        const changes = {};
+        if (categoryId !== '') {
+            changes.category_id = categoryId === 'none' ? null : parseInt(categoryId);
+        }
+        if (changeDescription) {
+            changes.description = description || null;
+        }
+        if (Object.keys(changes).length === 0) {
+            toast.error('Nothing to change');
+            return;
+        }
+
+        try {
+            setLoading(true);
+            const response = await servicesAPI.bulkUpdate({ ids: serviceIds }, changes);
+            const { matched, results } = response.data;
+            const missing = results.filter((r) => r.status === 'not_found').length;
+
+            toast.success(`Updated ${matched} service${matched === 1 ? '' : 's'}`);
+            if (missing > 0) {
+                toast.warn(`${missing} service${missing === 1 ? ' was' : 's were'} no longer available`);
+            }
+            onServicesUpdated(results, changes);
+            handleClose();
+        } catch (error) {
+            console.error('Error updating services:', error);
+            toast.error(error.response?.data?.detail || 'Failed to update services');
+        } finally {
+            setLoading(false);
+        }
+    };
+
+    const handleClose = () => {
+        setCategoryId('');
+        setDescription('');
+        setChangeDescription(false);
+        onClose();
+    };
+
+    return (
+        <div className="fixed inset-0 z-50 flex items-center justify-center p-4 bg-black/70 backdrop-blur-sm animate-in fade-in duration-200">
+            <div className="relative w-full max-w-lg bg-cyber-dark border border-cyber-cyan/30 rounded-xl shadow-[0_0_30px_rgba(0,217,255,0.1)] overflow-hidden">
+                {/* Header */}
+                <div className="flex items-center justify-between p-6 border-b border-cyber-cyan/20">
+                    <h2 className="text-xl font-bold text-white flex items-center">
+                        <Layers className="w-5 h-5 mr-2 text-cyber-cyan" />
+                        Edit {serviceIds.length} Service{serviceIds.length === 1 ? '' : 's'}
+                    </h2>
+                    <button
+                        onClick={handleClose}
+                        className="text-gray-400 hover:text-white transition-colors"
+                    >
+                        <X className="w-6 h-6" />
+                    </button>
+                </div>
+
+                {/* Form */}
+                <form onSubmit={handleSubmit} className="p-6 space-y-4">
+                    <div>
+                        <label className="block text-sm font-medium text-gray-300 mb-1.5 flex items-center">
+                            <Tag className="w-4 h-4 mr-2 text-cyber-magenta" />
+                            Category
+                        </label>
+                        <select
+                            className="w-full bg-cyber-darker border border-cyber-cyan/20 rounded-lg px-4 py-2.5 text-white focus:outline-none focus:border-cyber-cyan/60 transition-colors appearance-none"
+                            value={categoryId}
+                            onChange={(e) => setCategoryId(e.target.value)}
+                        >
+                            <option value="">Keep current categories</option>
+                            <option value="none">Uncategorized</option>
+                            {categories.map((cat) => (
+                                <option key={cat.id} value={cat.id}>
+                                    {cat.name}
+                                </option>
+                            ))}
+                        </select>
+                    </div>
+
+                    <div>
+                        <label className="block text-sm font-medium text-gray-300 mb-1.5 flex items-center">
+                            <AlignLeft className="w-4 h-4 mr-2 text-gray-500" />
+                            <input
+                                type="checkbox"
+                                className="mr-2 accent-cyan-400"
+                                checked={changeDescription}
+                                onChange={(e) => setChangeDescription(e.target.checked)}
+                            />
+                            Replace description
+                        </label>
+                        <textarea
+                            disabled={!changeDescription}
+                            className="w-full bg-cyber-darker border border-cyber-cyan/20 rounded-lg px-4 py-2.5 text-white focus:outline-none focus:border-cyber-cyan/60 transition-colors h-24 resize-none disabled:opacity-40"
+                            placeholder="Leave empty to clear the descriptions"
+                            value={description}
+                            onChange={(e) => setDescription(e.target.value)}
+                        />
+                    </div>
+
+                    <div className="pt-4 flex space-x-3">
+                        <button
+                            type="button"
+                            onClick={handleClose}
+                            className="flex-1 px-4 py-2.5 border border-gray-600 rounded-lg text-gray-300 hover:bg-white/5 transition-all font-medium"
+                        >
+                            Cancel
+                        </button>
+                        <button
+                            type="submit"
+                            disabled={loading}
+                            className="flex-1 px-4 py-2.5 bg-gradient-to-r from-cyber-cyan to-cyber-blue rounded-lg text-cyber-darker font-bold hover:shadow-[0_0_15px_rgba(0,217,255,0.4)] transition-all disabled:opacity-50 flex items-center justify-center"
+                        >
+                            {loading ? (
+                                <Loader2 className="w-5 h-5 animate-spin" />
+                            ) : (
+                                <>
+                                    <Save className="w-5 h-5 mr-2" />
+                                    Apply
+                                </>
+                            )}
+                        </button>
+                    </div>
+                </form>
+            </div>
+        </div>
+    );
+};
+
+export default BulkEditModal;
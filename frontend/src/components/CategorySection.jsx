@@ -1,9 +1,13 @@
 import React, { useState } from 'react';
-import { ChevronDown, ChevronRight, Settings } from 'lucide-react';
+import { ChevronDown, ChevronRight, Settings, CheckSquare, Square } from 'lucide-react';
 import ServiceCard from './ServiceCard';
 
-const CategorySection = ({ category, services, onDeleteService, onUpdateCategory, categories, onEditCategory }) => {
+const CategorySection = ({
+    category, services, onDeleteService, onUpdateCategory, categories, onEditCategory,
+    selectedIds, onToggleSelect, onSelectAll
+}) => {
     const [isCollapsed, setIsCollapsed] = useState(false);
+    const allSelected = selectedIds && services.length > 0 && services.every((s) => selectedIds.has(s.id));
 
     if (services.length === 0 && !category.id) return null; // Hide empty default 'Uncategorized'
 
@@ -44,6 +48,20 @@ const CategorySection = ({ category, services, onDeleteService, onUpdateCategory
                     </div>
                 </div>
 
+                {/* Select all services of the category */}
+                {onSelectAll && services.length > 0 && (
+                    <button
+                        onClick={(e) => {
+                            e.stopPropagation();
+                            onSelectAll(services.map((s) => s.id), !allSelected);
+                        }}
+                        className={`p-2 mr-2 rounded-lg bg-gray-800/50 text-gray-400 hover:text-cyber-cyan hover:bg-gray-700/50 transition-all ${allSelected ? 'opacity-100 text-cyber-cyan' : 'opacity-0 group-hover:opacity-100'}`}
+                        title={allSelected ? 'Deselect all' : 'Select all'}
+                    >
+                        {allSelected ? <CheckSquare className="w-5 h-5" /> : <Square className="w-5 h-5" />}
+                    </button>
+                )}
+
                 {/* Edit Category Button */}
                 {category.id && onEditCategory && (
                     <button
@@ -69,6 +87,9 @@ const CategorySection = ({ category, services, onDeleteService, onUpdateCategory
                             onDelete={onDeleteService}
                             onUpdateCategory={onUpdateCategory}
                             categories={categories}
+                            selected={selectedIds ? selectedIds.has(service.id) : false}
+                            selectionActive={selectedIds ? selectedIds.size > 0 : false}
+                            onToggleSelect={onToggleSelect}
                         />
                     ))}
                 </div>
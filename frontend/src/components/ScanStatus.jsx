@@ -1,7 +1,7 @@
 import React from 'react';
 import { RefreshCw, Clock, CheckCircle, AlertCircle } from 'lucide-react';
 
-const ScanStatus = ({ status, onTriggerScan, loading }) => {
+const ScanStatus = ({ status, nextScan, onTriggerScan, loading }) => {
     const getStatusIcon = () => {
         switch (status?.status) {
             case 'running':
@@ -17,7 +17,16 @@ const ScanStatus = ({ status, onTriggerScan, loading }) => {
 
     const getStatusText = () => {
         if (status?.status === 'running') {
-            return 'Scanning network...';
+            const { stage, units, units_done: unitsDone } = status.progress || {};
+            if (!stage) {
+                return 'Scanning network...';
+            }
+            return units > 1
+                ? `Scanning network... (${stage}, ${unitsDone}/${units} units)`
+                : `Scanning network... (${stage})`;
+        }
+        if (status?.status === 'queued') {
+            return 'Scan queued...';
         }
         return status?.message || 'No scan running';
     };
@@ -28,11 +37,16 @@ const ScanStatus = ({ status, onTriggerScan, loading }) => {
 
             <div className="flex-1">
                 <p className="text-sm text-gray-300">{getStatusText()}</p>
+                {nextScan && status?.status !== 'running' && (
+                    <p className="text-xs text-gray-500">
+                        Next scan: {new Date(nextScan).toLocaleString()}
+                    </p>
+                )}
             </div>
 
             <button
                 onClick={onTriggerScan}
-                disabled={loading || status?.status === 'running'}
+                disabled={loading || status?.status === 'running' || status?.status === 'queued'}
                 className="btn-cyber disabled:opacity-50 disabled:cursor-not-allowed"
             >
                 {loading ? (
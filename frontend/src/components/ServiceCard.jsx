@@ -1,5 +1,5 @@
 import React, { useState } from 'react';
-import { ExternalLink, Clock, Wifi, Trash2, Edit3, X } from 'lucide-react';
+import { ExternalLink, Clock, Wifi, Trash2, Edit3, X, CheckSquare, Square, ShieldAlert } from 'lucide-react';
 
 // Helper to get domain from URL
 const getDomain = (url) => {
@@ -10,6 +10,13 @@ const getDomain = (url) => {
     }
 };
 
+// Days until the TLS certificate expires (timestamps are UTC without offset)
+const CERT_WARNING_DAYS = 30;
+const getCertDaysLeft = (expiresAt) => {
+    if (!expiresAt) return null;
+    return Math.floor((new Date(`${expiresAt}Z`) - Date.now()) / 86400000);
+};
+
 // Helper to get a search-friendly name
 const getSearchName = (name) => {
     return name.toLowerCase()
@@ -77,12 +84,18 @@ const ServiceIcon = ({ service }) => {
     );
 };
 
-const ServiceCard = ({ service, onDelete, onUpdateCategory, categories }) => {
+const ServiceCard = ({ service, onDelete, onUpdateCategory, categories, selected, selectionActive, onToggleSelect }) => {
     const [showConfirm, setShowConfirm] = useState(false);
     const [showCategoryPicker, setShowCategoryPicker] = useState(false);
+    const certDaysLeft = getCertDaysLeft(service.cert_expires_at);
 
     const handleClick = (e) => {
         if (showConfirm || showCategoryPicker) return;
+        // While services are being selected, a click toggles instead of opening
+        if (selectionActive && onToggleSelect) {
+            onToggleSelect(service.id);
+            return;
+        }
         window.open(service.url, '_blank', 'noopener,noreferrer');
     };
 
@@ -104,6 +117,13 @@ const ServiceCard = ({ service, onDelete, onUpdateCategory, categories }) => {
         setShowConfirm(false);
     };
 
+    const handleSelectClick = (e) => {
+        e.stopPropagation();
+        if (onToggleSelect) {
+            onToggleSelect(service.id);
+        }
+    };
+
     const handleEditClick = (e) => {
         e.stopPropagation();
         setShowCategoryPicker(true);
@@ -174,7 +194,7 @@ const ServiceCard = ({ service, onDelete, onUpdateCategory, categories }) => {
 
             <div
                 onClick={handleClick}
-                className="cyber-card cursor-pointer group relative overflow-hidden min-h-[180px] flex flex-col"
+                className={`cyber-card cursor-pointer group relative overflow-hidden min-h-[180px] flex flex-col ${selected ? 'ring-2 ring-cyber-cyan' : ''}`}
             >
                 {/* Delete confirmation overlay */}
                 {showConfirm && (
@@ -199,6 +219,19 @@ const ServiceCard = ({ service, onDelete, onUpdateCategory, categories }) => {
 
                 {/* Action buttons - bottom right */}
                 <div className="absolute bottom-3 right-3 z-10 flex space-x-1 opacity-0 group-hover:opacity-100 transition-all">
+                    {onToggleSelect && (
+                        <button
+                            onClick={handleSelectClick}
+                            className="p-1.5 rounded-lg bg-cyan-500/20 hover:bg-cyan-500/40"
+                            title={selected ? 'Deselect' : 'Select'}
+                        >
+                            {selected ? (
+                                <CheckSquare className="w-4 h-4 text-cyan-400 hover:text-cyan-300" />
+                            ) : (
+                                <Square className="w-4 h-4 text-cyan-400 hover:text-cyan-300" />
+                            )}
+                        </button>
+                    )}
                     <button
                         onClick={handleEditClick}
                         className="p-1.5 rounded-lg bg-blue-500/20 hover:bg-blue-500/40"
@@ -255,11 +288,30 @@ const ServiceCard = ({ service, onDelete, onUpdateCategory, categories }) => {
                         </div>
                     )}
                     {service.ip_address && (
-                        <span className="font-mono">{service.ip_address}:{service.port}</span>
+                        <span className="font-mono truncate" title={service.ip_address}>
+                            {service.hostname || service.ip_address}:{service.port}
+                        </span>
                     )}
                     {service.protocol && (
                         <span className="uppercase text-cyber-cyan">{service.protocol}</span>
                     )}
+                    {service.version && (
+                        <span className="font-mono truncate" title={service.version}>{service.version}</span>
+                    )}
+                    {certDaysLeft !== null && certDaysLeft <= CERT_WARNING_DAYS && (
+                        <span
+                            className={`flex items-center space-x-1 whitespace-nowrap ${certDaysLeft < 0 ? 'text-red-400' : 'text-yellow-400'}`}
+                            title={`Certificate expires ${service.cert_expires_at} UTC`}
+                        >
+                            <ShieldAlert className="w-3 h-3" />
+                            <span>{certDaysLeft < 0 ? 'cert expired' : `cert ${certDaysLeft}d`}</span>
+                        </span>
+                    )}
+                    {service.aliases?.length > 0 && (
+                        <span className="whitespace-nowrap" title={service.aliases.join('\n')}>
+                            +{service.aliases.length} alias{service.aliases.length === 1 ? '' : 'es'}
+                        </span>
+                    )}
                 </div>
 
                 {/* Hover effect overlay */}
@@ -1,47 +1,60 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { toast, ToastContainer } from 'react-toastify';
 import 'react-toastify/dist/ReactToastify.css';
-import { Loader2, Plus, FolderPlus } from 'lucide-react';
+import { Loader2, Plus, FolderPlus, Layers, EyeOff, X } from 'lucide-react';
 
-import { servicesAPI, categoriesAPI, scannerAPI } from '../services/api';
+import { servicesAPI, scannerAPI, dashboardAPI } from '../services/api';
 import SearchBar from '../components/SearchBar';
 import CategorySection from '../components/CategorySection';
 import ScanStatus from '../components/ScanStatus';
 import AddServiceModal from '../components/AddServiceModal';
 import AddCategoryModal from '../components/AddCategoryModal';
 import EditCategoryModal from '../components/EditCategoryModal';
+import BulkEditModal from '../components/BulkEditModal';
 
 const NeonDeck = () => {
     const [services, setServices] = useState([]);
     const [categories, setCategories] = useState([]);
     const [searchTerm, setSearchTerm] = useState('');
     const [scanStatus, setScanStatus] = useState(null);
+    const [nextScan, setNextScan] = useState(null);
     const [loading, setLoading] = useState(true);
     const [scanLoading, setScanLoading] = useState(false);
     const [isAddModalOpen, setIsAddModalOpen] = useState(false);
     const [isCategoryModalOpen, setIsCategoryModalOpen] = useState(false);
     const [editingCategory, setEditingCategory] = useState(null);
+    const [selectedIds, setSelectedIds] = useState(new Set());
+    const [isBulkEditOpen, setIsBulkEditOpen] = useState(false);
+    const [bulkLoading, setBulkLoading] = useState(false);
+    // Change feed position of the services shown
+    const changesToken = useRef(null);
 
     // Fetch initial data
     useEffect(() => {
         fetchData();
-        fetchScanStatus();
 
-        // Poll scan status every 10 seconds
-        const interval = setInterval(fetchScanStatus, 10000);
+        // Poll scan status and service changes every 10 seconds
+        const interval = setInterval(() => {
+            fetchScanStatus();
+            fetchChanges();
+        }, 10000);
         return () => clearInterval(interval);
     }, []);
 
     const fetchData = async () => {
         try {
             setLoading(true);
-            const [servicesRes, categoriesRes] = await Promise.all([
-                servicesAPI.getAll(),
-                categoriesAPI.getAll()
-            ]);
+            // One round trip: the browser revalidates it with its ETag
+            const { data } = await dashboardAPI.get();
 
-            setServices(servicesRes.data);
-            setCategories(categoriesRes.data);
+            setServices([
+                ...data.categories.flatMap((category) => category.services),
+                ...data.uncategorized
+            ]);
+            setCategories(data.categories.map(({ services, ...category }) => category));
+            setScanStatus(data.scan);
+            setNextScan(data.scheduler.next_run);
+            changesToken.current = data.changes_token;
         } catch (error) {
             console.error('Error fetching data:', error);
             toast.error('Failed to load services');
@@ -50,6 +63,33 @@ const NeonDeck = () => {
         }
     };
 
+    // Only the services changed since the last load or poll
+    const fetchChanges = async () => {
+        let token = changesToken.current;
+        if (!token) {
+            return;
+        }
+        try {
+            let hasMore = true;
+            while (hasMore) {
+                const { data } = await servicesAPI.changes(token);
+                if (data.services.length || data.deleted.length) {
+                    setServices((current) => {
+                        const byId = new Map(current.map((s) => [s.id, s]));
+                        data.deleted.forEach((id) => byId.delete(id));
+                        data.services.forEach((s) => byId.set(s.id, s));
+                        return [...byId.values()];
+                    });
+                }
+                token = data.token;
+                hasMore = data.has_more;
+            }
+            changesToken.current = token;
+        } catch (error) {
+            console.error('Error fetching service changes:', error);
+        }
+    };
+
     const fetchScanStatus = async () => {
         try {
             const res = await scannerAPI.getStatus();
@@ -102,6 +142,45 @@ const NeonDeck = () => {
         }
     };
 
+    const handleToggleSelect = (serviceId) => {
+        const next = new Set(selectedIds);
+        if (next.has(serviceId)) {
+            next.delete(serviceId);
+        } else {
+            next.add(serviceId);
+        }
+        setSelectedIds(next);
+    };
+
+    const handleSelectAll = (serviceIds, select) => {
+        const next = new Set(selectedIds);
+        serviceIds.forEach((id) => (select ? next.add(id) : next.delete(id)));
+        setSelectedIds(next);
+    };
+
+    const handleBulkHide = async () => {
+        try {
+            setBulkLoading(true);
+            const res = await servicesAPI.bulkHide({ ids: [...selectedIds] });
+            const hidden = new Set(res.data.results.filter((r) => r.status === 'hidden').map((r) => r.id));
+            setServices(services.filter(s => !hidden.has(s.id)));
+            setSelectedIds(new Set());
+            toast.success(`Deleted ${hidden.size} service${hidden.size === 1 ? '' : 's'}`);
+        } catch (error) {
+            console.error('Error deleting services:', error);
+            toast.error('Error deleting services');
+        } finally {
+            setBulkLoading(false);
+        }
+    };
+
+    const handleBulkUpdated = (results, changes) => {
+        const updated = new Set(results.filter((r) => r.status === 'updated').map((r) => r.id));
+        setServices(services.map(s => (updated.has(s.id) ? { ...s, ...changes } : s)));
+        setSelectedIds(new Set());
+        fetchData(); // Refresh category names and service counts
+    };
+
     // Filter services by search term
     const filteredServices = services.filter((service) => {
         if (!searchTerm) return true;
@@ -157,6 +236,7 @@ const NeonDeck = () => {
                     <div className="flex-grow">
                         <ScanStatus
                             status={scanStatus}
+                            nextScan={nextScan}
                             onTriggerScan={handleTriggerScan}
                             loading={scanLoading}
                         />
@@ -189,6 +269,39 @@ const NeonDeck = () => {
 
 
 
+                {/* Bulk actions for the selected services */}
+                {selectedIds.size > 0 && (
+                    <div className="sticky top-4 z-40 mb-6 flex items-center justify-between px-6 py-3 bg-cyber-dark/95 border border-cyber-cyan/40 rounded-xl shadow-[0_0_20px_rgba(0,217,255,0.15)]">
+                        <span className="text-cyber-cyan font-bold">
+                            {selectedIds.size} selected
+                        </span>
+                        <div className="flex items-center space-x-3">
+                            <button
+                                onClick={() => setIsBulkEditOpen(true)}
+                                className="px-4 py-2 border border-cyber-cyan/30 rounded-lg text-cyber-cyan font-medium hover:bg-cyber-cyan/10 transition-all flex items-center space-x-2"
+                            >
+                                <Layers className="w-4 h-4" />
+                                <span>Edit</span>
+                            </button>
+                            <button
+                                onClick={handleBulkHide}
+                                disabled={bulkLoading}
+                                className="px-4 py-2 border border-red-500/30 rounded-lg text-red-400 font-medium hover:bg-red-500/10 transition-all flex items-center space-x-2 disabled:opacity-50"
+                            >
+                                {bulkLoading ? <Loader2 className="w-4 h-4 animate-spin" /> : <EyeOff className="w-4 h-4" />}
+                                <span>Delete</span>
+                            </button>
+                            <button
+                                onClick={() => setSelectedIds(new Set())}
+                                className="p-2 text-gray-400 hover:text-white transition-colors"
+                                title="Clear selection"
+                            >
+                                <X className="w-5 h-5" />
+                            </button>
+                        </div>
+                    </div>
+                )}
+
                 {/* Services by Category */}
                 <div className="cyber-scrollbar">
                     {servicesByCategory.map((category) => (
@@ -200,6 +313,9 @@ const NeonDeck = () => {
                             onUpdateCategory={handleUpdateCategory}
                             categories={categories}
                             onEditCategory={(cat) => setEditingCategory(cat)}
+                            selectedIds={selectedIds}
+                            onToggleSelect={handleToggleSelect}
+                            onSelectAll={handleSelectAll}
                         />
                     ))}
 
@@ -211,6 +327,9 @@ const NeonDeck = () => {
                             onDeleteService={handleDeleteService}
                             onUpdateCategory={handleUpdateCategory}
                             categories={categories}
+                            selectedIds={selectedIds}
+                            onToggleSelect={handleToggleSelect}
+                            onSelectAll={handleSelectAll}
                         />
                     )}
 
@@ -230,7 +349,9 @@ const NeonDeck = () => {
                     onClose={() => setIsAddModalOpen(false)}
                     categories={categories}
                     onServiceAdded={(newService) => {
-                        setServices([...services, newService]);
+                        if (newService) {
+                            setServices([...services, newService]);
+                        }
                         // Optional: trigger refresh to ensure counts are right
                         fetchData();
                     }}
@@ -243,6 +364,13 @@ const NeonDeck = () => {
                         fetchData(); // Refresh to ensure service counts and sorting are correct
                     }}
                 />
+                <BulkEditModal
+                    isOpen={isBulkEditOpen}
+                    onClose={() => setIsBulkEditOpen(false)}
+                    serviceIds={[...selectedIds]}
+                    categories={categories}
+                    onServicesUpdated={handleBulkUpdated}
+                />
                 <EditCategoryModal
                     isOpen={!!editingCategory}
                     category={editingCategory}
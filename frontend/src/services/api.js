@@ -16,6 +16,12 @@ export const servicesAPI = {
     create: (data) => api.post('/services', data),
     update: (id, data) => api.patch(`/services/${id}`, data),
     delete: (id) => api.delete(`/services/${id}`),
+    // Bulk operations: selection is { ids: [...] } and/or { filter: { category_id, uncategorized, status, search } }
+    bulkCreate: (services) => api.post('/services/bulk', { services }),
+    bulkUpdate: (selection, changes) => api.patch('/services/bulk', { ...selection, changes }),
+    bulkHide: (selection) => api.post('/services/bulk/hide', selection),
+    // Rows created, updated or hidden (ids in `deleted`) since the token of a dashboard or changes response
+    changes: (since, limit = 1000) => api.get('/services/changes', { params: { since, limit } }),
 };
 
 // Categories API
@@ -26,6 +32,11 @@ export const categoriesAPI = {
     delete: (id) => api.delete(`/categories/${id}`),
 };
 
+// Dashboard API: categories with their services, scan status and next scheduled scan in one request
+export const dashboardAPI = {
+    get: () => api.get('/dashboard'),
+};
+
 // Scanner API
 export const scannerAPI = {
     trigger: () => api.post('/scan/trigger'),